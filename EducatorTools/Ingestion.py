@@ -0,0 +1,645 @@
+import hashlib
+import json
+import os
+import re
+import signal
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from multiprocessing import get_context
+from threading import Lock
+from PyPDF2 import PdfReader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from Tokens import get_encoder
+from CsvTable import load_table, register_table, table_for
+from DocxReader import iter_docx_blocks
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+
+# Bump whenever extraction changes so stale disk entries are not served
+EXTRACTOR_VERSION = 9
+
+CHUNK_TOKENS = 250
+CHUNK_OVERLAP_TOKENS = 50
+
+# PDFs with more pages than this are extracted in a process pool
+PARALLEL_MIN_PAGES = 40
+PAGES_PER_TASK = 16
+PAGE_TIMEOUT = 20  # seconds allowed per page before a page range is given up on
+EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Pages with less text than this but with images are treated as scans and OCR'd
+OCR_MIN_CHARS = 16
+OCR_TIMEOUT = 60  # seconds allowed per page
+OCR_LOOKAHEAD = 2 * EXTRACT_WORKERS  # scanned pages OCR'd ahead of the page being yielded
+MAX_CACHED_OCR_PAGES = 512
+
+
+class IngestedDocument:
+    """Everything extracted from one uploaded file: text per page, full text, chunks and metadata."""
+
+    def __init__(self, sha256, name, kind, pages, chunks, metadata):
+        self.sha256 = sha256
+        self.name = name
+        self.kind = kind
+        self.pages = pages
+        self.chunks = chunks
+        self.metadata = metadata
+        self.text = "\n".join(page for page in pages if page)
+
+    def to_json(self):
+        return json.dumps({
+            "sha256": self.sha256, "name": self.name, "kind": self.kind,
+            "pages": self.pages, "chunks": self.chunks, "metadata": self.metadata,
+        })
+
+    @classmethod
+    def from_json(cls, payload):
+        return cls(**json.loads(payload))
+
+    def size(self):
+        return len(self.text) + sum(len(chunk) for chunk in self.chunks)
+
+
+def file_kind(name):
+    return os.path.splitext(name)[1].lower().lstrip(".")
+
+
+_pool = None
+_pool_lock = Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the Streamlit server process is multi-threaded
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def _recycle_pool(pool):
+    """
+    Retires a pool with a worker stuck past its deadline, since a running task cannot be
+    cancelled. Later work gets a fresh pool; the old workers are terminated, so anything
+    still waiting on them fails with BrokenProcessPool (see _range_pages).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    print("Restarting the extraction pool to free a stuck worker.")
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _PageTimeout(Exception):
+    pass
+
+
+def _page_alarm(signum, frame):
+    raise _PageTimeout()
+
+
+def _extract_page(reader, index):
+    """Text of one page; where timers are available (POSIX), a page over PAGE_TIMEOUT comes back empty."""
+    if not hasattr(signal, "setitimer"):
+        return reader.pages[index].extract_text() or ""
+    previous = signal.signal(signal.SIGALRM, _page_alarm)
+    signal.setitimer(signal.ITIMER_REAL, PAGE_TIMEOUT)
+    try:
+        return reader.pages[index].extract_text() or ""
+    except _PageTimeout:
+        print(f"PDF page {index + 1} timed out and was skipped.")
+        return ""
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_pdf_range(path, start, stop):
+    """Runs in a worker process: text of pages [start, stop) of the PDF at `path`."""
+    reader = PdfReader(path)
+    return [_extract_page(reader, index) for index in range(start, stop)]
+
+
+def _range_pages(pool, future, path, start, stop, deadline, retry=True):
+    """The pages of one range once its future resolves, or empty pages if it misses `deadline` or fails."""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        print(f"PDF pages {start + 1}-{stop} timed out and were skipped.")
+        # Still queued means the pool is busy; still running past the deadline means a stuck worker
+        if future.running():
+            _recycle_pool(pool)
+    except BrokenProcessPool:
+        if retry:
+            # The pool was retired for another range's stuck worker; run this range on the new one
+            pool = _get_pool()
+            future = pool.submit(_extract_pdf_range, path, start, stop)
+            deadline = time.monotonic() + PAGE_TIMEOUT * (stop - start + 1)
+            return _range_pages(pool, future, path, start, stop, deadline, retry=False)
+        print(f"PDF pages {start + 1}-{stop} could not be extracted: the worker pool failed.")
+    except Exception as e:
+        print(f"PDF pages {start + 1}-{stop} could not be extracted: {e}")
+    return [""] * (stop - start)
+
+
+def iter_pdf_pages(data):
+    """
+    Yields the text of every page of a PDF, in order, as soon as it is available.
+
+    Large PDFs are split into page ranges that a process pool extracts in parallel.
+    In the workers each page gets PAGE_TIMEOUT and comes back empty if it runs over, so one
+    pathological page cannot block the whole upload. Each range also has a deadline counted
+    from submission; a range still running past it has its pool restarted (see _range_pages).
+    Pages without a text layer (scans) are OCR'd when available, see ocr_blank_pages.
+    """
+    reader = PdfReader(BytesIO(data))
+    yield from ocr_blank_pages(reader, _iter_pdf_text(reader, data))
+
+
+def _iter_pdf_text(reader, data):
+    page_count = len(reader.pages)
+    if page_count < PARALLEL_MIN_PAGES or EXTRACT_WORKERS < 2:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    # Workers read the PDF from disk rather than receiving a copy of the bytes per task
+    handle = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        handle.write(data)
+        handle.close()
+        pool = _get_pool()
+        ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+        submitted = time.monotonic()
+        futures = [pool.submit(_extract_pdf_range, handle.name, start, stop) for start, stop in ranges]
+        try:
+            for (start, stop), future in zip(ranges, futures):
+                # Its own pages, the earlier pages sharing the workers, and one page of slack
+                # so the in-worker page timeout fires first
+                deadline = submitted + PAGE_TIMEOUT * (stop - start + start / EXTRACT_WORKERS + 1)
+                yield from _range_pages(pool, future, handle.name, start, stop, deadline)
+        finally:
+            for future in futures:
+                future.cancel()
+    finally:
+        os.unlink(handle.name)
+
+
+# ------------------ OCR ------------------
+_ocr_cache = OrderedDict()
+_ocr_lock = Lock()
+_ocr_available = None
+
+
+def ocr_available():
+    """True if pytesseract and the tesseract binary are installed (checked once per process)."""
+    global _ocr_available
+    if _ocr_available is None:
+        if pytesseract is None:
+            _ocr_available = False
+        else:
+            try:
+                pytesseract.get_tesseract_version()
+                _ocr_available = True
+            except Exception as e:
+                print(f"OCR disabled, tesseract is not usable: {e}")
+                _ocr_available = False
+    return _ocr_available
+
+
+def _ocr_images(images):
+    """Runs in a worker process: OCR text of a page's images, in the order they are drawn."""
+    texts = [pytesseract.image_to_string(Image.open(BytesIO(data))).strip() for data in images]
+    return "\n".join(text for text in texts if text)
+
+
+def _page_images(page):
+    try:
+        return [image.data for image in page.images]
+    except Exception as e:
+        print(f"Could not read the images of a PDF page: {e}")
+        return []
+
+
+def _start_ocr(page):
+    """Returns the page's OCR text if cached, else (page hash, future) for the OCR job."""
+    images = _page_images(page)
+    if not images:
+        return ""
+    digest = hashlib.sha256()
+    for data in images:
+        digest.update(data)
+    key = digest.hexdigest()
+    with _ocr_lock:
+        text = _ocr_cache.get(key)
+        if text is not None:
+            _ocr_cache.move_to_end(key)
+            return text
+    pool = _get_pool()
+    return key, pool, pool.submit(_ocr_images, images)
+
+
+def _finish_ocr(job):
+    if isinstance(job, str):
+        return job
+    key, pool, future = job
+    try:
+        text = future.result(timeout=OCR_TIMEOUT)
+    except FutureTimeoutError:
+        if not future.cancel():
+            _recycle_pool(pool)
+        print("OCR of a scanned PDF page timed out and it was skipped.")
+        return ""
+    except Exception as e:
+        print(f"OCR of a scanned PDF page failed: {e}")
+        return ""
+    with _ocr_lock:
+        _ocr_cache[key] = text
+        while len(_ocr_cache) > MAX_CACHED_OCR_PAGES:
+            _ocr_cache.popitem(last=False)
+    return text
+
+
+def ocr_blank_pages(reader, texts):
+    """
+    Replaces the text of image-only pages with OCR output, keeping page order.
+
+    The page images are OCR'd in the process pool, up to OCR_LOOKAHEAD pages ahead,
+    and the results are cached by a hash of the images, so a scan uploaded again
+    (even inside another file) is not OCR'd twice. Without OCR, pages pass through.
+    """
+    pending = deque()
+    for index, text in enumerate(texts):
+        if len(text.strip()) < OCR_MIN_CHARS and ocr_available():
+            ocr = _start_ocr(reader.pages[index])
+            pending.append((text, ocr))
+        else:
+            pending.append((text, None))
+        while pending and (pending[0][1] is None or isinstance(pending[0][1], str) or len(pending) > OCR_LOOKAHEAD):
+            text, ocr = pending.popleft()
+            yield (_finish_ocr(ocr) or text) if ocr is not None else text
+    while pending:
+        text, ocr = pending.popleft()
+        yield (_finish_ocr(ocr) or text) if ocr is not None else text
+
+
+def read_docx(data):
+    """
+    Yields a DOCX file one section at a time: a new section starts at every heading,
+    so chunks and retrieved passages stay aligned with the document's structure.
+    Headers and footers come first and last, once each.
+    """
+    section = []
+    for block in iter_docx_blocks(data):
+        if block.kind in ("heading", "header", "footer") and section:
+            yield "\n".join(section)
+            section = []
+        section.append(block.text)
+        if block.kind in ("header", "footer"):
+            yield "\n".join(section)
+            section = []
+    if section:
+        yield "\n".join(section)
+
+
+def read_csv(data):
+    """A CSV small enough for a prompt is kept whole; a larger one becomes its profile (see CsvTable)."""
+    table = load_table(data)
+    yield table.inline() or table.describe()
+
+
+def read_text(data):
+    yield data.decode("utf-8", errors="replace")
+
+
+# Reader per file type: bytes -> iterator of page texts
+READERS = {
+    "pdf": iter_pdf_pages,
+    "docx": read_docx,
+    "csv": read_csv,
+}
+
+
+def iter_pages(data, kind):
+    """Yields the text of a file page by page (PDF pages, DOCX sections)."""
+    return READERS.get(kind, read_text)(data)
+
+
+# ------------------ Page stages ------------------
+def normalize_whitespace(pages):
+    """Collapses runs of spaces, rejoins words hyphenated across lines and drops extra blank lines."""
+    for page in pages:
+        page = page.replace("\r\n", "\n").replace("\r", "\n")
+        page = re.sub(r"[ \t\f\v]+", " ", page)
+        page = re.sub(r"(\w)-\n(\w)", r"\1\2", page)
+        page = re.sub(r" ?\n ?", "\n", page)
+        page = re.sub(r"\n{3,}", "\n\n", page)
+        yield page.strip()
+
+
+def strip_headers_footers(pages, sample=8, min_share=0.6):
+    """
+    Opt-in PDF stage that drops running headers and footers: a page's top or bottom line
+    that repeats exactly on most of the first `sample` pages. Lines that differ only by a
+    number ("Question 1", "Week 2") are different lines and are kept. Only the sampled
+    pages are held back to decide.
+    """
+    pages = iter(pages)
+    held = []
+    for page in pages:
+        held.append(page)
+        if len(held) == sample:
+            break
+    repeated = set()
+    if len(held) >= 3:
+        edges = {}
+        for page in held:
+            lines = [line.strip() for line in page.split("\n") if line.strip()]
+            for line in {lines[0], lines[-1]} if lines else ():
+                edges[line] = edges.get(line, 0) + 1
+        repeated = {line for line, count in edges.items() if count >= min_share * len(held)}
+
+    def strip(page):
+        lines = page.split("\n")
+        if lines and lines[0].strip() in repeated:
+            lines = lines[1:]
+        if lines and lines[-1].strip() in repeated:
+            lines = lines[:-1]
+        return "\n".join(lines)
+
+    for page in held:
+        yield strip(page)
+    for page in pages:
+        yield strip(page)
+
+
+# Only PDF pages have running headers and footers; DOCX sections start at headings
+strip_headers_footers.kinds = ("pdf",)
+
+
+# ------------------ Chunking ------------------
+def token_splitter(chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Text splitter measuring chunks in tokens (about 4 characters per token without tiktoken)."""
+    encoder = get_encoder()
+    if encoder is None:
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_tokens * 4, chunk_overlap=overlap_tokens * 4)
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+        length_function=lambda text: len(encoder.encode(text, disallowed_special=()))
+    )
+
+
+def chunk_by_tokens(pages, window=8000):
+    """
+    Splits a stream of pages into token-sized chunks while the pages are still arriving.
+    At most `window` characters are held at once. The last chunk of each window is held
+    back and re-split with the following text, so chunks across page boundaries match
+    what splitting the whole text would give.
+    """
+    splitter = token_splitter()
+    buffer = ""
+    for page in pages:
+        if not page:
+            continue
+        buffer = f"{buffer}\n{page}" if buffer else page
+        if len(buffer) >= window:
+            chunks = splitter.split_text(buffer)
+            yield from chunks[:-1]
+            buffer = chunks[-1]
+    if buffer:
+        yield from splitter.split_text(buffer)
+
+
+class IngestionPipeline:
+    """
+    Generator chain run over one upload: reader → page stages → chunker → chunk stages.
+
+    Every stage takes an iterator and returns one, so each page is cleaned and chunked
+    as soon as the reader yields it, while later pages are still being extracted.
+    Peak memory is not bounded by the chunk window: the upload's bytes are read whole,
+    and every page and chunk is kept because callers use IngestedDocument.text and
+    .chunks, so memory grows with the document.
+
+    Page stages clean text (see normalize_whitespace; the opt-in strip_headers_footers);
+    a stage with a `kinds` attribute only runs on those file types. Chunk stages see each chunk as it is produced (e.g. to feed a DocumentIndex).
+    Time spent in each stage is reported separately.
+    """
+
+    def __init__(self, page_stages=(normalize_whitespace,),
+                 chunker=chunk_by_tokens, chunk_stages=()):
+        self.page_stages = tuple(page_stages)
+        self.chunker = chunker
+        self.chunk_stages = tuple(chunk_stages)
+
+    @property
+    def signature(self):
+        """Identifies what the pipeline produces; chunk stages only observe, so they are left out."""
+        return ",".join(stage.__name__ for stage in self.page_stages + (self.chunker,))
+
+    def with_chunk_stage(self, stage):
+        return IngestionPipeline(self.page_stages, self.chunker, self.chunk_stages + (stage,))
+
+    def run(self, data, kind):
+        """Returns (pages, chunks, stage_seconds)."""
+        inclusive = {}
+
+        def timed(name, iterator):
+            # Registered up front so stages are listed upstream first
+            inclusive[name] = 0.0
+
+            def measure():
+                while True:
+                    start_time = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        inclusive[name] += time.perf_counter() - start_time
+                    yield item
+            return measure()
+
+        pages = []
+
+        def collect(stream):
+            for page in stream:
+                pages.append(page)
+                yield page
+
+        stream = timed(f"read_{kind}", iter(iter_pages(data, kind)))
+        for stage in self.page_stages:
+            if kind in getattr(stage, "kinds", (kind,)):
+                stream = timed(stage.__name__, iter(stage(stream)))
+        stream = timed(self.chunker.__name__, iter(self.chunker(collect(stream))))
+        for stage in self.chunk_stages:
+            stream = timed(getattr(stage, "__name__", "chunk_stage"), iter(stage(stream)))
+        chunks = list(stream)
+
+        # Each stage's clock also ran while it waited on the stage before it
+        stage_seconds = {}
+        previous = 0.0
+        for name, seconds in inclusive.items():
+            stage_seconds[name] = round(max(0.0, seconds - previous), 4)
+            previous = seconds
+        return pages, chunks, stage_seconds
+
+
+class IngestionCache:
+    """
+    Extracted documents keyed by the SHA-256 of the uploaded bytes.
+
+    Memory tier: LRU bounded by entry count and total characters.
+    Disk tier (optional): SQLite file bounded by total size, least recently used rows go first;
+    it lets every app on the machine reuse an extraction, not just the current process.
+    """
+
+    def __init__(self, max_entries=32, max_chars=64 * 1024 * 1024, db_path=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.max_disk_bytes = max_disk_bytes
+
+        self._entries = OrderedDict()  # key -> IngestedDocument
+        self._chars = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "key TEXT PRIMARY KEY, payload TEXT, size INTEGER, last_used REAL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            document = self._entries.get(key)
+            if document is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return document
+
+            if self._db is not None:
+                row = self._db.execute("SELECT payload FROM documents WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE documents SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    document = IngestedDocument.from_json(row[0])
+                    self._store(key, document)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return document
+
+            self.misses += 1
+            return None
+
+    def set(self, key, document):
+        with self._lock:
+            self._store(key, document)
+            if self._db is not None:
+                payload = document.to_json()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO documents (key, payload, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, payload, len(payload), time.time())
+                )
+                self._evict_disk()
+                self._db.commit()
+
+    def _store(self, key, document):
+        size = document.size()
+        if size > self.max_chars:
+            return
+        if key in self._entries:
+            self._chars -= self._entries.pop(key).size()
+        self._entries[key] = document
+        self._chars += size
+        while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+            _, oldest = self._entries.popitem(last=False)
+            self._chars -= oldest.size()
+
+    def _evict_disk(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM documents ORDER BY last_used").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM documents WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "chars": self._chars,
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = Lock()
+
+
+def get_ingestion_cache():
+    """
+    Process-wide document cache. Set DOCUMENT_CACHE_PATH to a SQLite file to share
+    extractions across restarts and between apps.
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            db_path = os.getenv("DOCUMENT_CACHE_PATH")
+            _shared_cache = IngestionCache(db_path=os.path.expanduser(db_path) if db_path else None)
+        return _shared_cache
+
+
+def ingest(uploaded_file, kind=None, pipeline=None):
+    """
+    Extracts an uploaded file (anything with .name and .getvalue()) once per distinct content.
+    Streamlit reruns and other apps given the same bytes get the cached result back.
+    """
+    pipeline = pipeline or IngestionPipeline()
+    data = uploaded_file.getvalue()
+    kind = kind or file_kind(uploaded_file.name)
+    sha256 = hashlib.sha256(data).hexdigest()
+    # PDFs extracted without OCR are redone once OCR becomes available
+    ocr = ":ocr" if kind == "pdf" and ocr_available() else ""
+    key = f"{sha256}:{kind}:{EXTRACTOR_VERSION}:{pipeline.signature}{ocr}"
+
+    cache = get_ingestion_cache()
+    document = cache.get(key)
+    if document is None:
+        pages, chunks, stage_seconds = pipeline.run(data, kind)
+        metadata = {
+            "bytes": len(data),
+            "pages": len(pages),
+            "chunks": len(chunks),
+            "stage_seconds": stage_seconds,
+        }
+        document = IngestedDocument(sha256, uploaded_file.name, kind, pages, chunks, metadata)
+        metadata["characters"] = len(document.text)
+        print(f"Ingested {uploaded_file.name}: {metadata}")
+        cache.set(key, document)
+
+    if kind == "csv" and table_for(document.text) is None:
+        register_table(document.text, load_table(data))
+    return document
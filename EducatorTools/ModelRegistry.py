@@ -0,0 +1,132 @@
+import httpx
+from threading import Lock
+from langchain_openai import ChatOpenAI
+from langchain_anthropic import ChatAnthropic
+
+# Connection pool shared by every OpenAI chat model in the process
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+REQUEST_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+class PoolStats:
+    """Counts requests going through a pooled transport (in flight until the response headers arrive)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_connections": POOL_LIMITS.max_connections,
+                "utilization": self.in_flight / POOL_LIMITS.max_connections,
+            }
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        self.stats.started()
+        try:
+            return super().handle_request(request)
+        finally:
+            self.stats.finished()
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        self.stats.started()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self.stats.finished()
+
+
+_lock = Lock()
+_models = {}
+_model_uses = {}
+_sync_stats = PoolStats()
+_async_stats = PoolStats()
+_http_client = None
+_http_async_client = None
+
+
+def _openai_http_clients():
+    global _http_client, _http_async_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            transport=_CountingTransport(_sync_stats, limits=POOL_LIMITS),
+            timeout=REQUEST_TIMEOUT
+        )
+        # Only ever used from the shared ModelManager event loop
+        _http_async_client = httpx.AsyncClient(
+            transport=_AsyncCountingTransport(_async_stats, limits=POOL_LIMITS),
+            timeout=REQUEST_TIMEOUT
+        )
+    return _http_client, _http_async_client
+
+
+def get_chat_model(config):
+    """
+    Returns the process-wide chat model for a provider/model/temperature, creating it on first use.
+    OpenAI models share one pooled HTTP transport; langchain_anthropic already keeps one
+    cached httpx client per process, so Claude models only need the instance shared.
+    """
+    provider = config.get("provider")
+    model_name = config.get("model_name")
+    temperature = config.get("temperature", 0.7)
+    key = (provider, model_name, temperature)
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            if provider == "OpenAI":
+                http_client, http_async_client = _openai_http_clients()
+                model = ChatOpenAI(
+                    model=model_name,
+                    temperature=temperature,
+                    stream_usage=True,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+            elif provider == "Claude":
+                model = ChatAnthropic(model=model_name, temperature=temperature)
+            else:
+                raise ValueError(f"Unsupported provider: {provider}")
+            _models[key] = model
+        _model_uses[key] = _model_uses.get(key, 0) + 1
+        return model
+
+
+def pool_stats():
+    """Shared model instances with how often each was handed out, plus OpenAI pool usage."""
+    with _lock:
+        models = {f"{provider}:{model_name}@{temperature}": uses
+                  for (provider, model_name, temperature), uses in _model_uses.items()}
+    return {
+        "models": models,
+        "openai_sync_pool": _sync_stats.snapshot(),
+        "openai_async_pool": _async_stats.snapshot(),
+    }
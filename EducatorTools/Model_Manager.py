@@ -1,25 +1,98 @@
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 from langchain_core.output_parsers import StrOutputParser
 import os
 import time
-from threading import Thread
+import asyncio
+from threading import Thread, Lock
 from queue import Queue
 from dotenv import load_dotenv
+from CircuitBreaker import get_circuit_breaker
+from ResponseCache import request_key
+from SingleFlight import SingleFlight
+from ModelRegistry import get_chat_model
+from UsageLedger import record_usage
+from Tokens import count_tokens
 
 load_dotenv()
 
 PRICING = {
     "gpt-4o-mini": {"input": 0.150 / 1000000, "output": 0.600 / 1000000},
     "claude-3-haiku-20240307": {"input": 0.25 / 1000000, "output": 1.25 / 1000000},
-    "claude-3-5-sonnet-20241022": {"input": 3 / 1000000, "output": 1.25 / 1000000} 
+    "claude-3-5-sonnet-20241022": {"input": 3 / 1000000, "output": 1.25 / 1000000}
 }
 
-class ModelManager:
-    def __init__(self, primary_config, secondary_config):
+_event_loop = None
+_event_loop_lock = Lock()
+
+# Identical requests in flight at the same time share one call (see SingleFlight)
+_single_flight = SingleFlight()
+
+
+def get_event_loop():
+    """Returns the process-wide event loop every model call runs on, starting it on first use."""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None or _event_loop.is_closed():
+            _event_loop = asyncio.new_event_loop()
+            Thread(target=_event_loop.run_forever, name="ModelManagerLoop", daemon=True).start()
+        return _event_loop
+
+
+def charge(model_name, usage_metadata, provider=None, latency=None):
+    """Prices a call from its token usage, records it in the usage ledger and returns the cost."""
+    usage = usage_metadata or {}
+    input_tokens = usage.get("input_tokens", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    cost = input_tokens * PRICING[model_name]["input"] + output_tokens * PRICING[model_name]["output"]
+    return record_usage(
+        model_name, cost, provider=provider, input_tokens=input_tokens,
+        output_tokens=output_tokens, latency=latency
+    )
+
+
+def charge_cancelled(prompt_template, chain_input, config, latency=None):
+    """
+    Records a call cancelled before it returned usage (e.g. the loser of a hedge).
+    The input tokens are counted from the rendered prompt; output already generated is unknown.
+    """
+    try:
+        prompt = prompt_template.invoke(chain_input).to_string()
+    except Exception:
+        prompt = str(chain_input)
+    try:
+        usage = {"input_tokens": count_tokens(prompt, config["model_name"]), "output_tokens": 0}
+        return charge(config["model_name"], usage, config["provider"], latency)
+    except Exception as e:
+        # Never let bookkeeping replace the cancellation being handled
+        print(f"Could not charge cancelled call to {config['model_name']}: {e!r}")
+        return 0
+
+
+def coalescing_stats():
+    """How many calls led a request and how many were coalesced onto an identical one in flight."""
+    return _single_flight.stats()
+
+
+class AsyncModelManager:
+    primary_timeout = 40
+    secondary_timeout = 15
+
+    # Hedging: once the primary has been running longer than its recent p95 latency,
+    # the secondary is started alongside it and whichever answers first wins.
+    # Off by default: every hedged call pays for both models.
+    hedge = False
+    hedge_percentile = 95
+    hedge_min_samples = 20
+    hedge_default_delay = 10
+
+    def __init__(self, primary_config, secondary_config, hedge=None, cache=None):
         self.primary_config = primary_config
         self.secondary_config = secondary_config
-        
+        self.cache = cache
+        if hedge is not None:
+            self.hedge = hedge
+        self.primary_breaker = get_circuit_breaker(primary_config)
+        self.secondary_breaker = get_circuit_breaker(secondary_config)
+
         self.primary_model = self._initialize_model(primary_config)
         self.secondary_model = self._initialize_model(secondary_config)
 
@@ -29,94 +102,363 @@ class ModelManager:
                 api_key = os.getenv("OPENAI_API_KEY")
                 if not api_key:
                     raise ValueError("OpenAI API key not found")
-                return ChatOpenAI(
-                    model=config["model_name"],
-                    temperature=config["temperature"],
-                )
+                return get_chat_model(config)
             elif config["provider"] == "Claude":
                 api_key = os.getenv("ANTHROPIC_API_KEY")
                 if not api_key:
                     raise ValueError("Claude API key not found")
-                return ChatAnthropic(
-                    model=config["model_name"],
-                    temperature=config["temperature"]
-                )
+                return get_chat_model(config)
             else:
                 raise ValueError(f"Unsupported provider: {config['provider']}")
         except Exception as e:
             print(f"Error initializing {config['provider']}: {e}")
             return None
 
-    def _run_model(self, chain, input_queue, is_primary=True):
+    async def _arun_model(self, prompt_template, chain_input, is_primary=True, timeout=None):
         model_type = "Primary" if is_primary else "Secondary"
+        model = self.primary_model if is_primary else self.secondary_model
+        config = self.primary_config if is_primary else self.secondary_config
+        model_name = config["model_name"]
+        breaker = self.primary_breaker if is_primary else self.secondary_breaker
+
+        chain = prompt_template | model
+        start_time = time.monotonic()
         try:
-            chain_input = input_queue.get()
-            model_response = chain.invoke(chain_input)
-            content = StrOutputParser().invoke(model_response)
+            model_response = await asyncio.wait_for(chain.ainvoke(chain_input), timeout=timeout)
+        except asyncio.CancelledError:
+            # Cancelled from outside (a hedge won): no verdict on the model's health,
+            # but the provider still bills the prompt it has already read
+            breaker.release()
+            charge_cancelled(prompt_template, chain_input, config, time.monotonic() - start_time)
+            raise
+        except asyncio.TimeoutError:
+            # wait_for cancelled the call, which had already used the prompt's tokens
+            latency = time.monotonic() - start_time
+            breaker.record_failure(latency)
+            charge_cancelled(prompt_template, chain_input, config, latency)
+            raise
+        except Exception:
+            breaker.record_failure(time.monotonic() - start_time)
+            raise
+        latency = time.monotonic() - start_time
+        breaker.record_success(latency)
+        content = StrOutputParser().invoke(model_response)
 
-            input_tokens = model_response.usage_metadata.get("input_tokens", 0)
-            output_tokens = model_response.usage_metadata.get("output_tokens", 0)
+        usage = model_response.usage_metadata or {}
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        total_cost = charge(model_name, usage, config["provider"], latency)
 
-            model_name = self.primary_config["model_name"] if is_primary else self.secondary_config["model_name"]
-            input_cost = input_tokens * PRICING[model_name]["input"]
-            output_cost = output_tokens * PRICING[model_name]["output"]
-            total_cost = input_cost + output_cost
+        print(f"{model_type} Model Tokens → Input: {input_tokens}, Output: {output_tokens}")
+        return content, total_cost
 
-            print(f"{model_type} Model Tokens → Input: {input_tokens}, Output: {output_tokens}")
+    def hedge_delay(self):
+        """Seconds to wait on the primary before hedging with the secondary."""
+        if len(self.primary_breaker.latency_samples()) < self.hedge_min_samples:
+            delay = self.hedge_default_delay
+        else:
+            delay = self.primary_breaker.latency_percentile(self.hedge_percentile)
+        return min(delay, self.primary_timeout)
 
-            input_queue.put(('success', content, total_cost, input_tokens, output_tokens))
+    def health(self):
+        """Circuit breaker state and recent error/latency stats of both models."""
+        return {
+            "primary": self.primary_breaker.snapshot(),
+            "secondary": self.secondary_breaker.snapshot(),
+        }
 
-        except Exception as e:
-            print(f"{model_type} model failed: {e}")
-            input_queue.put(('error', str(e), 0, 0, 0))
+    def _request_keys(self, prompt_template, chain_input, use_cache):
+        """
+        Returns (flight_key, cache_keys). The flight key identifies identical concurrent
+        requests. cache_keys maps each model whose answers may be cached (temperature 0)
+        to this request's key on that model, primary first; it is empty when the cache does not apply.
+        An answer is stored under the key of the model that gave it.
+        """
+        key = request_key(prompt_template, chain_input, self.primary_config)
+        if key is None:
+            return None, {}
+        flight_key = f"{key}:{self.secondary_config['model_name']}"
+        if self.cache is None or not use_cache or self.primary_config["temperature"] != 0:
+            return flight_key, {}
+        cache_keys = {self.primary_config["model_name"]: key}
+        if self.secondary_config.get("temperature") == 0:
+            cache_keys.setdefault(
+                self.secondary_config["model_name"],
+                request_key(prompt_template, chain_input, self.secondary_config)
+            )
+        return flight_key, cache_keys
+
+    async def _cached(self, cache_keys):
+        for cache_key in cache_keys.values():
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                print("Response cache hit.")
+                return cached
+        return None
+
+    async def _store(self, cache_keys, model_name, content):
+        cache_key = cache_keys.get(model_name)
+        if cache_key is not None and not content.startswith("Error:"):
+            await asyncio.to_thread(self.cache.set, cache_key, content)
+
+    async def agenerate(self, prompt_template, chain_input, use_cache=True):
+        flight_key, cache_keys = self._request_keys(prompt_template, chain_input, use_cache)
+        cached = await self._cached(cache_keys)
+        if cached is not None:
+            return cached, 0
+
+        async def call():
+            content, total_cost, model_name = await self._agenerate(prompt_template, chain_input)
+            await self._store(cache_keys, model_name, content)
+            return content, total_cost
+
+        if flight_key is None:
+            return await call()
+
+        (content, total_cost), is_leader = await _single_flight.run(flight_key, call)
+        if not is_leader:
+            # The leader's caller is charged for the shared call
+            print("Coalesced with an identical request in flight.")
+            return content, 0
+        return content, total_cost
 
-    def generate(self, prompt_template, chain_input):
-        if self.primary_model:
-            input_queue = Queue()
-            input_queue.put(chain_input)
-            chain = prompt_template | self.primary_model
+    async def _agenerate(self, prompt_template, chain_input):
+        """Returns (content, cost, name of the model that answered)."""
+        use_primary = self.primary_model is not None and self.primary_breaker.allow_request()
+        if self.primary_model and not use_primary:
+            print("Primary model circuit open. Routing straight to secondary model...")
 
-            thread = Thread(target=self._run_model, args=(chain, input_queue, True))
-            thread.start()
-            thread.join(timeout=40)
+        if use_primary and self.hedge and self.secondary_model:
+            return await self._ahedged_generate(prompt_template, chain_input)
 
-            if thread.is_alive():
+        if use_primary:
+            try:
+                content, total_cost = await self._arun_model(prompt_template, chain_input, True, self.primary_timeout)
+                return content, total_cost, self.primary_config["model_name"]
+            except asyncio.TimeoutError:
                 print("Primary model timeout. Switching to secondary model...")
-                return self._try_secondary_model(prompt_template, chain_input)
+            except Exception as e:
+                print("Primary model error:", e)
+
+        content, total_cost = await self._atry_secondary_model(prompt_template, chain_input)
+        return content, total_cost, self.secondary_config["model_name"]
+
+    async def _ahedged_generate(self, prompt_template, chain_input):
+        """
+        Races the primary and the secondary once the primary passes the hedge delay.
+        The slower call is cancelled and charged for its prompt (see charge_cancelled).
+        Returns (content, cost, name of the model that answered).
+        """
+        primary = asyncio.ensure_future(
+            self._arun_model(prompt_template, chain_input, True, self.primary_timeout)
+        )
+        secondary = None
+        try:
+            delay = self.hedge_delay()
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if primary in done and primary.exception() is None:
+                return primary.result() + (self.primary_config["model_name"],)
+
+            if primary in done:
+                print(f"Primary model error: {primary.exception()!r}. Switching to secondary model...")
+                pending = set()
+            else:
+                print(f"Primary model slower than {delay:.1f}s. Hedging with secondary model...")
+                pending = {primary}
 
-            status, result, total_cost, input_tokens, output_tokens = input_queue.get()
-            if status == 'success':
-                return result, total_cost
+            secondary = asyncio.ensure_future(
+                self._arun_model(prompt_template, chain_input, False, self.secondary_timeout)
+            )
+            pending.add(secondary)
 
-            print("Primary model error:", result)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished = [task for task in done if task.exception() is None]
+                if finished:
+                    # Both calls may land in the same tick; each of them consumed tokens
+                    winner = finished[0]
+                    config = self.primary_config if winner is primary else self.secondary_config
+                    total_cost = sum(task.result()[1] for task in finished)
+                    return winner.result()[0], total_cost, config["model_name"]
+                for task in done:
+                    model_type = "Primary" if task is primary else "Secondary"
+                    print(f"{model_type} model error: {task.exception()!r}")
+        finally:
+            for task in (primary, secondary):
+                if task is not None and not task.done():
+                    task.cancel()
 
-        return self._try_secondary_model(prompt_template, chain_input)
+        print("Error: All models failed to generate a response.")
+        return "Error: All models failed to generate a response.", 0, None
+
+    async def _astream_model(self, prompt_template, chain_input, usage, is_primary=True, timeout=None):
+        """Yields text chunks from one model. `timeout` bounds the wait for the first chunk."""
+        model_type = "Primary" if is_primary else "Secondary"
+        model = self.primary_model if is_primary else self.secondary_model
+        config = self.primary_config if is_primary else self.secondary_config
+        model_name = config["model_name"]
+        breaker = self.primary_breaker if is_primary else self.secondary_breaker
+
+        chain = prompt_template | model
+        chunks = chain.astream(chain_input).__aiter__()
+        start_time = time.monotonic()
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except StopAsyncIteration:
+            breaker.record_success(time.monotonic() - start_time)
+            return
+        except Exception:
+            breaker.record_failure(time.monotonic() - start_time)
+            raise
+
+        aggregate = chunk
+        try:
+            yield StrOutputParser().invoke(chunk)
+            async for chunk in chunks:
+                aggregate = aggregate + chunk
+                yield StrOutputParser().invoke(chunk)
+        except (asyncio.CancelledError, GeneratorExit):
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure(time.monotonic() - start_time)
+            raise
+        finally:
+            await chunks.aclose()
+
+        latency = time.monotonic() - start_time
+        breaker.record_success(latency)
+        model_usage = aggregate.usage_metadata or {}
+        input_tokens = model_usage.get("input_tokens", 0)
+        output_tokens = model_usage.get("output_tokens", 0)
+        usage["cost"] = usage.get("cost", 0) + charge(model_name, model_usage, config["provider"], latency)
+        usage["model"] = model_name
+        print(f"{model_type} Model Tokens → Input: {input_tokens}, Output: {output_tokens}")
 
-    def _try_secondary_model(self, prompt_template, chain_input):
+    async def astream(self, prompt_template, chain_input, usage=None, use_cache=True):
+        """
+        Yields text chunks as they arrive, failing over to the secondary model if the
+        primary errors or times out before its first chunk. The cost of the call is
+        added to usage["cost"] once the stream finishes. A cached response is yielded whole.
+        """
+        usage = {} if usage is None else usage
+        flight_key, cache_keys = self._request_keys(prompt_template, chain_input, use_cache)
+        cached = await self._cached(cache_keys)
+        if cached is not None:
+            yield cached
+            return
+
+        async def call():
+            # Only runs for the leader, so only the leader's usage is charged
+            parts = []
+            async for text in self._astream(prompt_template, chain_input, usage):
+                parts.append(text)
+                yield text
+            await self._store(cache_keys, usage.get("model"), "".join(parts))
+
+        chunks = call() if flight_key is None else _single_flight.stream(flight_key, call)
+        async for text in chunks:
+            yield text
+
+    async def _astream(self, prompt_template, chain_input, usage):
+        candidates = []
+        if self.primary_model is not None:
+            if self.primary_breaker.allow_request():
+                candidates.append((True, self.primary_timeout))
+            else:
+                print("Primary model circuit open. Routing straight to secondary model...")
+        if self.secondary_model is not None:
+            candidates.append((False, self.secondary_timeout))
+
+        for is_primary, timeout in candidates:
+            model_type = "Primary" if is_primary else "Secondary"
+            started = False
+            try:
+                async for text in self._astream_model(prompt_template, chain_input, usage, is_primary, timeout):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                if started:
+                    # Part of the answer is already on screen; restarting on another model would repeat it
+                    print(f"{model_type} model failed mid-stream: {e!r}")
+                    return
+                print(f"{model_type} model error: {e!r}. Trying next model...")
+
+        print("Error: All models failed to generate a response.")
+        yield "Error: All models failed to generate a response."
+
+    async def _atry_secondary_model(self, prompt_template, chain_input):
         """Runs the secondary model in case the primary one fails"""
         if self.secondary_model:
             try:
-                input_queue = Queue()
-                input_queue.put(chain_input)
-                chain = prompt_template | self.secondary_model
+                return await self._arun_model(prompt_template, chain_input, False, self.secondary_timeout)
+            except asyncio.TimeoutError:
+                print("Secondary model timed out. No response available.")
+                return "Error: Secondary model timed out.", 0
+            except Exception as e:
+                print(f"Secondary model error: {e}")
 
-                thread = Thread(target=self._run_model, args=(chain, input_queue, False))
-                thread.start()
-                thread.join(timeout=15)
+        print("Error: All models failed to generate a response.")
+        return "Error: All models failed to generate a response.", 0
 
-                if thread.is_alive():
-                    print("Secondary model timed out. No response available.")
-                    return "Error: Secondary model timed out.", 0
 
-                status, result, total_cost, input_tokens, output_tokens = input_queue.get()
+class ResponseStream:
+    """
+    Iterates over the text chunks of a response streamed on the shared event loop.
+    `text` and `cost` are complete once iteration finishes.
+    """
 
-                if status == 'success':
-                    return result, total_cost
+    _done = object()
 
-                print(f"Secondary model error: {result}")
+    def __init__(self, model_manager, prompt_template, chain_input, use_cache=True):
+        self.text = ""
+        self.usage = {"cost": 0}
+        self._chunks = Queue()
+        self._future = asyncio.run_coroutine_threadsafe(
+            self._pump(model_manager.astream(prompt_template, chain_input, self.usage, use_cache)),
+            get_event_loop()
+        )
 
-            except Exception as e:
-                print(f"Secondary model failed: {str(e)}")
+    @property
+    def cost(self):
+        return self.usage["cost"]
 
-        print("Error: All models failed to generate a response.")
-        return "Error: All models failed to generate a response.", 0
\ No newline at end of file
+    async def _pump(self, chunks):
+        try:
+            async for text in chunks:
+                self._chunks.put(text)
+        finally:
+            self._chunks.put(self._done)
+
+    def __iter__(self):
+        try:
+            while True:
+                text = self._chunks.get()
+                if text is self._done:
+                    break
+                self.text += text
+                yield text
+            self._future.result()
+        finally:
+            # Stops the model call if the reader gives up early (e.g. a Streamlit rerun)
+            if not self._future.done():
+                self._future.cancel()
+
+
+class ModelManager(AsyncModelManager):
+    """Blocking front end used by the Streamlit apps; the work itself runs on the shared event loop."""
+
+    def generate(self, prompt_template, chain_input, use_cache=True):
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate(prompt_template, chain_input, use_cache),
+            get_event_loop()
+        )
+        return future.result()
+
+    def stream(self, prompt_template, chain_input, use_cache=True):
+        """Starts a streamed generation and returns a ResponseStream to iterate over."""
+        return ResponseStream(self, prompt_template, chain_input, use_cache)
@@ -1,17 +1,14 @@
 import streamlit as st
-from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
-from Model_Manager import ModelManager, PRICING
+from Ingestion import ingest, file_kind
+from HistoryManager import HistoryManager
+from Model_Manager import ModelManager
+from ImagePrep import prepare_image
+from VisionPipeline import VisionPipeline
+from ResponseCache import get_response_cache
 from Config import PRIMARY_MODEL, SECONDARY_MODEL, Images_MODEL
-import base64
-from PIL import Image
-import io
-import PyPDF2
-import docx
 import pandas as pd
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 
 # Ensure session state variables
 if "original_image" not in st.session_state:
@@ -40,26 +37,22 @@ class RubricGenerator(BaseApp):
         super().__init__(app_name)
         self.app_slogan = app_slogan
         self.model_manager = model_manager
+        self.history = HistoryManager(model_manager)
 
     def welcome_screen(self, bot_slogan="Create rubrics to evaluate assignments effectively 📝🧠"):
         return super().welcome_screen(bot_slogan)
 
     def extract_text_from_pdf(self, pdf_file):
-        """Extracts text from a PDF file."""
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+        """Extracts text from a PDF file (cached by content, see Ingestion.py)."""
+        return ingest(pdf_file, "pdf").text
 
     def extract_text_from_docx(self, docx_file):
-        """Extracts text from a DOCX file."""
-        doc = docx.Document(docx_file)
-        return "\n".join(para.text for para in doc.paragraphs)
+        """Extracts text from a DOCX file (cached by content, see Ingestion.py)."""
+        return ingest(docx_file, "docx").text
 
     def encode_image(self, image_file):
-        """Encodes an image as a base64 string for passing to the model."""
-        img = Image.open(image_file).convert("RGB").resize((1024, 1024))
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG", quality=75)
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+        """Encodes an image as a data URL for passing to the model (resized and encoded once per image)."""
+        return prepare_image(image_file).data_url
 
     def generate_text_prompt(self):
         return ChatPromptTemplate.from_template(
@@ -145,39 +138,22 @@ class RubricGenerator(BaseApp):
 
             st.session_state.assignment_description = st.text_area("Assignment Description")
 
-            uploaded_file = st.file_uploader(
+            uploaded_files = st.file_uploader(
                 "Upload reference material (image or document)",
-                type=["pdf", "docx", "csv", "jpg", "jpeg", "png"]
+                type=["pdf", "docx", "csv", "jpg", "jpeg", "png"],
+                accept_multiple_files=True
             )
 
-            if uploaded_file:
-                file_type = uploaded_file.name.split(".")[-1].lower()
-                st.session_state.doc_type = file_type
-
-                if file_type in ["jpg", "jpeg", "png"]:
-                    # It's an image
-                    st.session_state.img = self.encode_image(uploaded_file)
-                    st.session_state.original_image = uploaded_file.getvalue()
-                else:
-                    # It's text-based
-                    st.session_state.original_image = None
-                    content = None
-                    try:
-                        if file_type == "pdf":
-                            content = self.extract_text_from_pdf(uploaded_file)
-
-                        elif file_type == "docx":
-                            content = self.extract_text_from_docx(uploaded_file)
-                        elif file_type == "csv":
-                            df = pd.read_csv(uploaded_file, encoding="latin1")
-                            content = df.to_string()
-                        st.session_state.doc = content
-                    except Exception as e:
-                        st.error(f"Error processing file: {e}")
+            # Documents are read in the background and merged; the first image goes with the request
+            images = [file for file in uploaded_files if file_kind(file.name) in ("jpg", "jpeg", "png")]
+            documents = [file for file in uploaded_files if file not in images]
+            if images:
+                st.session_state.img = self.encode_image(images[0])
+                st.session_state.original_image = images[0].getvalue()
             else:
-                # No file → reset document state
-                st.session_state.doc = None
-                st.session_state.doc_type = None
+                st.session_state.original_image = None
+            st.session_state.doc = self.queue_uploads(documents)
+            st.session_state.doc_type = file_kind(documents[0].name) if len(documents) == 1 else None
 
             if st.button("Generate Rubric!"):
                 st.session_state.solve_clicked = True
@@ -229,22 +205,22 @@ class RubricGenerator(BaseApp):
                     )
                 else:
                     prompt_template = self.generate_text_prompt()
-                    doc_context = ""
-                    if st.session_state.doc:
-                        doc_context = f"""
-                        **Reference Material Content:**
-                        {st.session_state.doc[:3000]}  # Limit length to avoid token issues
-
-                        Use the above document content as reference material for creating this rubric.
-                        """
-
                     inputs = {
                         "grade_level": st.session_state.grade_level,
                         "assignment_type": st.session_state.assignment_type,
                         "scale": st.session_state.scale,
                         "assignment_description": st.session_state.assignment_description,
-                        "doc_context": doc_context
+                        "doc_context": ""
                     }
+                    # Include uploads that were still being read when the button was clicked
+                    st.session_state.doc = self.uploaded_corpus(wait=True)
+                    if st.session_state.doc:
+                        inputs["doc_context"] = f"""
+                        **Reference Material Content:**
+                        {self.fit_document(prompt_template, inputs, st.session_state.doc)}
+
+                        Use the above document content as reference material for creating this rubric.
+                        """
 
                     try:
                         response, cost = self.model_manager.generate(prompt_template, inputs)
@@ -275,7 +251,7 @@ class RubricGenerator(BaseApp):
                     "assignment_type": st.session_state.assignment_type,
                     "grade_level": st.session_state.grade_level,
                     "scale": st.session_state.scale,
-                    "chat_history": "\n".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.chat_history[:-1]]),  # Exclude the most recent user message
+                    "chat_history": self.history.context(st.session_state.chat_history[:-1]),  # Exclude the most recent user message
                     "user_question": user_input
                 }
 
@@ -328,111 +304,45 @@ class RubricGenerator(BaseApp):
         except Exception as e:
             return pd.DataFrame({"Rubric Content": [rubric_text]})
 
-    def handle_image_query(self, user_input_str, base64_image_str):
+    def handle_image_query(self, user_input_str, image_url):
         """
-        Handles an image-based query:
-          - Tries GPT-4o-mini first
-          - Fallback to Claude 3.5 Sonnet
+        Handles an image-based query (see VisionPipeline.answer):
+          - Sends the image the first time; repeats are answered from its description, written once
+          - Tries GPT-4o-mini first, falls back to Claude 3.5 Sonnet
+          - Refines the answer in a second, text-only pass when refine_image_answers is set
           Accumulates cost from usage metadata.
         """
-        try:
-            model_name = PRIMARY_MODEL["model_name"]
-            model = ChatOpenAI(model=model_name, temperature=PRIMARY_MODEL["temperature"])
-            used_model = "GPT-4o-mini"
-        except Exception as e:
-            st.warning(f"Primary Model Failed: {e}, switching to Claude 3.5 Sonnet.")
-            model_name = Images_MODEL["model_name"]
-            model = ChatAnthropic(model=model_name, temperature=Images_MODEL["temperature"])
-            used_model = "Claude 3.5 Sonnet"
-
-        try:
-            content = [
-                {
-                    "type": "text",
-                    "text": f"You are an intelligent rubric builder. Analyze the image and generate a structured rubric based on its content."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image_str}"}
-                },
-                {
-                    "type": "text",
-                    "text": f"Grade Level: {st.session_state.grade_level}. Assignment Type: {st.session_state.assignment_type}. Scale: {st.session_state.scale}. If the image does not contain educational content, inform the user."
-                }
-            ]
-
-            response = model.invoke([HumanMessage(content=content)])
-            summary_response = response.content
-
-            input_tokens = response.usage_metadata.get("input_tokens", 0)
-            output_tokens = response.usage_metadata.get("output_tokens", 0)
-            cost_summary = (input_tokens * PRICING[model_name]["input"]) + (output_tokens * PRICING[model_name]["output"])
-            st.session_state.COST += cost_summary
-
-            refine_prompt = ChatPromptTemplate.from_template(
-                """
+        pipeline = VisionPipeline([PRIMARY_MODEL, Images_MODEL], refine_prompt=ChatPromptTemplate.from_template(
+            """
                 {existing_answer}
 
                 Make sure the rubric is appropriate for the grade level: {grade_level} and uses a scale of: {scale}.
                 Provide an enhanced version if needed (don't mention that you refined it).
-                """
-            )
-            chain = refine_prompt | model
-            final_response = chain.invoke({
-                "existing_answer": summary_response,
-                "grade_level": st.session_state.grade_level,
-                "scale": st.session_state.scale
-            })
-            input_tokens2 = final_response.usage_metadata.get("input_tokens", 0)
-            output_tokens2 = final_response.usage_metadata.get("output_tokens", 0)
-            cost_refine = (
-                input_tokens2 * PRICING[model_name]["input"]
-                + output_tokens2 * PRICING[model_name]["output"]
-            )
-            st.session_state.COST += cost_refine
-
-            print(f"**Model used:** {used_model}")
-            print(f"**Cost so far:** ${st.session_state.COST}")
-            st.session_state.COST = 0
-            return final_response.content
-
-        except Exception as e:
-            st.error(f"Primary model failed mid-query: {e}. Switching to fallback...")
-
-            # Fallback
-            fallback_model_name = Images_MODEL["model_name"]
-            fallback_model = ChatAnthropic(
-                model=fallback_model_name,
-                temperature=Images_MODEL["temperature"]
-            )
-            fallback_response = fallback_model.invoke([HumanMessage(content=[
-                {
-                    "type": "text",
-                    "text": f"You are an intelligent rubric builder. Analyze the image and generate a structured rubric based on its content."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image_str}"}
-                },
-                {
-                    "type": "text",
-                    "text": f"Grade Level: {st.session_state.grade_level}. Assignment Type: {st.session_state.assignment_type}. Scale: {st.session_state.scale}."
+            """
+        ))
+        try:
+            answer = pipeline.answer(
+                image_url,
+                "You are an intelligent rubric builder. Analyze the image and generate a structured rubric based on its content.",
+                f"Grade Level: {st.session_state.grade_level}. Assignment Type: {st.session_state.assignment_type}. Scale: {st.session_state.scale}. If the image does not contain educational content, inform the user.",
+                refine=self.refine_image_answers,
+                refine_input={
+                    "grade_level": st.session_state.grade_level,
+                    "scale": st.session_state.scale
                 }
-            ])])
-
-            input_tokens_f = fallback_response.usage_metadata.get("input_tokens", 0)
-            output_tokens_f = fallback_response.usage_metadata.get("output_tokens", 0)
-            cost_fallback = (
-                input_tokens_f * PRICING[fallback_model_name]["input"]
-                + output_tokens_f * PRICING[fallback_model_name]["output"]
             )
-            st.session_state.COST = cost_fallback
+        except Exception as e:
+            st.error(f"Image query failed: {e}")
+            return ""
+        finally:
+            st.session_state.COST += pipeline.cost
+            print(f"**Model used:** {', '.join(pipeline.used_models)}")
             print(f"**Cost so far:** ${st.session_state.COST}")
             st.session_state.COST = 0
-            return fallback_response.content
+        return answer
 
 def main():
-    model_manager = ModelManager(PRIMARY_MODEL, SECONDARY_MODEL)
+    model_manager = ModelManager(PRIMARY_MODEL, SECONDARY_MODEL, cache=get_response_cache())
     app = RubricGenerator(model_manager)
     app.welcome_screen()
     app.display_side()
@@ -0,0 +1,128 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from langchain_core.messages import HumanMessage
+from Model_Manager import charge
+from ModelRegistry import get_chat_model
+
+SUMMARY_INSTRUCTIONS = (
+    "Describe this image completely: transcribe any text, equations and tables, and explain diagrams, "
+    "so that questions about it can be answered from your description alone."
+)
+MAX_SUMMARIES = 64
+
+_summaries = OrderedDict()
+_answered = OrderedDict()  # keys of images already answered once from the image itself
+_summaries_lock = Lock()
+
+
+def _remember(store, key, value):
+    with _summaries_lock:
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > MAX_SUMMARIES:
+            store.popitem(last=False)
+
+
+def image_key(image_url):
+    return hashlib.sha256(image_url.encode("utf-8")).hexdigest()
+
+
+def cached_summary(image_url):
+    """The stored description of an image, or None if none has been needed yet."""
+    key = image_key(image_url)
+    with _summaries_lock:
+        summary = _summaries.get(key)
+        if summary is not None:
+            _summaries.move_to_end(key)
+        return summary
+
+
+
+class VisionPipeline:
+    """
+    Answers requests about an image in as few model calls as possible.
+
+    The first request about an image is one call with the image and instructions. An image
+    is only described when a second request about it comes; that description is generated
+    once, cached, and every request after the first is answered from it as text, without
+    resending the image. A text-only refine pass runs only when asked for.
+
+    Each stage runs on the first model in `configs` that succeeds. A failed stage is retried
+    on the next model with the results of the stages before it, which are not run again, and
+    later stages stay on the model that worked. Cost and models used are tallied on the instance.
+    """
+
+    def __init__(self, configs, refine_prompt=None):
+        self.configs = list(configs)
+        self.refine_prompt = refine_prompt
+        self.cost = 0.0
+        self.used_models = []
+        self._current = 0
+
+    def _run_stage(self, stage, messages):
+        error = None
+        while self._current < len(self.configs):
+            config = self.configs[self._current]
+            start_time = time.monotonic()
+            try:
+                response = get_chat_model(config).invoke(messages)
+            except Exception as e:
+                print(f"Vision stage '{stage}' failed on {config['model_name']}: {e}")
+                error = e
+                self._current += 1
+                continue
+            self.cost += charge(
+                config["model_name"], response.usage_metadata, config["provider"], time.monotonic() - start_time
+            )
+            self.used_models.append(config["model_name"])
+            return response.content
+        raise error or RuntimeError("No vision model configured.")
+
+    def answer(self, image_url, instructions, details=None, refine=False, refine_input=None):
+        """One call, with the image or its description; `refine` adds one text-only pass using `refine_prompt`."""
+        key = image_key(image_url)
+        summary = cached_summary(image_url)
+        with _summaries_lock:
+            repeat = key in _answered
+        if summary is None and repeat:
+            summary = self.summary(image_url)
+
+        if summary is None:
+            content = [
+                {"type": "text", "text": instructions},
+                {"type": "image_url", "image_url": {"url": image_url}},
+            ]
+            if details:
+                content.append({"type": "text", "text": details})
+            answer = self._run_stage("answer", [HumanMessage(content=content)])
+            _remember(_answered, key, True)
+        else:
+            prompt = f"{instructions}\n\nImage description:\n{summary}\n\n"
+            if details:
+                prompt += f"{details}\n"
+            prompt += "Answer as if you can see the image; don't say you were given a description."
+            answer = self._run_stage("answer", [HumanMessage(content=prompt)])
+
+        if refine and self.refine_prompt is not None:
+            messages = self.refine_prompt.format_messages(existing_answer=answer, **(refine_input or {}))
+            answer = self._run_stage("refine", messages)
+        return answer
+
+    def summary(self, image_url):
+        """Description of the image, generated on the first request and reused after that."""
+        summary = cached_summary(image_url)
+        if summary is not None:
+            return summary
+
+        summary = self._run_stage("summarize", [HumanMessage(content=[
+            {"type": "text", "text": SUMMARY_INSTRUCTIONS},
+            {"type": "image_url", "image_url": {"url": image_url}},
+        ])])
+        _remember(_summaries, image_key(image_url), summary)
+        return summary
+
+    def ask(self, image_url, question, instructions=None):
+        """Answers a question about the image; see answer() for when the image itself is sent."""
+        return self.answer(image_url, instructions or "Answer the question about this image.", f"Question: {question}")
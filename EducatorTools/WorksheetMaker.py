@@ -1,17 +1,13 @@
 import streamlit as st
-from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
-from Model_Manager import ModelManager, PRICING
+from Ingestion import ingest, file_kind
+from HistoryManager import HistoryManager
+from Model_Manager import ModelManager
+from ImagePrep import prepare_image
+from VisionPipeline import VisionPipeline
+from ResponseCache import get_response_cache
 from Config import PRIMARY_MODEL, SECONDARY_MODEL, Images_MODEL
-import base64
-from PIL import Image
-import io
-import PyPDF2
-import docx
-import pandas as pd
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 
 # Ensure session state variables
 if "original_image" not in st.session_state:
@@ -38,26 +34,22 @@ class WorksheetMaker(BaseApp):
         super().__init__(app_name)
         self.app_slogan = app_slogan
         self.model_manager = model_manager
+        self.history = HistoryManager(model_manager)
 
     def welcome_screen(self, bot_slogan="Create worksheets to enhance learning 📚🤖"):
         return super().welcome_screen(bot_slogan)
 
     def extract_text_from_pdf(self, pdf_file):
-        """Extracts text from a PDF file."""
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+        """Extracts text from a PDF file (cached by content, see Ingestion.py)."""
+        return ingest(pdf_file, "pdf").text
 
     def extract_text_from_docx(self, docx_file):
-        """Extracts text from a DOCX file."""
-        doc = docx.Document(docx_file)
-        return "\n".join(para.text for para in doc.paragraphs)
+        """Extracts text from a DOCX file (cached by content, see Ingestion.py)."""
+        return ingest(docx_file, "docx").text
 
     def encode_image(self, image_file):
-        """Encodes an image as a base64 string for passing to the model."""
-        img = Image.open(image_file).convert("RGB").resize((1024, 1024))
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG", quality=75)
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+        """Encodes an image as a data URL for passing to the model (resized and encoded once per image)."""
+        return prepare_image(image_file).data_url
 
     def generate_text_prompt(self):
         return ChatPromptTemplate.from_template(
@@ -146,39 +138,22 @@ class WorksheetMaker(BaseApp):
             st.session_state.topic = st.text_input("Enter Topic")
             st.session_state.details = st.text_input("Other details")
 
-            uploaded_file = st.file_uploader(
+            uploaded_files = st.file_uploader(
                 "Upload (image or doc)",
-                type=["pdf", "docx", "csv", "jpg", "jpeg", "png"]
+                type=["pdf", "docx", "csv", "jpg", "jpeg", "png"],
+                accept_multiple_files=True
             )
 
-            if uploaded_file:
-                file_type = uploaded_file.name.split(".")[-1].lower()
-                st.session_state.doc_type = file_type
-
-                if file_type in ["jpg", "jpeg", "png"]:
-                    # It's an image
-                    st.session_state.img = self.encode_image(uploaded_file)
-                    st.session_state.original_image = uploaded_file.getvalue()
-                else:
-                    # It's text-based
-                    st.session_state.original_image = None
-                    content = None
-                    try:
-                        if file_type == "pdf":
-                            content = self.extract_text_from_pdf(uploaded_file)
-
-                        elif file_type == "docx":
-                            content = self.extract_text_from_docx(uploaded_file)
-                        elif file_type == "csv":
-                            df = pd.read_csv(uploaded_file, encoding="latin1")
-                            content = df.to_string()
-                        st.session_state.doc = content
-                    except Exception as e:
-                        st.error(f"Error processing file: {e}")
+            # Documents are read in the background and merged; the first image goes with the request
+            images = [file for file in uploaded_files if file_kind(file.name) in ("jpg", "jpeg", "png")]
+            documents = [file for file in uploaded_files if file not in images]
+            if images:
+                st.session_state.img = self.encode_image(images[0])
+                st.session_state.original_image = images[0].getvalue()
             else:
-                # No file → reset document state
-                st.session_state.doc = None
-                st.session_state.doc_type = None
+                st.session_state.original_image = None
+            st.session_state.doc = self.queue_uploads(documents)
+            st.session_state.doc_type = file_kind(documents[0].name) if len(documents) == 1 else None
 
             if st.button("Generate worksheet!"):
                 st.session_state.solve_clicked = True
@@ -229,21 +204,21 @@ class WorksheetMaker(BaseApp):
                     )
                 else:
                     prompt_template = self.generate_text_prompt()
-                    doc_context = ""
-                    if st.session_state.doc:
-                        doc_context = f"""
-                        **Document Content for Reference:**
-                        {st.session_state.doc[:3000]}  # Limit length to avoid token issues
-
-                        Use the above document content as reference material for creating this worksheet.
-                        """
-
                     inputs = {
                         "education_level": st.session_state.education_level,
                         "topic": st.session_state.topic,
                         "details": st.session_state.details,
-                        "doc_context": doc_context
+                        "doc_context": ""
                     }
+                    # Include uploads that were still being read when the button was clicked
+                    st.session_state.doc = self.uploaded_corpus(wait=True)
+                    if st.session_state.doc:
+                        inputs["doc_context"] = f"""
+                        **Document Content for Reference:**
+                        {self.fit_document(prompt_template, inputs, st.session_state.doc)}
+
+                        Use the above document content as reference material for creating this worksheet.
+                        """
 
                     try:
                         response, cost = self.model_manager.generate(prompt_template, inputs)
@@ -272,7 +247,7 @@ class WorksheetMaker(BaseApp):
                 inputs = {
                     "topic": st.session_state.topic,
                     "education_level": st.session_state.education_level,
-                    "chat_history": "\n".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.chat_history[:-1]]),  # Exclude the most recent user message
+                    "chat_history": self.history.context(st.session_state.chat_history[:-1]),  # Exclude the most recent user message
                     "user_question": user_input
                 }
 
@@ -293,100 +268,39 @@ class WorksheetMaker(BaseApp):
             # Force a rerun to update the chat display with the new messages
             st.rerun()
 
-    def handle_image_query(self, user_input_str, base64_image_str):
+    def handle_image_query(self, user_input_str, image_url):
         """
-        Handles an image-based query:
-          - Tries GPT-4o-mini first
-          - Fallback to Claude 3.5 Sonnet
+        Handles an image-based query (see VisionPipeline.answer):
+          - Sends the image the first time; repeats are answered from its description, written once
+          - Tries GPT-4o-mini first, falls back to Claude 3.5 Sonnet
+          - Refines the answer in a second, text-only pass when refine_image_answers is set
           Accumulates cost from usage metadata.
         """
-        try:
-            model_name = PRIMARY_MODEL["model_name"]
-            model = ChatOpenAI(model=model_name, temperature=PRIMARY_MODEL["temperature"])
-            used_model = "GPT-4o-mini"
-        except Exception as e:
-            st.warning(f"Primary Model Failed: {e}, switching to Claude 3.5 Sonnet.")
-            model_name = Images_MODEL["model_name"]
-            model = ChatAnthropic(model=model_name, temperature=Images_MODEL["temperature"])
-            used_model = "Claude 3.5 Sonnet"
-
-        try:
-            content = [
-                {
-                    "type": "text",
-                    "text": "You are an intelligent worksheet maker. Analyze the image and generate a structured worksheet based on its content."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image_str}"}
-                },
-                {
-                    "type": "text",
-                    "text": f"Education Level: {st.session_state.education_level}. If the image does not contain educational content, inform the user."
-                }
-            ]
-
-            response = model.invoke([HumanMessage(content=content)])
-            summary_response = response.content
-            input_tokens = response.usage_metadata.get("input_tokens", 0)
-            output_tokens = response.usage_metadata.get("output_tokens", 0)
-            cost_summary = (input_tokens * PRICING[model_name]["input"]) + (output_tokens * PRICING[model_name]["output"])
-            st.session_state.COST += cost_summary
-
-            refine_prompt = ChatPromptTemplate.from_template(
-                """
+        pipeline = VisionPipeline([PRIMARY_MODEL, Images_MODEL], refine_prompt=ChatPromptTemplate.from_template(
+            """
                 {existing_answer}
                 Provide an enhanced version (if any, don't mention that you refined it).
-                """
-            )
-            chain = refine_prompt | model
-            final_response = chain.invoke({"existing_answer": summary_response})
-            input_tokens2 = final_response.usage_metadata.get("input_tokens", 0)
-            output_tokens2 = final_response.usage_metadata.get("output_tokens", 0)
-            cost_refine = (
-                input_tokens2 * PRICING[model_name]["input"]
-                + output_tokens2 * PRICING[model_name]["output"]
+            """
+        ))
+        try:
+            answer = pipeline.answer(
+                image_url,
+                "You are an intelligent worksheet maker. Analyze the image and generate a structured worksheet based on its content.",
+                f"Education Level: {st.session_state.education_level}. If the image does not contain educational content, inform the user.",
+                refine=self.refine_image_answers
             )
-            st.session_state.COST += cost_refine
-
-            print(f"**Model used:** {used_model}")
-            print(f"**Cost so far:** ${st.session_state.COST}")
-            st.session_state.COST = 0
-            return final_response.content
-
         except Exception as e:
-            st.error(f"Primary model failed mid-query: {e}. Switching to fallback...")
-
-            # Fallback
-            fallback_model_name = Images_MODEL["model_name"]
-            fallback_model = ChatAnthropic(
-                model=fallback_model_name,
-                temperature=Images_MODEL["temperature"]
-            )
-            fallback_response = fallback_model.invoke([HumanMessage(content=[
-                {
-                    "type": "text",
-                    "text": "You are an intelligent worksheet maker. Analyze the image and generate a structured worksheet based on its content."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image_str}"}
-                }
-            ])])
-
-            input_tokens_f = fallback_response.usage_metadata.get("input_tokens", 0)
-            output_tokens_f = fallback_response.usage_metadata.get("output_tokens", 0)
-            cost_fallback = (
-                input_tokens_f * PRICING[fallback_model_name]["input"]
-                + output_tokens_f * PRICING[fallback_model_name]["output"]
-            )
-            st.session_state.COST = cost_fallback
+            st.error(f"Image query failed: {e}")
+            return ""
+        finally:
+            st.session_state.COST += pipeline.cost
+            print(f"**Model used:** {', '.join(pipeline.used_models)}")
             print(f"**Cost so far:** ${st.session_state.COST}")
             st.session_state.COST = 0
-            return fallback_response.content
+        return answer
 
 def main():
-    model_manager = ModelManager(PRIMARY_MODEL, SECONDARY_MODEL)
+    model_manager = ModelManager(PRIMARY_MODEL, SECONDARY_MODEL, cache=get_response_cache())
     app = WorksheetMaker(model_manager)
     app.welcome_screen()
     app.display_side()
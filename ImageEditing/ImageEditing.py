@@ -7,6 +7,7 @@ import time
 import streamlit as st 
 import random 
 from dotenv import load_dotenv
+from UsageLedger import record_usage
 
 load_dotenv()
 
@@ -68,7 +69,7 @@ class ImageEditor():
         edited = f"edited_{filename}_{seed}.{output_format}"
         with open(edited, "wb") as f:
             f.write(output_image)
-        st.session_state.COST = 0.03
+        st.session_state.COST = record_usage("stable-image-sketch", 0.03, provider="Stability", images=1)
         print(st.session_state.COST)
         return edited
 
@@ -97,7 +98,7 @@ class ImageEditor():
         edited = f"edited_{filename}_{seed}.{output_format}"
         with open(edited, "wb") as f:
             f.write(output_image)
-        st.session_state.COST = 0.04
+        st.session_state.COST = record_usage("stable-image-style", 0.04, provider="Stability", images=1)
         print(st.session_state.COST)
         return edited
 
@@ -125,7 +126,7 @@ class ImageEditor():
         edited = f"edited_{filename}_{seed}.{output_format}"
         with open(edited, "wb") as f:
             f.write(output_image)
-        st.session_state.COST = 0.02
+        st.session_state.COST = record_usage("stable-image-remove-background", 0.02, provider="Stability", images=1)
         print(st.session_state.COST)
         return edited 
     
@@ -0,0 +1,137 @@
+import atexit
+import os
+import sqlite3
+import sys
+import time
+from threading import Event, Lock, Thread
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# One ledger file shared by every app on the machine so usage can be compared across them
+LEDGER_PATH = os.path.expanduser(os.getenv("USAGE_LEDGER_PATH", "~/.llms_edu_usage.db"))
+
+COLUMNS = (
+    "timestamp", "app", "provider", "model", "input_tokens", "output_tokens",
+    "seconds", "characters", "images", "latency", "cost",
+)
+NUMERIC_COLUMNS = ("input_tokens", "output_tokens", "seconds", "characters", "images", "cost")
+GROUP_COLUMNS = ("app", "provider", "model", "hour")
+
+
+def default_app_name():
+    """Name of the running script (`streamlit run QuizBuilder.py` → "QuizBuilder")."""
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0] or "unknown"
+
+
+class UsageLedger:
+    """
+    Append-only record of every billable provider call.
+
+    Entries are buffered in memory and written to SQLite in batches, either when
+    `batch_size` entries are waiting or every `flush_interval` seconds.
+    """
+
+    def __init__(self, path=LEDGER_PATH, batch_size=50, flush_interval=5.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer = []
+        self._buffer_lock = Lock()
+        self._write_lock = Lock()
+        self._wake = Event()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "timestamp REAL, app TEXT, provider TEXT, model TEXT, "
+            "input_tokens INTEGER, output_tokens INTEGER, seconds REAL, "
+            "characters INTEGER, images INTEGER, latency REAL, cost REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS usage_timestamp ON usage (timestamp)")
+        self._db.commit()
+
+        Thread(target=self._flush_loop, name="UsageLedgerFlush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def record(self, model, cost=0.0, provider=None, input_tokens=0, output_tokens=0,
+               seconds=0.0, characters=0, images=0, latency=None, app=None):
+        entry = (
+            time.time(), app or default_app_name(), provider, model, input_tokens, output_tokens,
+            seconds, characters, images, latency, cost,
+        )
+        with self._buffer_lock:
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.batch_size:
+                self._wake.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Usage ledger flush failed: {e}")
+
+    def flush(self):
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        with self._write_lock:
+            self._db.executemany(
+                f"INSERT INTO usage ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                batch
+            )
+            self._db.commit()
+
+    def rollup(self, by=("app", "model"), since=None, until=None):
+        """
+        Totals per group, e.g. rollup(by=("app",)), rollup(by=("model", "hour"), since=time.time() - 86400).
+        Groups can be any of app, provider, model and hour.
+        """
+        for column in by:
+            if column not in GROUP_COLUMNS:
+                raise ValueError(f"Cannot group usage by {column!r}; choose from {GROUP_COLUMNS}")
+        self.flush()
+
+        selected = [
+            "strftime('%Y-%m-%d %H:00', timestamp, 'unixepoch') AS hour" if column == "hour" else column
+            for column in by
+        ]
+        totals = [f"SUM({column}) AS {column}" for column in NUMERIC_COLUMNS]
+        query = (
+            f"SELECT {', '.join(selected + totals)}, COUNT(*) AS calls, AVG(latency) AS avg_latency "
+            "FROM usage WHERE timestamp >= ? AND timestamp < ?"
+        )
+        if by:
+            query += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+
+        params = (since or 0, until or float("inf"))
+        with self._write_lock:
+            cursor = self._db.execute(query, params)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+_ledger = None
+_ledger_lock = Lock()
+
+
+def get_usage_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
+
+
+def record_usage(model, cost=0.0, **usage):
+    """Records one provider call in the process-wide ledger and returns its cost."""
+    try:
+        get_usage_ledger().record(model, cost, **usage)
+    except Exception as e:
+        print(f"Could not record usage for {model}: {e}")
+    return cost
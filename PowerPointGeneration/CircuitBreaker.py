@@ -0,0 +1,136 @@
+import math
+import time
+from collections import deque
+from threading import Lock
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of one provider/model over a sliding window of recent calls.
+
+    closed    → calls go through; opens when the error rate in the window crosses the threshold
+    open      → calls are refused until `open_seconds` have passed
+    half_open → a single probe call is let through; success closes the breaker, failure reopens it
+    """
+
+    def __init__(self, name, window_size=100, window_seconds=120, failure_threshold=0.5,
+                 min_calls=5, open_seconds=30):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+
+        self.state = CLOSED
+        self.opened_at = None
+        self.closed_at = None
+        self._probe_in_flight = False
+        self._calls = deque(maxlen=window_size)  # (timestamp, succeeded, latency)
+        self._lock = Lock()
+
+    def allow_request(self):
+        """Returns True if a call may be sent now. In half-open state only one probe is allowed at a time."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self, latency):
+        with self._lock:
+            self._calls.append((time.monotonic(), True, latency))
+            if self.state == HALF_OPEN:
+                print(f"Circuit {self.name} closed again.")
+                self.state = CLOSED
+                self.opened_at = None
+                self.closed_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def record_failure(self, latency=None):
+        with self._lock:
+            self._calls.append((time.monotonic(), False, latency))
+            if self.state == HALF_OPEN:
+                self._open()
+            elif self.state == CLOSED:
+                calls, failures = self._window_counts()
+                if calls >= self.min_calls and failures / calls >= self.failure_threshold:
+                    self._open()
+
+    def release(self):
+        """Called when a call ends without an outcome (e.g. cancelled because a hedge won)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self):
+        print(f"Circuit {self.name} opened.")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def _window_counts(self):
+        # Failures from before the last recovery no longer count against the model
+        cutoff = time.monotonic() - self.window_seconds
+        if self.closed_at is not None:
+            cutoff = max(cutoff, self.closed_at)
+        recent = [succeeded for timestamp, succeeded, _ in self._calls if timestamp >= cutoff]
+        return len(recent), recent.count(False)
+
+    def latency_samples(self):
+        with self._lock:
+            return sorted(latency for _, succeeded, latency in self._calls if succeeded)
+
+    def latency_percentile(self, percentile):
+        """Returns the given percentile of recent successful call latencies, or None without samples."""
+        samples = self.latency_samples()
+        if not samples:
+            return None
+        index = max(0, math.ceil(percentile / 100 * len(samples)) - 1)
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            calls, failures = self._window_counts()
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+            state = self.state
+        return {
+            "state": state,
+            "calls": calls,
+            "failures": failures,
+            "error_rate": failures / calls if calls else 0.0,
+            "p50_latency": self.latency_percentile(50),
+            "p95_latency": self.latency_percentile(95),
+            "retry_in": retry_in,
+        }
+
+
+_breakers = {}
+_breakers_lock = Lock()
+
+
+def get_circuit_breaker(config):
+    """Returns the process-wide breaker for a model config, shared by every ModelManager instance."""
+    key = f"{config['provider']}:{config['model_name']}"
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(key)
+        return _breakers[key]
+
+
+def circuit_breaker_states():
+    """Returns a snapshot of every breaker, keyed by provider:model."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {key: breaker.snapshot() for key, breaker in breakers.items()}
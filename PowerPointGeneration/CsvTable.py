@@ -0,0 +1,220 @@
+import codecs
+import hashlib
+import re
+from collections import Counter, OrderedDict
+from io import BytesIO
+from threading import Lock
+import numpy as np
+import pandas as pd
+from Tokens import count_tokens, truncate_tokens
+
+CHUNK_ROWS = 20000
+SAMPLE_ROWS = 8
+TOP_VALUES = 3
+MAX_TRACKED_VALUES = 5000
+# Tables up to this size go to the model whole; larger ones as their profile plus matching rows
+INLINE_TOKENS = 6000
+
+
+class CsvTable:
+    """
+    A CSV upload read in chunks of CHUNK_ROWS rows, so memory stays flat however large the file is.
+
+    A table small enough to fit a prompt is sent whole (inline()). For larger ones, describe()
+    returns a compact profile (schema, per-column summaries, sampled rows) and search() rescans
+    the file for the rows that best match a query; context() picks between the two.
+    Column types are inferred from the first chunk and enforced on the rest.
+    """
+
+    def __init__(self, data, chunk_rows=CHUNK_ROWS):
+        self.data = data
+        self.chunk_rows = chunk_rows
+        self.encoding = None
+        self.dtypes = None
+        self._profile = None
+        self._text = None
+
+    def _detect_encoding(self):
+        # Checked block by block so a large file is never decoded into one string
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        block = 1 << 20
+        try:
+            for start in range(0, len(self.data), block):
+                decoder.decode(self.data[start:start + block])
+            decoder.decode(b"", final=True)
+            return "utf-8"
+        except UnicodeDecodeError:
+            return "latin1"
+
+    def _chunks(self):
+        if self.encoding is None:
+            self.encoding = self._detect_encoding()
+        for chunk in pd.read_csv(BytesIO(self.data), chunksize=self.chunk_rows, encoding=self.encoding):
+            if self.dtypes is None:
+                self.dtypes = chunk.dtypes.to_dict()
+            for column, dtype in self.dtypes.items():
+                if column in chunk and pd.api.types.is_numeric_dtype(dtype) \
+                        and not pd.api.types.is_numeric_dtype(chunk[column].dtype):
+                    chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+            yield chunk
+
+    def profile(self):
+        """Single pass over the file: row count, per-column statistics and a uniform sample of rows."""
+        if self._profile is not None:
+            return self._profile
+
+        rows = 0
+        columns = OrderedDict()
+        sample = []
+        rng = np.random.default_rng(0)
+        for chunk in self._chunks():
+            for column in chunk.columns:
+                stats = columns.setdefault(column, {
+                    "numeric": pd.api.types.is_numeric_dtype(self.dtypes.get(column)),
+                    "missing": 0, "min": None, "max": None, "sum": 0.0, "count": 0, "values": Counter(),
+                })
+                values = chunk[column]
+                stats["missing"] += int(values.isna().sum())
+                values = values.dropna()
+                if values.empty:
+                    continue
+                if stats["numeric"]:
+                    low, high = values.min(), values.max()
+                    stats["min"] = low if stats["min"] is None else min(stats["min"], low)
+                    stats["max"] = high if stats["max"] is None else max(stats["max"], high)
+                    stats["sum"] += float(values.sum())
+                    stats["count"] += len(values)
+                else:
+                    stats["values"].update(values.astype(str).value_counts().to_dict())
+                    if len(stats["values"]) > MAX_TRACKED_VALUES:
+                        stats["values"] = Counter(dict(stats["values"].most_common(MAX_TRACKED_VALUES // 2)))
+                        stats["truncated"] = True
+
+            # Reservoir sampling: fill the sample first, then each later row replaces a random slot
+            # with probability SAMPLE_ROWS / rows seen; only the replacing rows are touched
+            fill = min(SAMPLE_ROWS - len(sample), len(chunk))
+            sample.extend(row for _, row in chunk.iloc[:fill].iterrows())
+            if fill < len(chunk):
+                positions = np.arange(rows + fill, rows + len(chunk))
+                slots = rng.integers(0, positions + 1)
+                for offset in np.nonzero(slots < SAMPLE_ROWS)[0]:
+                    sample[slots[offset]] = chunk.iloc[fill + offset]
+            rows += len(chunk)
+
+        sample = pd.DataFrame(sample, columns=list(columns)) if sample else None
+        self._profile = {"rows": rows, "columns": columns, "sample": sample}
+        return self._profile
+
+    def describe(self):
+        profile = self.profile()
+        columns = profile["columns"]
+        lines = [f"CSV table: {profile['rows']} rows x {len(columns)} columns", "Columns:"]
+        for column, stats in columns.items():
+            dtype = self.dtypes.get(column)
+            if stats["numeric"] and stats["count"]:
+                summary = (f"min {stats['min']}, max {stats['max']}, "
+                           f"mean {stats['sum'] / stats['count']:.4g}")
+            elif stats["numeric"]:
+                summary = "no values"
+            else:
+                distinct = len(stats["values"])
+                distinct = f"{distinct}+" if stats.get("truncated") else str(distinct)
+                top = ", ".join(f"{value} ({count})" for value, count in stats["values"].most_common(TOP_VALUES))
+                summary = f"{distinct} distinct, most common: {top}"
+            lines.append(f"- {column} ({dtype}): {summary}; {stats['missing']} missing")
+        if profile["sample"] is not None and not profile["sample"].empty:
+            lines.append("Sample rows:")
+            lines.append(profile["sample"].to_string(index=False))
+        return "\n".join(lines)
+
+    def inline(self, max_tokens=INLINE_TOKENS, model_name="gpt-4o-mini"):
+        """The whole table as text if it fits in `max_tokens`, else None."""
+        # Skips rendering files far too large to fit: a rendered table takes at least about
+        # a token per four bytes of CSV, and the extra factor of four leaves room for error
+        if len(self.data) > max_tokens * 4 * 4:
+            return None
+        if self._text is None:
+            self._text = pd.concat(list(self._chunks())).to_string(index=False)
+        return self._text if count_tokens(self._text, model_name) <= max_tokens else None
+
+    def context(self, query, max_tokens=INLINE_TOKENS, model_name="gpt-4o-mini"):
+        """
+        What to show a model about the table within `max_tokens`: the whole table when it fits,
+        otherwise the profile followed by the rows that best match `query`.
+        """
+        text = self.inline(max_tokens, model_name)
+        if text is not None:
+            return text
+        text = self.describe()
+        rows = self.search(query)
+        if rows:
+            text = f"{text}\nRows matching the request:\n{rows}"
+        return truncate_tokens(text, max_tokens, model_name)
+
+    def search(self, query, k=25):
+        """Returns the k rows sharing the most words with the query, as text (empty if none match)."""
+        terms = sorted(set(re.findall(r"\w+", query.lower())))
+        if not terms:
+            return ""
+        best = None
+        for chunk in self._chunks():
+            cells = [chunk[column].astype(str).fillna("") for column in chunk.columns]
+            rows = cells[0].str.cat(cells[1:], sep=" ").str.lower()
+            scores = sum(rows.str.contains(term, regex=False).astype(int) for term in terms)
+            matched = chunk[scores > 0].assign(_score=scores[scores > 0])
+            best = matched if best is None else pd.concat([best, matched])
+            best = best.nlargest(k, "_score", keep="first")
+        if best is None or best.empty:
+            return ""
+        return best.sort_index().drop(columns="_score").to_string(index=False)
+
+
+_tables = OrderedDict()  # digest of the CSV bytes -> CsvTable, least recently used first
+_aliases = {}  # digest of extracted text -> digest of the CSV bytes it came from
+_tables_lock = Lock()
+MAX_TABLES = 8
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _remember(key, table):
+    """Caller holds _tables_lock. Evicting a table also forgets the texts that pointed at it."""
+    _tables[key] = table
+    _tables.move_to_end(key)
+    while len(_tables) > MAX_TABLES:
+        evicted, _ = _tables.popitem(last=False)
+        for alias in [alias for alias, target in _aliases.items() if target == evicted]:
+            del _aliases[alias]
+
+
+def load_table(data):
+    """The CsvTable for some CSV bytes, shared so a file is profiled once however often it is uploaded."""
+    key = _digest(data)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is not None:
+            _tables.move_to_end(key)
+            return table
+    table = CsvTable(data)
+    with _tables_lock:
+        _remember(key, table)
+    return table
+
+
+def register_table(text, table):
+    """Remembers which CsvTable an extracted table or profile came from, so its rows can be searched later."""
+    key = _digest(table.data)
+    with _tables_lock:
+        _remember(key, table)
+        _aliases[_digest(text.encode("utf-8"))] = key
+
+
+def table_for(text):
+    with _tables_lock:
+        key = _aliases.get(_digest(text.encode("utf-8")))
+        table = _tables.get(key) if key is not None else None
+        if table is not None:
+            _tables.move_to_end(key)
+        return table
@@ -0,0 +1,92 @@
+import os
+import time
+import uuid
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+import streamlit as st
+
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+# Optional: also write every deck to this directory (e.g. a mounted volume) for safekeeping
+DECK_EXPORT_DIR = os.getenv("DECK_EXPORT_DIR")
+
+
+class Deck:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+        self.created = time.time()
+
+
+class DeckStore:
+    """
+    The latest generated deck of each session, held in memory and served from there.
+    Bounded by total bytes; the sessions used least recently lose their deck first.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._decks = OrderedDict()  # session key -> Deck
+        self._bytes = 0
+        self._lock = Lock()
+
+    def put(self, session_key, deck):
+        with self._lock:
+            previous = self._decks.pop(session_key, None)
+            if previous is not None:
+                self._bytes -= len(previous.data)
+            self._decks[session_key] = deck
+            self._bytes += len(deck.data)
+            while self._bytes > self.max_bytes and len(self._decks) > 1:
+                _, evicted = self._decks.popitem(last=False)
+                self._bytes -= len(evicted.data)
+
+    def get(self, session_key):
+        with self._lock:
+            deck = self._decks.get(session_key)
+            if deck is not None:
+                self._decks.move_to_end(session_key)
+            return deck
+
+
+_store = None
+_store_lock = Lock()
+
+
+def get_deck_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DeckStore()
+        return _store
+
+
+def session_key():
+    """Identifies the browser session, so concurrent users never see each other's decks."""
+    if "deck_session_key" not in st.session_state:
+        st.session_state.deck_session_key = uuid.uuid4().hex
+    return st.session_state.deck_session_key
+
+
+def store_deck(prs, filename):
+    """Serializes a Presentation into memory for this session (and DECK_EXPORT_DIR if set). Returns the filename."""
+    buffer = BytesIO()
+    prs.save(buffer)
+    deck = Deck(filename, buffer.getvalue())
+    get_deck_store().put(session_key(), deck)
+
+    if DECK_EXPORT_DIR:
+        try:
+            os.makedirs(DECK_EXPORT_DIR, exist_ok=True)
+            path = os.path.join(DECK_EXPORT_DIR, f"{session_key()}-{int(deck.created)}-{filename}")
+            with open(path, "wb") as f:
+                f.write(deck.data)
+        except OSError as e:
+            print(f"Could not export deck to {DECK_EXPORT_DIR}: {e}")
+    return filename
+
+
+def session_deck():
+    """This session's latest deck, or None if there is none (or it was evicted)."""
+    return get_deck_store().get(session_key())
@@ -0,0 +1,216 @@
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+BODY, PARAGRAPH, TABLE, ROW, CELL = W + "body", W + "p", W + "tbl", W + "tr", W + "tc"
+# Content controls wrap ordinary paragraphs, tables, rows or cells in w:sdt/w:sdtContent
+SDT, SDT_CONTENT = W + "sdt", W + "sdtContent"
+
+# numFmt values rendered as bullets rather than numbers
+BULLET_FORMATS = {"bullet", "none"}
+
+
+class DocxBlock:
+    """
+    One unit of a DOCX file in document order: a "heading", "paragraph", "list" item,
+    "table", "header" or "footer". `level` is the heading or list nesting level.
+    """
+
+    def __init__(self, kind, text, level=0):
+        self.kind = kind
+        self.text = text
+        self.level = level
+
+    def __repr__(self):
+        return f"DocxBlock({self.kind!r}, {self.text[:40]!r}, level={self.level})"
+
+
+def _attribute(element, path):
+    child = element.find(path)
+    return None if child is None else child.get(W + "val")
+
+
+def _paragraph_text(paragraph):
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == W + "t" and node.text:
+            parts.append(node.text)
+        elif node.tag == W + "tab":
+            parts.append("\t")
+        elif node.tag in (W + "br", W + "cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _numbering_formats(archive):
+    """{numId: {ilvl: numFmt}} from word/numbering.xml, so lists render as bullets or numbers."""
+    try:
+        root = ET.fromstring(archive.read("word/numbering.xml"))
+    except KeyError:
+        return {}
+    abstract = {}
+    for definition in root.iter(W + "abstractNum"):
+        abstract[definition.get(W + "abstractNumId")] = {
+            level.get(W + "ilvl"): _attribute(level, W + "numFmt") or "decimal"
+            for level in definition.iter(W + "lvl")
+        }
+    return {
+        number.get(W + "numId"): abstract.get(_attribute(number, W + "abstractNumId"), {})
+        for number in root.iter(W + "num")
+    }
+
+
+def _style_numbering(archive):
+    """
+    {styleId: (numId, ilvl)} from word/styles.xml for paragraph styles that number their
+    paragraphs, such as List Number and List Bullet, following basedOn to inherited numbering.
+    """
+    try:
+        root = ET.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return {}
+    own, based_on = {}, {}
+    for style in root.iter(W + "style"):
+        style_id = style.get(W + "styleId")
+        based_on[style_id] = _attribute(style, W + "basedOn")
+        numbering = style.find(f"{W}pPr/{W}numPr")
+        if numbering is not None:
+            own[style_id] = (_attribute(numbering, W + "numId"), _attribute(numbering, W + "ilvl"))
+    resolved = {}
+    for style_id in based_on:
+        current, seen = style_id, set()
+        while current is not None and current not in own and current not in seen:
+            seen.add(current)
+            current = based_on.get(current)
+        if current in own:
+            resolved[style_id] = own[current]
+    return resolved
+
+
+class _ListCounter:
+    """Running item numbers per list and level; going back up a level restarts the deeper ones."""
+
+    def __init__(self, formats, styles=None):
+        self.formats = formats
+        self.styles = styles or {}
+        self.counts = {}
+
+    def marker(self, num_id, level):
+        counts = self.counts.setdefault(num_id, {})
+        counts[level] = counts.get(level, 0) + 1
+        for deeper in [key for key in counts if key > level]:
+            del counts[deeper]
+        if self.formats.get(num_id, {}).get(str(level), "decimal") in BULLET_FORMATS:
+            return "-"
+        return f"{counts[level]}."
+
+
+def _paragraph_block(paragraph, lists):
+    text = _paragraph_text(paragraph).strip()
+    if not text:
+        return None
+    properties = paragraph.find(W + "pPr")
+    style = (_attribute(properties, W + "pStyle") or "") if properties is not None else ""
+    heading = re.match(r"(?i)^(heading|title)\s*(\d*)", style)
+    if heading:
+        return DocxBlock("heading", text, int(heading.group(2) or 1) if heading.group(1).lower() == "heading" else 0)
+    # Numbering set on the paragraph itself overrides what its style gives it
+    num_id, level = lists.styles.get(style, (None, None))
+    numbering = properties.find(W + "numPr") if properties is not None else None
+    if numbering is not None:
+        num_id = _attribute(numbering, W + "numId") or num_id
+        level = _attribute(numbering, W + "ilvl") or level
+    if num_id and num_id != "0":
+        level = int(level or 0)
+        return DocxBlock("list", f"{'  ' * level}{lists.marker(num_id, level)} {text}", level)
+    return DocxBlock("paragraph", text)
+
+
+def _children(element, tag):
+    """Direct children of `element` with `tag`, including those wrapped in content controls."""
+    for child in element:
+        if child.tag == tag:
+            yield child
+        elif child.tag == SDT:
+            content = child.find(SDT_CONTENT)
+            if content is not None:
+                yield from _children(content, tag)
+
+
+def _table_block(table):
+    """
+    One line per row, cells separated by " | ". A merged cell is stored once in the XML
+    (gridSpan across columns, vMerge continuations below), so it is emitted once here too.
+    A table nested in a cell is part of that cell's text, not rows of its own.
+    """
+    lines = []
+    for row in _children(table, ROW):
+        cells = []
+        for cell in _children(row, CELL):
+            properties = cell.find(W + "tcPr")
+            merge = properties.find(W + "vMerge") if properties is not None else None
+            if merge is not None and merge.get(W + "val") != "restart":
+                continue
+            text = " ".join(filter(None, (_paragraph_text(p).strip() for p in cell.iter(PARAGRAPH))))
+            cells.append(text)
+        if any(cells):
+            lines.append(" | ".join(cells))
+    return DocxBlock("table", "\n".join(lines)) if lines else None
+
+
+def _content_blocks(element, lists):
+    """The blocks of a top-level body element; a content control yields those of what it wraps."""
+    if element.tag == PARAGRAPH:
+        block = _paragraph_block(element, lists)
+        if block is not None:
+            yield block
+    elif element.tag == TABLE:
+        block = _table_block(element)
+        if block is not None:
+            yield block
+    elif element.tag == SDT:
+        content = element.find(SDT_CONTENT)
+        for child in content if content is not None else ():
+            yield from _content_blocks(child, lists)
+
+
+def _part_blocks(archive, names, kind):
+    seen = set()
+    for name in names:
+        root = ET.fromstring(archive.read(name))
+        text = "\n".join(filter(None, (_paragraph_text(p).strip() for p in root.iter(PARAGRAPH))))
+        # First-page and even-page variants usually repeat the default header
+        if text and text not in seen:
+            seen.add(text)
+            yield DocxBlock(kind, text)
+
+
+def iter_docx_blocks(data):
+    """
+    Yields the DocxBlocks of a DOCX file: headers, then the body in document order, then footers.
+
+    The body XML is parsed incrementally and each top-level paragraph, table or content
+    control is released once emitted, so one pass over the file suffices and memory stays flat.
+    """
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        names = archive.namelist()
+        lists = _ListCounter(_numbering_formats(archive), _style_numbering(archive))
+        yield from _part_blocks(archive, sorted(n for n in names if re.match(r"word/header\d*\.xml$", n)), "header")
+
+        depth = 0
+        body_depth = None
+        with archive.open("word/document.xml") as body:
+            for event, element in ET.iterparse(body, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if element.tag == BODY:
+                        body_depth = depth
+                    continue
+                if body_depth is not None and depth == body_depth + 1:
+                    yield from _content_blocks(element, lists)
+                    element.clear()
+                depth -= 1
+
+        yield from _part_blocks(archive, sorted(n for n in names if re.match(r"word/footer\d*\.xml$", n)), "footer")
@@ -0,0 +1,64 @@
+from Tokens import count_tokens, truncate_tokens
+
+# Context window of each model we use, in tokens
+CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128000,
+    "claude-3-haiku-20240307": 200000,
+    "claude-3-5-haiku-20241022": 200000,
+    "claude-3-5-sonnet-20241022": 200000,
+}
+
+
+class PromptAssembler:
+    """
+    Fits the sections of a prompt into a model's token budget.
+
+    Fixed sections (instructions, form fields, the user's question) are always kept.
+    Flexible sections (documents, history, ...) share what is left, highest priority
+    first; the section that no longer fits whole is cut at a token boundary and the
+    rest are dropped. Tokens are counted once, as each section is added.
+
+    The budget is the model's context window minus room for the answer, capped at
+    `max_prompt_tokens` so a large upload does not make every call expensive.
+    """
+
+    def __init__(self, model_name="gpt-4o-mini", max_prompt_tokens=8000, reserve_output=4096):
+        self.model_name = model_name
+        window = CONTEXT_WINDOWS.get(model_name, 16000)
+        self.budget = min(window - reserve_output, max_prompt_tokens)
+        self.fixed_tokens = 0
+        self._sections = []  # (priority, order, name, text, tokens)
+
+    def add_template(self, prompt_template, chain_input):
+        """Counts a prompt template rendered with the given input as a fixed section."""
+        inputs = {name: "" for name in prompt_template.input_variables}
+        inputs.update(chain_input)
+        return self.add("template", prompt_template.invoke(inputs).to_string())
+
+    def add(self, name, text, priority=None):
+        """Adds a section; without a priority it is fixed. Returns its token count."""
+        text = text or ""
+        tokens = count_tokens(text, self.model_name)
+        if priority is None:
+            self.fixed_tokens += tokens
+        else:
+            self._sections.append((priority, len(self._sections), name, text, tokens))
+        return tokens
+
+    def remaining(self):
+        return max(0, self.budget - self.fixed_tokens)
+
+    def fit(self):
+        """Returns {name: text} for every flexible section, cut down to fit the budget."""
+        if self.fixed_tokens > self.budget:
+            print(f"Prompt instructions alone use {self.fixed_tokens} of {self.budget} tokens.")
+        remaining = self.remaining()
+        fitted = {}
+        for _, _, name, text, tokens in sorted(self._sections, key=lambda s: (-s[0], s[1])):
+            if tokens <= remaining:
+                fitted[name] = text
+                remaining -= tokens
+            else:
+                fitted[name] = truncate_tokens(text, remaining, self.model_name)
+                remaining = 0
+        return fitted
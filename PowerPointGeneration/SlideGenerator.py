@@ -2,36 +2,49 @@ import streamlit as st
 import requests
 import os
 import random
+import time
 import base64
 from io import BytesIO
 from dotenv import load_dotenv
 from pptx import Presentation
 from pptx.util import Pt, Inches
-from PIL import Image
 
 #  LangChain & Model Management
-from langchain_openai import ChatOpenAI
+from ModelRegistry import get_chat_model
 from langchain_core.prompts import ChatPromptTemplate
-from Model_Manager import ModelManager
+from Model_Manager import ModelManager, charge
+from UsageLedger import record_usage
 
 #  Configurations & Base Structure
 from BaseApp import BaseApp  # Importing shared UI structure
 from Config import PRIMARY_MODEL, SECONDARY_MODEL
+from SlideImages import IMAGE_TIMEOUT, start_images, collect_images
+from DeckStore import PPTX_MIME, store_deck, session_deck
+from TemplateRegistry import get_template
+from SlideStream import ChatStream, SlideStreamParser
 
 load_dotenv()
 API_KEY = os.getenv("SEGMIND_API_KEY")
 
 #  Function to find the correct text placeholder
-def find_text_placeholder(slide):
-    """Finds the first available text placeholder in a slide."""
+def find_text_placeholder(slide, template=None, layout_index=None):
+    """Finds the first available text placeholder in a slide (by the template's cached placeholder map when given)."""
+    if template is not None:
+        text_frame = template.text_placeholder(slide, layout_index)
+        if text_frame is not None:
+            return text_frame
     for shape in slide.shapes:
         if shape.is_placeholder and ("Content Placeholder" in shape.name or "Text Placeholder" in shape.name):
             return shape.text_frame
     return None  # No text placeholder found
 
 #  Function to find the correct image placeholder
-def find_image_placeholder(slide):
-    """Finds the first available image placeholder in a slide."""
+def find_image_placeholder(slide, template=None, layout_index=None):
+    """Finds the first available image placeholder in a slide (by the template's cached placeholder map when given)."""
+    if template is not None:
+        placeholder = template.image_placeholder(slide, layout_index)
+        if placeholder is not None:
+            return placeholder
     for shape in slide.shapes:
         if shape.is_placeholder and "Picture Placeholder" in shape.name:
             return shape
@@ -48,7 +61,7 @@ def generate_image_stable_diffusion(prompt, negative_prompt="low quality, blurry
         height (int): Height of the generated image in pixels.
 
     Returns:
-        Image or None: The generated image or None if failed.
+        bytes or None: The generated JPEG as returned by the API, or None if failed.
     """
     url = "https://api.segmind.com/v1/stable-diffusion-3.5-turbo-txt2img"
     headers = {"x-api-key": API_KEY}
@@ -71,23 +84,30 @@ def generate_image_stable_diffusion(prompt, negative_prompt="low quality, blurry
         "base64": True
     }
 
+    start_time = time.time()
+    img = None
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = requests.post(url, json=data, headers=headers, timeout=IMAGE_TIMEOUT)
         response.raise_for_status()
         response_data = response.json()
 
         image_base64 = response_data.get("image", "")
         if image_base64:
-            img_data = base64.b64decode(image_base64)
-            img = Image.open(BytesIO(img_data))
-            return img
-        else:
-            return None
+            img = base64.b64decode(image_base64)
     except Exception as e:
         print(f"Stable Diffusion Error: {e}")
-        return None
+    finally:
+        # Segmind bills $0.001 per second of generation
+        duration = time.time() - start_time
+        record_usage(
+            "stable-diffusion-3.5-turbo", duration * 0.001, provider="Segmind", seconds=duration, images=int(img is not None)
+        )
+    return img
 # 🔥 Define Templates Path
 TEMPLATE_DIR = "./Pres_templates"
+
+# Model used to write the slide content
+SLIDE_MODEL = {"provider": "OpenAI", "model_name": "gpt-4o-mini", "temperature": 0.2}
 available_templates = ["Celestial", "Circuit", "Ion", "Mesh", "Retrospect", "Atlas", "Wisp", "Gallery", "Madison", "Organic"]
 
 class SlideGenerator(BaseApp):
@@ -179,97 +199,59 @@ class SlideGenerator(BaseApp):
 
 
 
-    def generate_ppt(self, ai_response):
-        """Creates a PowerPoint presentation using AI response."""
+    def generate_ppt(self, response_chunks):
+        """
+        Creates a PowerPoint presentation from the AI response, given as a stream of text chunks
+        (or one string). Each slide's image is requested as soon as that slide has streamed in.
+        """
         try:
-            content = ai_response.content
-            st.session_state.history.append(content)
-
-            # 🔥 Debug: Store AI Response in Session History
-            lines = content.split("\n")
-
-            # 🔥 Extract Theme, Title, and Subtitle from LLM Response
-            theme = st.session_state.theme  # Directly use selected theme
-            title = None
-            subtitle = None
-
-            slide_numbers = []
-            slide_data = {}  # Store slide data in a structured format
-
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line.startswith("#Slide:"):
-                    slide_num = int(line.replace("#Slide:", "").strip())
-                    slide_numbers.append(slide_num)
-                    slide_data[slide_num] = {
-                        "title": "", "content": [], "image": None, "is_bullet_points": False
-                    }
-                elif line.startswith("#Title:"):
-                    title = line.replace("#Title:", "").strip()
-                elif line.startswith("#Subtitle:"):
-                    subtitle = line.replace("#Subtitle:", "").strip()
-
             # 🔥 Load PowerPoint Template
-            ppt_template = os.path.join(TEMPLATE_DIR, f"{theme}.pptx")
-            prs = Presentation(ppt_template) if os.path.exists(ppt_template) else Presentation()
+            theme = st.session_state.theme  # Directly use selected theme
+            template = get_template(theme)
+            prs = template.new_presentation() if template else Presentation()
+
+            # 🔥 Parse the response as it streams, starting each image while later slides are still written
+            parser = SlideStreamParser()
+            image_futures = {}
+            for slide_num, slide_info in parser.parse(response_chunks):
+                if slide_info["image"] and (slide_info["title"] or slide_info["content"]):
+                    image_futures.update(start_images({slide_num: slide_info["image"]}, generate_image_stable_diffusion))
+            st.session_state.history.append(parser.text)
+            slide_data = parser.slides
 
             # 🔥 Modify First Slide Instead of Adding a New One
             first_slide = prs.slides[0]  # Get the existing first slide
-            first_slide.shapes.title.text = title  # Set the title
+            first_slide.shapes.title.text = parser.title  # Set the title
 
             # Modify subtitle if there's a placeholder
             for shape in first_slide.shapes:
                 if shape.has_text_frame and shape.text_frame.text == "":
-                    shape.text_frame.text = subtitle
+                    shape.text_frame.text = parser.subtitle
                     break  # Stop after setting the first empty placeholder
 
-            # 🔥 Process Lines & Store Slide Data
-            current_slide = None
-            for line in lines:
-                line = line.strip()
-
-                if line.startswith("#Slide:"):
-                    current_slide = int(line.replace("#Slide:", "").strip())
-                    continue
-
-                elif current_slide is not None:
-                    if line.startswith("#Header:"):
-                        slide_data[current_slide]["title"] = line.replace("#Header:", "").strip()
-
-                    elif line.startswith("#Contents:"):
-                        slide_data[current_slide]["is_bullet_points"] = True
-                        slide_data[current_slide]["content"].append(line.replace("#Contents:", "").strip())
-
-                    elif line.startswith("#Content:"):
-                        slide_data[current_slide]["is_bullet_points"] = False
-                        slide_data[current_slide]["content"].append(line.replace("#Content:", "").strip())
-
-                    elif line.startswith("- "):
-                        slide_data[current_slide]["content"].append(line.replace("- ", "").strip())
-
-                    elif line.startswith("#Image:"):
-                        image_suggestion = line.replace("#Image:", "").strip()
-                        slide_data[current_slide]["image"] = None if image_suggestion.lower() == "none" else image_suggestion
+            # 🔥 Lay out slides once their images have resolved
+            images = collect_images(image_futures)
 
             # 🔥 Process Remaining Slides (Avoid Adding Empty Slides)
             slide_count = 0
             valid_slides = []  # Store non-empty slides
 
-            for slide_num in sorted(slide_numbers):
+            for slide_num in sorted(slide_data):
                 slide_info = slide_data[slide_num]
 
                 # ✅ Skip Adding Slide if There's No Title or Content
                 if not slide_info["title"] and not slide_info["content"]:
                     continue
 
-                # 🔥 Choose Slide Layout (Fixed Since No Custom Templates)
-                slide_layout_index = 8 if slide_info["image"] else 1
+                # 🔥 Choose Slide Layout (Fixed Since No Custom Templates; text-only if the image failed)
+                generated_image = images.get(slide_num)
+                slide_layout_index = 8 if generated_image else 1
                 slide = prs.slides.add_slide(prs.slide_layouts[slide_layout_index])
                 slide.shapes.title.text = slide_info["title"]
                 valid_slides.append(slide)
 
                 # 🔥 Find Correct Text Placeholder
-                text_placeholder = find_text_placeholder(slide)
+                text_placeholder = find_text_placeholder(slide, template, slide_layout_index)
 
                 # 🔥 Insert Content
                 if text_placeholder:
@@ -295,39 +277,37 @@ class SlideGenerator(BaseApp):
                     if subtitle_placeholder:
                         subtitle_placeholder.text = "\n".join(slide_info["content"])
 
-                # 🔥 Generate & Insert Image
-                if slide_info["image"]:
-                    prompt = f"You are an AI designed to make pictures for PowerPoint presentations. Make a picture about {slide_info['image']}."
-                    generated_image = generate_image_stable_diffusion(prompt)
-
-                    if generated_image:
-                        img_path = os.path.join("./images", f"{slide_num}.jpg")
-                        generated_image.save(img_path, format="JPEG")
-
-                        image_placeholder = find_image_placeholder(slide)
-
-                        if image_placeholder:
-                            image_placeholder.insert_picture(img_path)
-                        else:
-                            slide.shapes.add_picture(img_path, Inches(1), Inches(2), Inches(6), Inches(4))
+                # 🔥 Insert Image if one was generated
+                if generated_image:
+                    image_placeholder = find_image_placeholder(slide, template, slide_layout_index)
 
-                        os.remove(img_path)
+                    if image_placeholder:
+                        image_placeholder.insert_picture(BytesIO(generated_image))
+                    else:
+                        slide.shapes.add_picture(BytesIO(generated_image), Inches(1), Inches(2), Inches(6), Inches(4))
 
             # 🔥 Cleanup: Remove Empty Slides Before Saving
             slides_to_remove = [s for s in prs.slides if not any(shape.has_text_frame and shape.text_frame.text.strip() for shape in s.shapes)]
             for s in slides_to_remove:
                 prs.slides._sldIdLst.remove(s._element)  # Remove from XML tree
 
-            # 🔥 Save PowerPoint
-            ppt_filename = "Generated_Presentation.pptx"
-            prs.save(ppt_filename)
+            # 🔥 Save PowerPoint to memory, per session (see DeckStore)
+            ppt_filename = store_deck(prs, "Generated_Presentation.pptx")
 
-            return ppt_filename if os.path.exists(ppt_filename) else None
+            return ppt_filename
 
         except Exception as e:
             st.error(f"Error generating PowerPoint: {e}")
             return None
 
+    def charge_stream(self, response):
+        """Records a finished ChatStream's token usage in the usage ledger."""
+        return charge(
+            SLIDE_MODEL["model_name"],
+            response.message.usage_metadata if response.message else None,
+            SLIDE_MODEL["provider"]
+        )
+
     def handle_input(self):
         """Handles user input and generates a PowerPoint presentation."""
 
@@ -337,18 +317,15 @@ class SlideGenerator(BaseApp):
                 st.warning("Please describe the presentation you want.")
                 return
 
-            model = ChatOpenAI(temperature=0.2, model="gpt-4o-mini")
+            model = get_chat_model(SLIDE_MODEL)
 
-            # Generate response using LangChain
+            # Stream the response using LangChain; generate_ppt stores it in session history
             conversation = self.build_conversation()
-            response = model.invoke(conversation)
-
-            # Store the response in session history
-            if response:
-                st.session_state.history.append(response.content)
+            response = ChatStream(model, conversation)
 
             # Generate PowerPoint and save filename in session state
             ppt_filename = self.generate_ppt(response)
+            self.charge_stream(response)
             if ppt_filename:
                 st.session_state.ppt_filename = ppt_filename  # Store filename for later use
                 st.session_state.generate_clicked = False  # Prevent re-triggering
@@ -364,15 +341,12 @@ class SlideGenerator(BaseApp):
                     new_request = f"{last_response}\n\n# User Edits:\n{user_edits}\n\nEnsure the revised presentation follows the exact previous format."
 
                     # Send updated request to LLM
-                    model = ChatOpenAI(temperature=0.2, model="gpt-4o-mini")
-                    response = model.invoke([{"role": "user", "content": new_request}])
-
-                    # Store the new response in session history
-                    if response:
-                        st.session_state.history.append(response.content)
+                    model = get_chat_model(SLIDE_MODEL)
+                    response = ChatStream(model, [{"role": "user", "content": new_request}])
 
                     # Generate new PPT with edits
                     ppt_filename = self.generate_ppt(response)
+                    self.charge_stream(response)
 
                     if ppt_filename:
                         st.session_state.ppt_filename = ppt_filename
@@ -381,10 +355,11 @@ class SlideGenerator(BaseApp):
 
         # Ensure "Make Edits" button is always visible if a presentation exists
         if "ppt_filename" in st.session_state and st.session_state.ppt_filename:
-
-            with open(st.session_state.ppt_filename, "rb") as f:
-                st.download_button("📥 Download Presentation", f, st.session_state.ppt_filename,
-                                   "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+            deck = session_deck()
+            if deck:
+                st.download_button("📥 Download Presentation", deck.data, deck.filename, PPTX_MIME)
+            else:
+                st.info("This presentation is no longer in memory; generate it again to download it.")
 
             # Only show "Make Edits" if we're NOT in edit mode
             if "show_edit_button" in st.session_state and st.session_state.show_edit_button:
@@ -5,19 +5,18 @@ import random
 import time  
 from dotenv import load_dotenv
 from BaseApp import BaseApp  
-from langchain_openai import ChatOpenAI
+from ModelRegistry import get_chat_model
+from Model_Manager import charge
+from UsageLedger import record_usage
+from Tokens import count_tokens
+from SlideImages import IMAGE_TIMEOUT, start_images, collect_images
+from DeckStore import PPTX_MIME, store_deck, session_deck
+from SlideStream import ChatStream, SlideStreamParser
+from TemplateRegistry import get_template
 from pptx import Presentation
 from pptx.util import Pt, Inches
 import base64
 from io import BytesIO
-from PIL import Image
-
-# ---- NEW IMPORT for token counting
-try:
-    import tiktoken
-except ImportError:
-    tiktoken = None
-
 
 # Load environment variables
 load_dotenv()
@@ -43,65 +42,48 @@ if "cost" not in st.session_state:
 if "total_cost" not in st.session_state:
     st.session_state.total_cost = 0.0
 
-# GPT-4o-mini cost rates in USD per token
-GPT4O_MINI_INPUT_COST = 0.00000015  # $0.150 / 1,000,000
-GPT4O_MINI_OUTPUT_COST = 0.00000060 # $0.600 / 1,000,000
-
-
 # ------------------ HELPER: Token Counting ------------------
-def approximate_token_count(text_or_messages, model="gpt-3.5-turbo"):
+def approximate_token_count(text_or_messages, model="gpt-4o-mini"):
     """
-    Approximates the number of tokens for a string or list of messages using tiktoken.
-    If tiktoken is unavailable, returns 0.
-    
+    Counts the tokens of a string or list of messages with the model's cached tiktoken encoder.
+
     Args:
         text_or_messages: Either a single string or a list of dict messages like:
             [{"role": "system", "content": "..."}, {"role": "user", "content": "..."}]
         model (str): Model name for the tiktoken encoder selection.
 
     Returns:
-        int: Approximate number of tokens.
+        int: Number of tokens.
     """
-    if not tiktoken:
-        # If we can't import tiktoken, just return 0
-        return 0
-
-    # For Azure or unknown model naming you might need a fallback. 
-    # We'll just try to get gpt-3.5 or gpt-4 default encoders
-    try:
-        enc = tiktoken.encoding_for_model(model)
-    except:
-        enc = tiktoken.get_encoding("cl100k_base")
-
-    # If it's a list of messages, join them in the typical ChatOpenAI format
     if isinstance(text_or_messages, list):
-        # We'll simulate approximate chat format
-        # There's an official formula from OpenAI but let's do a simple approach:
-        text_to_encode = ""
-        for msg in text_or_messages:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
-            text_to_encode += f"{role}: {content}\n"
-    else:
-        # It's just a single string
-        text_to_encode = text_or_messages
-
-    tokens = enc.encode(text_to_encode)
-    return len(tokens)
+        # Count each message separately so repeated system prompts hit the count cache
+        return sum(
+            count_tokens(f"{msg.get('role', '')}: {msg.get('content', '')}\n", model)
+            for msg in text_or_messages
+        )
+    return count_tokens(text_or_messages, model)
 # -----------------------------------------------------------
 
 
 # 🔥 Function to find the correct text placeholder
-def find_text_placeholder(slide):
-    """Finds the first available text placeholder in a slide."""
+def find_text_placeholder(slide, template=None, layout_index=None):
+    """Finds the first available text placeholder in a slide (by the template's cached placeholder map when given)."""
+    if template is not None:
+        text_frame = template.text_placeholder(slide, layout_index)
+        if text_frame is not None:
+            return text_frame
     for shape in slide.shapes:
         if shape.is_placeholder and ("Content Placeholder" in shape.name or "Text Placeholder" in shape.name):
             return shape.text_frame
     return None  # No text placeholder found
 
 # 🔥 Function to find the correct image placeholder
-def find_image_placeholder(slide):
-    """Finds the first available image placeholder in a slide."""
+def find_image_placeholder(slide, template=None, layout_index=None):
+    """Finds the first available image placeholder in a slide (by the template's cached placeholder map when given)."""
+    if template is not None:
+        placeholder = template.image_placeholder(slide, layout_index)
+        if placeholder is not None:
+            return placeholder
     for shape in slide.shapes:
         if shape.is_placeholder and "Picture Placeholder" in shape.name:
             return shape
@@ -112,6 +94,7 @@ def generate_image_stable_diffusion(prompt, negative_prompt="low quality, blurry
     """
     Generates an image using Stable Diffusion with the specified prompt and dimensions.
     Times the request duration to calculate cost at $0.001 per second.
+    Runs on a SlideImages worker thread, so the cost is returned rather than added to the session.
 
     Args:
         prompt (str): The description of the image to generate.
@@ -120,7 +103,7 @@ def generate_image_stable_diffusion(prompt, negative_prompt="low quality, blurry
         height (int): Height of the generated image in pixels.
 
     Returns:
-        Image or None: The generated image or None if failed.
+        tuple: (bytes or None, cost) - the generated JPEG as returned by the API (None if failed), and the cost of the call.
     """
     url = "https://api.segmind.com/v1/stable-diffusion-3.5-turbo-txt2img"
     headers = {"x-api-key": API_KEY}
@@ -145,33 +128,34 @@ def generate_image_stable_diffusion(prompt, negative_prompt="low quality, blurry
 
     # 🔥 Begin timing for cost calculation
     start_time = time.time()
+    img = None
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = requests.post(url, json=data, headers=headers, timeout=IMAGE_TIMEOUT)
         response.raise_for_status()
         response_data = response.json()
 
         image_base64 = response_data.get("image", "")
         if image_base64:
-            img_data = base64.b64decode(image_base64)
-            img = Image.open(BytesIO(img_data))
-            return img
-        else:
-            return None
+            img = base64.b64decode(image_base64)
     except Exception as e:
         print(f"Stable Diffusion Error: {e}")
-        return None
     finally:
         # 🔥 End timing and increment image cost
         end_time = time.time()
         duration = end_time - start_time  # seconds
         # cost at $0.001 per second
-        cost_for_this_call = duration * 0.001
+        cost_for_this_call = record_usage(
+            "stable-diffusion-3.5-turbo", duration * 0.001, provider="Segmind", seconds=duration, images=int(img is not None)
+        )
         print(f"[Image] Duration={duration:.2f}s  => cost=${cost_for_this_call}")
-        st.session_state.img_cost += cost_for_this_call
+    return img, cost_for_this_call
 
 
 # 🔥 Define Templates Path
 TEMPLATE_DIR = "./Pres_templates"
+
+# Model used to write the slide content
+SLIDE_MODEL = {"provider": "OpenAI", "model_name": "gpt-4o-mini", "temperature": 0.2}
 available_templates = [
     "Celestial", "Circuit", "Ion", "Mesh", "Retrospect", 
     "Atlas", "Wisp", "Gallery", "Madison", "Organic"
@@ -262,105 +246,61 @@ class SlideGenerator(BaseApp):
             }
         ]
 
-    def generate_ppt(self, ai_response):
-        """Creates a PowerPoint presentation using AI response."""
+    def generate_ppt(self, response_chunks):
+        """
+        Creates a PowerPoint presentation from the AI response, given as a stream of text chunks
+        (or one string). Each slide's image is requested as soon as that slide has streamed in.
+        """
         try:
-            content = ai_response.content
-            st.session_state.history.append(content)
-
-            lines = content.split("\n")
-
-            theme = st.session_state.theme  # Directly use selected theme
-            title = None
-            subtitle = None
-
-            slide_numbers = []
-            slide_data = {}  # Store slide data in a structured format
-
-            # 🔥 Extract Title and Subtitle from lines
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line.startswith("#Slide:"):
-                    slide_num = int(line.replace("#Slide:", "").strip())
-                    slide_numbers.append(slide_num)
-                    slide_data[slide_num] = {
-                        "title": "", 
-                        "content": [], 
-                        "image": None, 
-                        "is_bullet_points": False
-                    }
-                elif line.startswith("#Title:"):
-                    title = line.replace("#Title:", "").strip()
-                elif line.startswith("#Subtitle:"):
-                    subtitle = line.replace("#Subtitle:", "").strip()
-
             # 🔥 Load PowerPoint Template
-            ppt_template = os.path.join(TEMPLATE_DIR, f"{theme}.pptx")
-            prs = Presentation(ppt_template) if os.path.exists(ppt_template) else Presentation()
+            theme = st.session_state.theme  # Directly use selected theme
+            template = get_template(theme)
+            prs = template.new_presentation() if template else Presentation()
+
+            # 🔥 Parse the response as it streams, starting each image while later slides are still written
+            parser = SlideStreamParser()
+            image_futures = {}
+            for slide_num, slide_info in parser.parse(response_chunks):
+                if slide_info["image"] and (slide_info["title"] or slide_info["content"]):
+                    image_futures.update(start_images({slide_num: slide_info["image"]}, generate_image_stable_diffusion))
+            st.session_state.history.append(parser.text)
+            slide_data = parser.slides
 
             # 🔥 Modify First Slide Instead of Adding a New One
             first_slide = prs.slides[0]  # Get the existing first slide
-            first_slide.shapes.title.text = title  # Set the title
+            first_slide.shapes.title.text = parser.title  # Set the title
 
             # Modify subtitle if there's a placeholder
             for shape in first_slide.shapes:
                 if shape.has_text_frame and shape.text_frame.text == "":
-                    shape.text_frame.text = subtitle
+                    shape.text_frame.text = parser.subtitle
                     break
 
-            # 🔥 Process Lines & Store Slide Data
-            current_slide = None
-            for line in lines:
-                line = line.strip()
-
-                if line.startswith("#Slide:"):
-                    current_slide = int(line.replace("#Slide:", "").strip())
-                    continue
-
-                elif current_slide is not None:
-                    if line.startswith("#Header:"):
-                        slide_data[current_slide]["title"] = line.replace("#Header:", "").strip()
-
-                    elif line.startswith("#Contents:"):
-                        slide_data[current_slide]["is_bullet_points"] = True
-                        slide_data[current_slide]["content"].append(
-                            line.replace("#Contents:", "").strip()
-                        )
-
-                    elif line.startswith("#Content:"):
-                        slide_data[current_slide]["is_bullet_points"] = False
-                        slide_data[current_slide]["content"].append(
-                            line.replace("#Content:", "").strip()
-                        )
-
-                    elif line.startswith("- "):
-                        slide_data[current_slide]["content"].append(
-                            line.replace("- ", "").strip()
-                        )
-
-                    elif line.startswith("#Image:"):
-                        image_suggestion = line.replace("#Image:", "").strip()
-                        slide_data[current_slide]["image"] = (
-                            None if image_suggestion.lower() == "none" else image_suggestion
-                        )
+            # 🔥 Lay out slides once their images have resolved
+            images = {}
+            for slide_num, result in collect_images(image_futures).items():
+                if result is not None:
+                    images[slide_num], cost = result
+                    st.session_state.img_cost += cost
 
             # 🔥 Build Slides
             valid_slides = []
-            for slide_num in sorted(slide_numbers):
+            for slide_num in sorted(slide_data):
                 slide_info = slide_data[slide_num]
 
                 # ✅ Skip Adding Slide if There's No Title or Content
                 if not slide_info["title"] and not slide_info["content"]:
                     continue
 
-                # 🔥 Choose Slide Layout
-                slide_layout_index = 8 if slide_info["image"] else 1
+                # 🔥 Choose Slide Layout (text-only if the image failed or timed out)
+                generated_image = images.get(slide_num)
+                slide_layout_index = 8 if generated_image else 1
                 slide = prs.slides.add_slide(prs.slide_layouts[slide_layout_index])
                 slide.shapes.title.text = slide_info["title"]
                 valid_slides.append(slide)
 
                 # 🔥 Find Correct Text Placeholder
-                text_placeholder = find_text_placeholder(slide)
+                text_placeholder = find_text_placeholder(slide, template, slide_layout_index)
 
                 # 🔥 Insert Content
                 if text_placeholder:
@@ -385,26 +325,14 @@ class SlideGenerator(BaseApp):
                     if subtitle_placeholder:
                         subtitle_placeholder.text = "\n".join(slide_info["content"])
 
-                # 🔥 Generate & Insert Image if needed
-                if slide_info["image"]:
-                    prompt = (
-                        f"You are an AI designed to make pictures for PowerPoint presentations. "
-                        f"Make a picture about {slide_info['image']}."
-                    )
-                    generated_image = generate_image_stable_diffusion(prompt)
-
-                    if generated_image:
-                        img_path = os.path.join("./images", f"{slide_num}.jpg")
-                        generated_image.save(img_path, format="JPEG")
-
-                        image_placeholder = find_image_placeholder(slide)
-                        if image_placeholder:
-                            image_placeholder.insert_picture(img_path)
-                        else:
-                            # fallback if placeholder doesn't exist
-                            slide.shapes.add_picture(img_path, Inches(1), Inches(2), Inches(6), Inches(4))
-
-                        os.remove(img_path)
+                # 🔥 Insert Image if one was generated
+                if generated_image:
+                    image_placeholder = find_image_placeholder(slide, template, slide_layout_index)
+                    if image_placeholder:
+                        image_placeholder.insert_picture(BytesIO(generated_image))
+                    else:
+                        # fallback if placeholder doesn't exist
+                        slide.shapes.add_picture(BytesIO(generated_image), Inches(1), Inches(2), Inches(6), Inches(4))
 
             # 🔥 Cleanup: Remove Empty Slides
             slides_to_remove = [
@@ -414,10 +342,9 @@ class SlideGenerator(BaseApp):
             for s in slides_to_remove:
                 prs.slides._sldIdLst.remove(s._element)
 
-            # 🔥 Save PowerPoint
-            ppt_filename = "Generated_Presentation.pptx"
-            prs.save(ppt_filename)
-            return ppt_filename if os.path.exists(ppt_filename) else None
+            # 🔥 Save PowerPoint to memory, per session (see DeckStore)
+            ppt_filename = store_deck(prs, "Generated_Presentation.pptx")
+            return ppt_filename
 
         except Exception as e:
             st.error(f"Error generating PowerPoint: {e}")
@@ -435,31 +362,28 @@ class SlideGenerator(BaseApp):
             #      and measure input tokens
             # ---------------------
             conversation = self.build_conversation()
-            input_token_count = approximate_token_count(conversation, model="gpt-4")
+            input_token_count = approximate_token_count(conversation, model=SLIDE_MODEL["model_name"])
 
             # 🔥 Create the model
-            model = ChatOpenAI(temperature=0.2, model="gpt-4o-mini")
+            model = get_chat_model(SLIDE_MODEL)
 
-            # 2) Generate response using LangChain
-            response = model.invoke(conversation)
+            # 2) Stream the response using LangChain; generate_ppt builds the deck as it arrives
+            response = ChatStream(model, conversation)
+            ppt_filename = self.generate_ppt(response)
 
             # 3) Count the output tokens (approx)
-            output_token_count = approximate_token_count(response.content, model="gpt-4")
-
-            # 4) Calculate cost for GPT-4o-mini
-            cost_in = input_token_count * GPT4O_MINI_INPUT_COST
-            cost_out = output_token_count * GPT4O_MINI_OUTPUT_COST
-            total_gpt_cost = cost_in + cost_out
+            output_text = response.message.content if response.message else ""
+            output_token_count = approximate_token_count(output_text, model=SLIDE_MODEL["model_name"])
+
+            # 4) Calculate cost for GPT-4o-mini (reported usage, approximated if missing)
+            total_gpt_cost = charge(
+                SLIDE_MODEL["model_name"],
+                (response.message and response.message.usage_metadata) or {"input_tokens": input_token_count, "output_tokens": output_token_count},
+                provider=SLIDE_MODEL["provider"]
+            )
             # Add it to the main cost
             st.session_state.cost += total_gpt_cost
 
-            # ---------------------
-            #   Continue as before
-            # ---------------------
-            if response:
-                st.session_state.history.append(response.content)
-
-            ppt_filename = self.generate_ppt(response)
             if ppt_filename:
                 st.session_state.ppt_filename = ppt_filename
                 st.session_state.generate_clicked = False
@@ -492,25 +416,25 @@ class SlideGenerator(BaseApp):
 
                     # We have a single user message here
                     edits_conversation = [{"role": "user", "content": new_request}]
-                    input_tokens_for_edits = approximate_token_count(edits_conversation, model="gpt-4o-mini")
+                    input_tokens_for_edits = approximate_token_count(edits_conversation, model=SLIDE_MODEL["model_name"])
 
-                    # Send updated request to LLM
-                    model = ChatOpenAI(temperature=0.2, model="gpt-4o-mini")
-                    response = model.invoke(edits_conversation)
+                    # Stream the updated request from the LLM into a new deck
+                    model = get_chat_model(SLIDE_MODEL)
+                    response = ChatStream(model, edits_conversation)
+                    ppt_filename = self.generate_ppt(response)
 
                     # measure output tokens
-                    out_tokens_for_edits = approximate_token_count(response.content, model="gpt-4o-mini")
+                    output_text = response.message.content if response.message else ""
+                    out_tokens_for_edits = approximate_token_count(output_text, model=SLIDE_MODEL["model_name"])
 
                     # cost for these edits
-                    cost_in = input_tokens_for_edits * GPT4O_MINI_INPUT_COST
-                    cost_out = out_tokens_for_edits * GPT4O_MINI_OUTPUT_COST
-                    edit_cost = cost_in + cost_out
+                    edit_cost = charge(
+                        SLIDE_MODEL["model_name"],
+                        (response.message and response.message.usage_metadata) or {"input_tokens": input_tokens_for_edits, "output_tokens": out_tokens_for_edits},
+                        provider=SLIDE_MODEL["provider"]
+                    )
                     st.session_state.cost += edit_cost
 
-                    if response:
-                        st.session_state.history.append(response.content)
-
-                    ppt_filename = self.generate_ppt(response)
                     if ppt_filename:
                         st.session_state.ppt_filename = ppt_filename
                         st.session_state.edit_mode = False
@@ -528,13 +452,11 @@ class SlideGenerator(BaseApp):
 
         # Ensure "Make Edits" button is always visible if a presentation exists
         if "ppt_filename" in st.session_state and st.session_state.ppt_filename:
-            with open(st.session_state.ppt_filename, "rb") as f:
-                st.download_button(
-                    "📥 Download Presentation",
-                    f,
-                    st.session_state.ppt_filename,
-                    "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                )
+            deck = session_deck()
+            if deck:
+                st.download_button("📥 Download Presentation", deck.data, deck.filename, PPTX_MIME)
+            else:
+                st.info("This presentation is no longer in memory; generate it again to download it.")
 
             # Only show "Make Edits" if we're NOT in edit mode
             if "show_edit_button" in st.session_state and st.session_state.show_edit_button:
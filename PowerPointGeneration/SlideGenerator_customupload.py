@@ -2,36 +2,48 @@ import streamlit as st
 import requests
 import os
 import random
+import time
 import base64
 from io import BytesIO
 from dotenv import load_dotenv
-from pptx import Presentation
 from pptx.util import Pt, Inches
-from PIL import Image
 
 #  LangChain & Model Management
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from Model_Manager import ModelManager
+from UsageLedger import record_usage
 
 #  Configurations & Base Structure
 from BaseApp import BaseApp  # Importing shared UI structure
 from Config import PRIMARY_MODEL, SECONDARY_MODEL
+from SlideImages import IMAGE_TIMEOUT, start_images, collect_images
+from DeckStore import PPTX_MIME, store_deck, session_deck
+from TemplateRegistry import TEMPLATE_DIR, get_template, template_from_bytes
+from SlideStream import SlideStreamParser
 
 load_dotenv()
 API_KEY = os.getenv("SEGMIND_API_KEY")
 
 #  Function to find the correct text placeholder
-def find_text_placeholder(slide):
-    """Finds the first available text placeholder in a slide."""
+def find_text_placeholder(slide, template=None, layout_index=None):
+    """Finds the first available text placeholder in a slide (by the template's cached placeholder map when given)."""
+    if template is not None:
+        text_frame = template.text_placeholder(slide, layout_index)
+        if text_frame is not None:
+            return text_frame
     for shape in slide.shapes:
         if shape.is_placeholder and ("Content Placeholder" in shape.name or "Text Placeholder" in shape.name):
             return shape.text_frame
     return None  # No text placeholder found
 
 #  Function to find the correct image placeholder
-def find_image_placeholder(slide):
-    """Finds the first available image placeholder in a slide."""
+def find_image_placeholder(slide, template=None, layout_index=None):
+    """Finds the first available image placeholder in a slide (by the template's cached placeholder map when given)."""
+    if template is not None:
+        placeholder = template.image_placeholder(slide, layout_index)
+        if placeholder is not None:
+            return placeholder
     for shape in slide.shapes:
         if shape.is_placeholder and "Picture Placeholder" in shape.name:
             return shape
@@ -48,7 +60,7 @@ def generate_image_stable_diffusion(prompt, negative_prompt="low quality, blurry
         height (int): Height of the generated image in pixels.
 
     Returns:
-        Image or None: The generated image or None if failed.
+        bytes or None: The generated JPEG as returned by the API, or None if failed.
     """
     url = "https://api.segmind.com/v1/stable-diffusion-3.5-turbo-txt2img"
     headers = {"x-api-key": API_KEY}
@@ -71,50 +83,48 @@ def generate_image_stable_diffusion(prompt, negative_prompt="low quality, blurry
         "base64": True
     }
 
+    start_time = time.time()
+    img = None
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = requests.post(url, json=data, headers=headers, timeout=IMAGE_TIMEOUT)
         response.raise_for_status()
         response_data = response.json()
 
         image_base64 = response_data.get("image", "")
         if image_base64:
-            img_data = base64.b64decode(image_base64)
-            img = Image.open(BytesIO(img_data))
-            return img
-        else:
-            return None
+            img = base64.b64decode(image_base64)
     except Exception as e:
         print(f"Stable Diffusion Error: {e}")
-        return None
+    finally:
+        # Segmind bills $0.001 per second of generation
+        duration = time.time() - start_time
+        record_usage(
+            "stable-diffusion-3.5-turbo", duration * 0.001, provider="Segmind", seconds=duration, images=int(img is not None)
+        )
+    return img
+
+def load_template(template_name):
+    """
+    The parsed template for a built-in name, or the session's uploaded template for "Custom Upload".
+    Either way it is parsed once and reused across reruns (see TemplateRegistry).
+    """
+    if template_name == "Custom Upload":
+        uploaded_template = st.session_state.get("uploaded_template")
+        return template_from_bytes(uploaded_template.getvalue()) if uploaded_template else None
+    return get_template(template_name)
 
 def get_slide_layouts(template_name):
     """
     Extracts all available slide layout names from a given PowerPoint template.
 
     Args:
-        template_name (str): Name of the template file (without .pptx extension).
+        template_name (str): Name of the template file (without .pptx extension), or "Custom Upload".
 
     Returns:
         list: A list of available slide layouts formatted for the LLM.
     """
-    template_path = os.path.join(TEMPLATE_DIR, f"{template_name}.pptx")
-
-    # ✅ Check if the template file exists
-    if not os.path.exists(template_path):
-        print(f"❌ Template '{template_name}' not found in {TEMPLATE_DIR}")
-        return []
-
-    # ✅ Open the PowerPoint template
-    prs = Presentation(template_path)
-
-    # ✅ Extract all slide layout names
-    layouts = []
-    for i, layout in enumerate(prs.slide_layouts):
-        # Some layouts may not have names, assign generic numbering
-        layout_name = layout.name if layout.name else f"Layout {i+1}"
-        layouts.append({"slide_number": i, "layout_name": layout_name})
-
-    return layouts
+    template = load_template(template_name)
+    return template.layouts if template else []
 
 
 class SlideGenerator(BaseApp):
@@ -172,8 +182,8 @@ class SlideGenerator(BaseApp):
             if st.button("🎨 Generate Slides"):
                 st.session_state.generate_clicked = True
 
-    def generate_prompt(self):
-        """Generate a structured prompt for AI."""
+    def layout_text(self):
+        """The selected template's slide layouts, formatted for the prompt's {layout_text}."""
 
         # 🔥 Ensure final_template is a valid string before using os.path.basename
         template_name = "Custom Upload" if st.session_state.final_template == "Custom Upload" else os.path.basename(st.session_state.final_template).replace(".pptx", "")
@@ -182,8 +192,10 @@ class SlideGenerator(BaseApp):
         slide_layouts = get_slide_layouts(template_name)
 
         # 🔥 Format slide layouts for LLM understanding
-        layout_text = "\n".join([f"- {layout['layout_name']} (SlideType: {layout['slide_number']})" for layout in slide_layouts])
+        return "\n".join([f"- {layout['layout_name']} (SlideType: {layout['slide_number']})" for layout in slide_layouts])
 
+    def generate_prompt(self):
+        """Generate a structured prompt for AI; fill it with num_slides, presentation_request and layout_text."""
         return ChatPromptTemplate.from_template("""
         You are an AI that generates structured PowerPoint slide content.
         When needed, suggest a detailed image description that can be used to generate an image and add it to the slide. The number of images should not exceed half the number of slides.
@@ -224,45 +236,27 @@ class SlideGenerator(BaseApp):
         subject {presentation_request}
         available slide layouts:
         {layout_text}
-        """).format(num_slides=st.session_state.num_slides, presentation_request=st.session_state.presentation_request, layout_text=layout_text)
+        """)
 
 
-    def generate_ppt(self, ai_response):
-        """Creates a PowerPoint presentation using AI response."""
+    def generate_ppt(self, response_chunks):
+        """
+        Creates a PowerPoint presentation from the AI response, given as a stream of text chunks
+        (or one string). Each slide's image is requested as soon as that slide has streamed in.
+        """
         try:
-            content = ai_response.content
-            st.session_state.history.append(content)
-
-            lines = content.split("\n")
-
-            #  Extract all slide numbers from the LLM response
-            slide_numbers = []
-            slide_data = {}  # Store slide data in a structured format
-
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line.startswith("#Slide:"):
-                    slide_num = int(line.replace("#Slide:", "").strip())
-                    slide_numbers.append(slide_num)
-                    slide_data[slide_num] = {"title": "", "content": [], "image": None, "slidetype": None, "is_bullet_points": False}
-
-            #  Ensure the uploaded template is saved before loading
-            temp_template_path = os.path.join(TEMPLATE_DIR, "temp_uploaded.pptx")
+            #  Load the template (uploaded templates are read from memory, never written to disk)
             if "uploaded_template" in st.session_state and st.session_state.uploaded_template:
-                with open(temp_template_path, "wb") as f:
-                    f.write(st.session_state.uploaded_template.getbuffer())  # Save session file to disk
-
-                ppt_template = temp_template_path  # Use temporary uploaded template
                 theme = "Custom Upload"  #  Set theme correctly
             else:
-                ppt_template = st.session_state.final_template  # Use predefined template
                 theme = st.session_state.selected_template  #  Ensure theme is defined
+            template = load_template(theme)
 
-            #  Ensure template file exists before proceeding
-            if not os.path.exists(ppt_template):
-                raise FileNotFoundError(f"❌ Template '{ppt_template}' not found!")
+            #  Ensure template exists before proceeding
+            if template is None:
+                raise FileNotFoundError(f"❌ Template '{theme}' not found!")
 
-            prs = Presentation(ppt_template)
+            prs = template.new_presentation()
 
             #  If a custom template is used, remove extra slides and keep only the first one
             if theme not in available_templates and len(prs.slides) > 1:
@@ -271,50 +265,25 @@ class SlideGenerator(BaseApp):
                     prs.part.drop_rel(rId)  # Remove the reference
                     del prs.slides._sldIdLst[1]  # Delete slide from slide list
 
-            #  Process Lines & Store Slide Data
-            current_slide = None
-            for line in lines:
-                line = line.strip()
-
-                if line.startswith("#Slide:"):
-                    current_slide = int(line.replace("#Slide:", "").strip())
-                    continue
-
-                elif current_slide is not None:
-                    if line.startswith("#Title:"):
-                        slide_data[current_slide]["title"] = line.replace("#Title:", "").strip()
+            #  Parse the response as it streams, starting each image while later slides are still written
+            parser = SlideStreamParser()
+            image_futures = {}
+            for slide_num, slide_info in parser.parse(response_chunks):
+                if slide_info["image"] and slide_num != 1:
+                    image_futures.update(start_images({slide_num: slide_info["image"]}, generate_image_stable_diffusion))
+            st.session_state.history.append(parser.text)
+            slide_data = parser.slides
 
-                    elif line.startswith("#Subtitle:"):
-                        slide_data[current_slide]["subtitle"] = line.replace("#Subtitle:", "").strip()
+            #  Lay out slides once their images have resolved
+            images = collect_images(image_futures)
 
-                    elif line.startswith("#Header:"):
-                        slide_data[current_slide]["title"] = line.replace("#Header:", "").strip()
-
-                    elif line.startswith("#Contents:"):
-                        slide_data[current_slide]["is_bullet_points"] = True
-                        slide_data[current_slide]["content"].append(line.replace("#Contents:", "").strip())
-
-                    elif line.startswith("#Content:"):
-                        slide_data[current_slide]["is_bullet_points"] = False
-                        slide_data[current_slide]["content"].append(line.replace("#Content:", "").strip())
-
-                    elif line.startswith("- "):
-                        slide_data[current_slide]["content"].append(line.replace("- ", "").strip())
-
-                    elif line.startswith("#Image:"):
-                        image_suggestion = line.replace("#Image:", "").strip()
-                        slide_data[current_slide]["image"] = None if image_suggestion.lower() == "none" else image_suggestion
-
-                    elif line.startswith("#Slidetype:"):
-                        slide_data[current_slide]["slidetype"] = int(line.replace("#Slidetype:", "").strip())
-
-            for slide_num in sorted(slide_numbers):
+            for slide_num in sorted(slide_data):
                 slide_info = slide_data[slide_num]
 
                 if slide_num == 1:
                     #  Title Slide
                     first_slide = prs.slides[0]
-                    first_slide.shapes.title.text = slide_info["title"]
+                    first_slide.shapes.title.text = slide_info["title"] or parser.title
 
                     subtitle_placeholder = None
                     for shape in first_slide.shapes:
@@ -331,12 +300,14 @@ class SlideGenerator(BaseApp):
 
                 else:
                     #  Content Slides
-                    slide = prs.slides.add_slide(prs.slide_layouts[int(slide_info["slidetype"])])
+                    #  Missing or out-of-range slide types fall back to a default layout
+                    slide_layout_index = template.layout_index(slide_info["slidetype"], bool(images.get(slide_num)))
+                    slide = prs.slides.add_slide(prs.slide_layouts[slide_layout_index])
 
                     slide.shapes.title.text = slide_info["title"]
 
                     #  Find Correct Text Placeholder
-                    text_placeholder = find_text_placeholder(slide)
+                    text_placeholder = find_text_placeholder(slide, template, slide_layout_index)
 
                     #  Insert Content
                     if text_placeholder:
@@ -363,37 +334,20 @@ class SlideGenerator(BaseApp):
                             subtitle_placeholder.text = "\n".join(slide_info["content"])
 
 
-                    #  Generate & Insert Image
-                    if slide_info["image"]:
-                        prompt = f"You are an AI designed to make pictures for PowerPoint presentations. Make a picture about {slide_info['image']}."
-                        generated_image = generate_image_stable_diffusion(prompt)
-
-                        if generated_image:
-                            img_path = os.path.join("./images", f"{slide_num}.jpg")
-                            generated_image.save(img_path, format="JPEG")
-
-                            image_placeholder = find_image_placeholder(slide)
+                    #  Insert Image if one was generated (the slide keeps its text if it failed)
+                    generated_image = images.get(slide_num)
+                    if generated_image:
+                        image_placeholder = find_image_placeholder(slide, template, slide_layout_index)
 
-                            if image_placeholder:
-                                image_placeholder.insert_picture(img_path)
-                            else:
-                                slide.shapes.add_picture(img_path, Inches(1), Inches(2), Inches(6), Inches(4))
-
-                            os.remove(img_path)
-
-            #  Save PowerPoint
-            ppt_filename = "Generated_Presentation.pptx"
-            prs.save(ppt_filename)
+                        if image_placeholder:
+                            image_placeholder.insert_picture(BytesIO(generated_image))
+                        else:
+                            slide.shapes.add_picture(BytesIO(generated_image), Inches(1), Inches(2), Inches(6), Inches(4))
 
-            #  Delete the temporary uploaded template after generating the PPT
-            if os.path.exists(temp_template_path):
-                try:
-                    os.remove(temp_template_path)
-                    print(f"🗑️ Deleted temporary uploaded template: {temp_template_path}")
-                except Exception as e:
-                    print(f"⚠️ Could not delete temporary uploaded template: {e}")
+            #  Save PowerPoint to memory, per session (see DeckStore)
+            ppt_filename = store_deck(prs, "Generated_Presentation.pptx")
 
-            return ppt_filename if os.path.exists(ppt_filename) else None
+            return ppt_filename
 
         except Exception as e:
             st.error(f"Error generating PowerPoint: {e}")
@@ -411,18 +365,15 @@ class SlideGenerator(BaseApp):
             #  Prepare input for AI model
             user_input = {
                 "num_slides": st.session_state.num_slides,
-                "presentation_request": st.session_state.presentation_request
+                "presentation_request": st.session_state.presentation_request,
+                "layout_text": self.layout_text()
             }
 
-            #  Generate AI response using ModelManager
+            #  Stream the AI response through ModelManager; generate_ppt stores it in session history
             prompt_template = self.generate_prompt()
-            response = self.model_manager.generate(prompt_template, user_input)
-
-            #  Store response in session history
-            if response:
-                st.session_state.history.append(response.content)
+            response = self.model_manager.stream(prompt_template, user_input)
 
-            #  Generate PowerPoint
+            #  Generate PowerPoint as the response arrives
             ppt_filename = self.generate_ppt(response)
             if ppt_filename:
                 st.session_state.ppt_filename = ppt_filename
@@ -439,11 +390,11 @@ class SlideGenerator(BaseApp):
                     new_request = f"{last_response}\n\n# User Edits:\n{user_edits}\n\nEnsure the revised presentation follows the exact previous format."
 
                     #  Send updated request to AI using ModelManager
-                    response = self.model_manager.generate(self.generate_prompt(), {"presentation_request": new_request})
-
-                    #  Store new response in session history
-                    if response:
-                        st.session_state.history.append(response.content)
+                    response = self.model_manager.stream(self.generate_prompt(), {
+                        "num_slides": st.session_state.num_slides,
+                        "presentation_request": new_request,
+                        "layout_text": self.layout_text()
+                    })
 
                     #  Generate new PPT with edits
                     ppt_filename = self.generate_ppt(response)
@@ -455,10 +406,11 @@ class SlideGenerator(BaseApp):
 
         #  Ensure "Make Edits" and download button are always visible if a presentation exists
         if "ppt_filename" in st.session_state and st.session_state.ppt_filename:
-
-            with open(st.session_state.ppt_filename, "rb") as f:
-                st.download_button("📥 Download Presentation", f, st.session_state.ppt_filename,
-                                   "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+            deck = session_deck()
+            if deck:
+                st.download_button("📥 Download Presentation", deck.data, deck.filename, PPTX_MIME)
+            else:
+                st.info("This presentation is no longer in memory; generate it again to download it.")
 
             #  Only show "Make Edits" if not in edit mode
             if st.session_state.get("show_edit_button", False) and not st.session_state.get("edit_mode", False):
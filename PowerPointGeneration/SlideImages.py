@@ -0,0 +1,60 @@
+import math
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+
+# Images generated at once across all sessions; a 20-slide deck asks for at most 10
+IMAGE_WORKERS = 8
+IMAGE_TIMEOUT = 60  # seconds allowed per image
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="slide-image")
+        return _executor
+
+
+def image_prompt(description):
+    return (
+        f"You are an AI designed to make pictures for PowerPoint presentations. "
+        f"Make a picture about {description}."
+    )
+
+
+def start_images(descriptions, generate):
+    """
+    Submits an image request per slide right away: {slide number: description} -> {slide number: future}.
+    `generate` is called with the prompt on a worker thread, so it must not touch st.session_state.
+    """
+    executor = _get_executor()
+    return {
+        slide_num: executor.submit(generate, image_prompt(description))
+        for slide_num, description in descriptions.items()
+    }
+
+
+def collect_images(futures, timeout=IMAGE_TIMEOUT):
+    """
+    Waits for the images started by start_images: {slide number: result, or None if it failed or timed out}.
+    All requests run together, so the wait is about one image's time (longer only if they exceed the pool).
+    """
+    if not futures:
+        return {}
+    rounds = math.ceil(len(futures) / IMAGE_WORKERS)
+    done, not_done = wait(futures.values(), timeout=timeout * rounds)
+    results = {}
+    for slide_num, future in futures.items():
+        if future in not_done:
+            future.cancel()
+            print(f"Image for slide {slide_num} timed out; using a text-only slide.")
+            results[slide_num] = None
+        elif future.exception() is not None:
+            print(f"Image for slide {slide_num} failed: {future.exception()}")
+            results[slide_num] = None
+        else:
+            results[slide_num] = future.result()
+    return results
@@ -0,0 +1,114 @@
+import re
+
+
+def _number(text):
+    """The number a header value starts with ("1", "1.", "3 - Title"), or None if it has none."""
+    match = re.match(r"\d+", text.strip())
+    return int(match.group()) if match else None
+
+
+def new_slide():
+    return {"title": "", "content": [], "image": None, "slidetype": None, "is_bullet_points": False}
+
+
+class SlideStreamParser:
+    """
+    Single-pass parser for the #Slide / #Header / #Content(s) / #Image deck format.
+    Text is fed in chunks as the model streams it; each slide is handed back as soon as its
+    block closes (the next #Slide: line, or the end of the response), so work on it can start
+    while later slides are still being written.
+    """
+
+    def __init__(self):
+        self.title = None
+        self.subtitle = None
+        self.slides = {}  # slide number -> slide, in the order they appeared
+        self.text = ""
+        self._buffer = ""
+        self._current = None
+
+    def parse(self, chunks):
+        """Yields (slide number, slide) for every slide in `chunks` (an iterable of text, or one string)."""
+        if isinstance(chunks, str):
+            chunks = [chunks]
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.close()
+
+    def feed(self, chunk):
+        """Consumes a chunk of the response. Returns the slides it completed."""
+        self.text += chunk
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        completed = []
+        for line in lines:
+            completed.extend(self._parse_line(line))
+        return completed
+
+    def close(self):
+        """Ends the response: parses any unterminated last line and returns the slide still open."""
+        completed = self._parse_line(self._buffer)
+        self._buffer = ""
+        completed.extend(self._close_slide())
+        return completed
+
+    def _close_slide(self):
+        if self._current is None:
+            return []
+        slide_num, self._current = self._current, None
+        return [(slide_num, self.slides[slide_num])]
+
+    def _parse_line(self, line):
+        line = line.strip()
+        if line.startswith("#Slide:"):
+            completed = self._close_slide()
+            # An unnumbered slide follows on from the last one
+            number = _number(line[len("#Slide:"):])
+            self._current = number if number is not None else max(self.slides, default=0) + 1
+            self.slides[self._current] = new_slide()
+            return completed
+
+        # Deck title and subtitle may come before the first slide or inside it
+        if line.startswith("#Title:"):
+            self.title = line[len("#Title:"):].strip()
+        elif line.startswith("#Subtitle:"):
+            self.subtitle = line[len("#Subtitle:"):].strip()
+            if self._current is not None:
+                self.slides[self._current]["subtitle"] = self.subtitle
+
+        if self._current is None:
+            return []
+        slide = self.slides[self._current]
+        if line.startswith("#Header:"):
+            slide["title"] = line[len("#Header:"):].strip()
+        elif line.startswith("#Contents:"):
+            slide["is_bullet_points"] = True
+            slide["content"].append(line[len("#Contents:"):].strip())
+        elif line.startswith("#Content:"):
+            slide["is_bullet_points"] = False
+            slide["content"].append(line[len("#Content:"):].strip())
+        elif line.startswith("- "):
+            slide["content"].append(line[2:].strip())
+        elif line.startswith("#Image:"):
+            image_suggestion = line[len("#Image:"):].strip()
+            slide["image"] = None if image_suggestion.lower() == "none" else image_suggestion
+        elif line.startswith("#Slidetype:"):
+            slide["slidetype"] = _number(line[len("#Slidetype:"):])
+        return []
+
+
+class ChatStream:
+    """
+    The text chunks of a LangChain chat model's streamed reply. Once iteration finishes,
+    `message` is the merged reply (content and usage_metadata), as invoke() would return it.
+    """
+
+    def __init__(self, model, messages):
+        self.model = model
+        self.messages = messages
+        self.message = None
+
+    def __iter__(self):
+        for chunk in self.model.stream(self.messages):
+            self.message = chunk if self.message is None else self.message + chunk
+            yield chunk.content
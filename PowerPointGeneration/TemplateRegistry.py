@@ -0,0 +1,119 @@
+import hashlib
+import os
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+from pptx import Presentation
+
+TEMPLATE_DIR = "./Pres_templates"
+MAX_UPLOADED_TEMPLATES = 8
+# Layouts of the default Office theme used when the model gives no usable #Slidetype
+DEFAULT_LAYOUT, DEFAULT_IMAGE_LAYOUT = 1, 8
+
+# Shape names python-pptx gives the placeholders find_text_placeholder / find_image_placeholder look for
+TEXT_PLACEHOLDER_NAMES = ("Content Placeholder", "Text Placeholder")
+IMAGE_PLACEHOLDER_NAMES = ("Picture Placeholder",)
+
+
+def _first_placeholder(layout, names):
+    for placeholder in layout.placeholders:
+        if any(name in placeholder.name for name in names):
+            return placeholder.placeholder_format.idx
+    return None
+
+
+class SlideTemplate:
+    """
+    A .pptx template's pristine bytes plus what is read from it once: layout names and,
+    per layout, the idx of the text and picture placeholders a new slide gets. Each deck
+    still parses the package itself (see new_presentation).
+    """
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        prs = Presentation(BytesIO(data))
+        self.slide_count = len(prs.slides)
+        self.layouts = []
+        self.text_placeholders = {}
+        self.image_placeholders = {}
+        for index, layout in enumerate(prs.slide_layouts):
+            # Some layouts may not have names, assign generic numbering
+            self.layouts.append({"slide_number": index, "layout_name": layout.name or f"Layout {index + 1}"})
+            self.text_placeholders[index] = _first_placeholder(layout, TEXT_PLACEHOLDER_NAMES)
+            self.image_placeholders[index] = _first_placeholder(layout, IMAGE_PLACEHOLDER_NAMES)
+
+    def new_presentation(self):
+        """
+        A fresh Presentation for one deck. This is a full parse of the cached bytes every time,
+        since python-pptx has no safe way to copy a parsed one; only the disk read and the
+        layout and placeholder lookups are saved.
+        """
+        return Presentation(BytesIO(self.data))
+
+    def layout_index(self, slidetype, has_image=False):
+        """
+        The layout to use for a slide: `slidetype` when it names one of this template's layouts,
+        otherwise Title and Content (Picture with Caption if the slide has an image), or the
+        template's last layout if it has fewer.
+        """
+        if isinstance(slidetype, int) and 0 <= slidetype < len(self.layouts):
+            return slidetype
+        default = DEFAULT_IMAGE_LAYOUT if has_image else DEFAULT_LAYOUT
+        return min(default, len(self.layouts) - 1)
+
+    def _placeholder(self, slide, idx):
+        if idx is None:
+            return None
+        try:
+            return slide.placeholders[idx]
+        except KeyError:
+            return None
+
+    def text_placeholder(self, slide, layout_index):
+        """The text frame of the slide's content placeholder, or None if its layout has none."""
+        placeholder = self._placeholder(slide, self.text_placeholders.get(layout_index))
+        return placeholder.text_frame if placeholder is not None else None
+
+    def image_placeholder(self, slide, layout_index):
+        return self._placeholder(slide, self.image_placeholders.get(layout_index))
+
+
+_templates = {}
+_uploaded = OrderedDict()
+_templates_lock = Lock()
+
+
+def get_template(name):
+    """The built-in template `name` (a file in TEMPLATE_DIR), loaded once per process; None if missing."""
+    with _templates_lock:
+        template = _templates.get(name)
+    if template is not None:
+        return template
+
+    path = os.path.join(TEMPLATE_DIR, f"{name}.pptx")
+    if not os.path.exists(path):
+        print(f"❌ Template '{name}' not found in {TEMPLATE_DIR}")
+        return None
+    with open(path, "rb") as f:
+        template = SlideTemplate(name, f.read())
+    with _templates_lock:
+        _templates[name] = template
+    return template
+
+
+def template_from_bytes(data, name="Custom Upload"):
+    """An uploaded template, parsed once per distinct content and kept in a small LRU."""
+    key = hashlib.sha256(data).hexdigest()
+    with _templates_lock:
+        template = _uploaded.get(key)
+        if template is not None:
+            _uploaded.move_to_end(key)
+            return template
+
+    template = SlideTemplate(name, data)
+    with _templates_lock:
+        _uploaded[key] = template
+        while len(_uploaded) > MAX_UPLOADED_TEMPLATES:
+            _uploaded.popitem(last=False)
+    return template
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from DocumentIndex import DocumentIndex
+from Ingestion import IngestionPipeline, file_kind, ingest
+
+UPLOAD_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="ingest")
+        return _executor
+
+
+class _Upload:
+    """The bytes of a Streamlit upload, read on the script thread so workers never touch the widget."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+class UploadJob:
+    """One file going through ingestion. status is "queued", "running", "done" or "failed"."""
+
+    def __init__(self, name, sha256):
+        self.name = name
+        self.sha256 = sha256
+        self.status = "queued"
+        self.chunks = 0
+        self.document = None
+        self.error = None
+        self.seconds = None
+        self.future = None
+
+    def count_chunks(self, chunks):
+        """Chunk stage: reports progress while the file is being chunked."""
+        for chunk in chunks:
+            self.chunks += 1
+            yield chunk
+
+
+class UploadQueue:
+    """
+    Ingests a session's uploaded documents concurrently on a shared thread pool, so the
+    Streamlit script never waits on parsing. Large PDFs still fan out to the process pool
+    inside Ingestion. Finished files are merged, in upload order, into one corpus with a
+    single DocumentIndex over every file's chunks.
+    """
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline or IngestionPipeline()
+        self.jobs = []
+        self._corpus = None
+        self._corpus_key = None
+
+    def _run(self, job, upload):
+        job.status = "running"
+        start_time = time.perf_counter()
+        try:
+            job.document = ingest(upload, file_kind(upload.name), self.pipeline.with_chunk_stage(job.count_chunks))
+            job.chunks = len(job.document.chunks)
+            job.status = "done"
+        except Exception as e:
+            print(f"Ingesting {job.name} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        job.seconds = round(time.perf_counter() - start_time, 2)
+
+    def sync(self, uploaded_files):
+        """Queues files not seen before and forgets files no longer uploaded. Returns the jobs in upload order."""
+        jobs = []
+        for uploaded_file in uploaded_files:
+            data = uploaded_file.getvalue()
+            sha256 = hashlib.sha256(data).hexdigest()
+            job = next((job for job in self.jobs if job.sha256 == sha256 and job.name == uploaded_file.name), None)
+            if job is None:
+                job = UploadJob(uploaded_file.name, sha256)
+                job.future = _get_executor().submit(self._run, job, _Upload(uploaded_file.name, data))
+            jobs.append(job)
+        for job in self.jobs:
+            if job not in jobs and job.future is not None:
+                job.future.cancel()
+        self.jobs = jobs
+        return jobs
+
+    def pending(self):
+        return [job for job in self.jobs if job.status in ("queued", "running")]
+
+    def wait(self, timeout=None):
+        """Blocks until every queued file has been ingested (or `timeout` seconds pass)."""
+        wait([job.future for job in self.pending()], timeout=timeout)
+
+    def progress(self):
+        finished = sum(job.status in ("done", "failed") for job in self.jobs)
+        return finished / len(self.jobs) if self.jobs else 1.0
+
+    def corpus(self):
+        """
+        (text, index) over the files ingested so far, or (None, None) if there are none.
+        A lone file's text is left as is; several files are joined under their names.
+        """
+        done = [job for job in self.jobs if job.status == "done"]
+        key = tuple(job.sha256 for job in done)
+        if key != self._corpus_key:
+            if not done:
+                self._corpus = (None, None)
+            elif len(done) == 1:
+                self._corpus = (done[0].document.text, DocumentIndex(done[0].document.chunks))
+            else:
+                text = "\n\n".join(f"# {job.name}\n{job.document.text}" for job in done)
+                index = DocumentIndex()
+                for job in done:
+                    index.extend(f"[{job.name}] {chunk}" for chunk in job.document.chunks)
+                self._corpus = (text, index)
+            self._corpus_key = key
+        return self._corpus
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The apps import their shared modules as siblings (`from SlideStream import ...`). Apps reuse
+# module names (Config, Model_Manager), so run each app's tests from its own directory.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# Keep test calls out of the real usage ledger
+os.environ.setdefault("USAGE_LEDGER_PATH", os.path.join(tempfile.mkdtemp(), "usage.db"))
@@ -0,0 +1,60 @@
+from SlideStream import SlideStreamParser
+
+DECK = """#Title: The Water Cycle
+#Subtitle: How water moves around the planet
+
+#Slide: 1.
+#Header: Table of Contents
+#Contents: This presentation includes:
+- Evaporation
+- Condensation
+#Image: None
+#Slidetype: 1 (Title and Content)
+
+#Slide: 2
+#Header: Evaporation
+#Content: The sun heats water until it rises as vapour.
+#Image: Sunlight over a lake with rising mist
+#Slidetype: 3
+"""
+
+
+def chunks(text, size):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+def test_chunked_stream_parses_like_the_whole_text():
+    whole = SlideStreamParser()
+    expected = list(whole.parse(DECK))
+    for size in (1, 5, 17):
+        parser = SlideStreamParser()
+        assert list(parser.parse(chunks(DECK, size))) == expected
+        assert parser.text == DECK
+
+    assert whole.title == "The Water Cycle"
+    assert whole.subtitle == "How water moves around the planet"
+    assert [number for number, _ in expected] == [1, 2]
+    contents, evaporation = whole.slides[1], whole.slides[2]
+    assert contents["content"] == ["This presentation includes:", "Evaporation", "Condensation"]
+    assert contents["is_bullet_points"] and contents["image"] is None
+    assert evaporation["image"] == "Sunlight over a lake with rising mist"
+
+
+def test_header_numbers_are_read_leniently():
+    parser = SlideStreamParser()
+    list(parser.parse(DECK + "\n#Slide:\n#Header: Summary\n#Slidetype: none\n"))
+    # "1." and "1 (Title and Content)" keep their number; no number continues the sequence
+    assert parser.slides[1]["slidetype"] == 1
+    assert parser.slides[2]["slidetype"] == 3
+    assert parser.slides[3]["title"] == "Summary"
+    assert parser.slides[3]["slidetype"] is None
+
+
+def test_each_slide_is_handed_back_when_the_next_one_starts():
+    parser = SlideStreamParser()
+    first, second = DECK.split("#Slide: 2")
+    assert parser.feed(first) == []
+    completed = parser.feed("#Slide: 2\n")
+    assert [number for number, _ in completed] == [1]
+    assert completed[0][1]["title"] == "Table of Contents"
+    assert [number for number, _ in parser.feed(second[1:]) + parser.close()] == [2]
@@ -0,0 +1,40 @@
+from io import BytesIO
+
+from pptx import Presentation
+
+from TemplateRegistry import SlideTemplate, template_from_bytes
+
+
+def default_template():
+    buffer = BytesIO()
+    Presentation().save(buffer)
+    return SlideTemplate("Default", buffer.getvalue())
+
+
+def test_layouts_and_placeholders_are_read_once():
+    template = default_template()
+    assert len(template.layouts) == 11
+    assert template.layouts[1]["layout_name"] == "Title and Content"
+    prs = template.new_presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[1])
+    assert template.text_placeholder(slide, 1) is not None
+    assert template.image_placeholder(slide, 1) is None
+
+
+def test_layout_index_falls_back_when_slidetype_is_unusable():
+    template = default_template()
+    assert template.layout_index(5) == 5
+    assert template.layout_index(None) == 1
+    assert template.layout_index(None, has_image=True) == 8
+    assert template.layout_index(42) == 1
+    assert template.layout_index(-1, has_image=True) == 8
+
+    template.layouts = template.layouts[:3]
+    assert template.layout_index(None, has_image=True) == 2
+
+
+def test_uploaded_templates_are_parsed_once_per_content():
+    buffer = BytesIO()
+    Presentation().save(buffer)
+    data = buffer.getvalue()
+    assert template_from_bytes(data) is template_from_bytes(bytes(data))
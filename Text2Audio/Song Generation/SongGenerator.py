@@ -6,6 +6,7 @@ import os
 from dotenv import load_dotenv
 from pydub import AudioSegment
 import io
+from UsageLedger import record_usage
 load_dotenv()
 
 
@@ -41,7 +42,9 @@ class SongGenerator():
         input_tokens_price = input_tokens * one_input_token
         output_tokens_price = output_tokens * one_output_token
         total = input_tokens_price + output_tokens_price
-        st.session_state.COST = total
+        st.session_state.COST = record_usage(
+            "gpt-4o-mini", total, provider="OpenAI", input_tokens=input_tokens, output_tokens=output_tokens
+        )
         print(f"price gpt-4o-mini\n {st.session_state.COST}")
         return completion.choices[0].message.content
 
@@ -110,7 +113,9 @@ class SongGenerator():
                 audio_file = io.BytesIO(audio_binary)
                 audio_segment = AudioSegment.from_file(audio_file, format="mp3")
                 duration = len(audio_segment) / 1000
-                st.session_state.COST = duration * minimaxi_pricing
+                st.session_state.COST = record_usage(
+                    "music-01", duration * minimaxi_pricing, provider="MiniMax", seconds=duration
+                )
                 print(f"MINIMAXI\n{st.session_state.COST}")
                 return audio_hex
             else:
@@ -7,6 +7,7 @@ from PIL import Image
 import os 
 from dotenv import load_dotenv
 import time 
+from UsageLedger import record_usage
 
 load_dotenv()
 
@@ -68,7 +69,10 @@ class ImageGenerator():
                 continue 
         if total_processing_time > 0:
             print(f"{total_processing_time} seconds")
-            st.session_state.COST = 0.001 * total_processing_time
+            st.session_state.COST = record_usage(
+                "stable-diffusion-3.5-turbo", 0.001 * total_processing_time, provider="Segmind",
+                seconds=total_processing_time, images=len(images)
+            )
             print(st.session_state.COST)
         return images if images else None 
     
@@ -103,7 +107,7 @@ class ImageGenerator():
                 st.error(f"Ideogram Error: {e}")
                 continue 
         if images:
-            st.session_state.COST = 0.1 * num_photos
+            st.session_state.COST = record_usage("ideogram", 0.1 * num_photos, provider="Segmind", images=len(images))
             print(st.session_state.COST)
             return images 
     
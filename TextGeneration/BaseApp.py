@@ -3,15 +3,21 @@ from streamlit_extras.stylable_container import stylable_container
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from PyPDF2 import PdfReader
-import pandas as pd 
 import os 
-from io import BytesIO
 from dotenv import load_dotenv
-import time 
-import docx 
+import hashlib
+from PromptAssembler import PromptAssembler
+from DocumentIndex import DocumentIndex
+from Ingestion import IngestionPipeline, chunk_by_tokens, ingest, file_kind
+from CsvTable import table_for
+from UploadQueue import UploadQueue
 
 class BaseApp:
+
+    # Stages uploads go through; apps can swap in their own cleaning or chunking
+    ingestion_pipeline = IngestionPipeline()
+    # Image answers are single-pass; set to add a text-only refine pass (one more model call)
+    refine_image_answers = False
     
     def __init__(self, app_name):
         self.name = app_name
@@ -41,52 +47,93 @@ class BaseApp:
         if uploaded_file:        
             st.session_state.documents = []
 
-            if uploaded_file.name.lower().endswith("pdf"):
-                pdf_bytes = uploaded_file.read()
-                pdf_stream = BytesIO(pdf_bytes)
-                pdf_reader = PdfReader(pdf_stream)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size = 1000,
-                    chunk_overlap = 200
-                )    
-                text_chunks = splitter.split_text(text)
-                st.session_state.documents.append({
-                    "name": uploaded_file.name,
-                    "type": "pdf",
-                    "content": text_chunks
-                    }
-                )
-                document_content = "\n".join(text_chunks)
-            
-            elif uploaded_file.name.lower().endswith(".csv"):
-                csv_df = pd.read_csv(uploaded_file)
-                csv_text = csv_df.to_string(index=False)
-                st.session_state.documents.append({
-                        "name": uploaded_file.name,
-                        "type": "csv",
-                        "content": csv_text
-                        }
-                    )
-                document_content = csv_text
-
-            elif uploaded_file.name.lower().endswith(".docx"):
-                doc = docx.Document(uploaded_file)
-                fulltext = []
-                for para in doc.paragraphs:
-                    fulltext.append(para.text)
-                document_content = '\n'.join(fulltext)
+            kind = file_kind(uploaded_file.name)
+            if kind in ("pdf", "csv", "docx"):
+                index = DocumentIndex()
+                document = ingest(uploaded_file, kind, self.ingestion_pipeline.with_chunk_stage(index.consume))
+                if not index.chunks:
+                    # Served from the cache, so no chunks streamed past the index
+                    index.extend(document.chunks)
                 st.session_state.documents.append({
                     "name": uploaded_file.name,
-                    "type": "docx",
-                    "content": document_content
+                    "type": kind,
+                    "content": document.chunks if kind == "pdf" else document.text
                 })
+                document_content = document.text
+                self.document_index(document_content, index)
 
         return document_content 
     
+    def upload_queue(self):
+        if "upload_queue" not in st.session_state:
+            st.session_state.upload_queue = UploadQueue(self.ingestion_pipeline)
+        return st.session_state.upload_queue
+
+    def queue_uploads(self, uploaded_files):
+        """
+        Starts ingesting documents in the background and shows per-file progress, refreshing
+        on its own until every file is done. Returns the corpus of the files finished so far.
+        """
+        queue = self.upload_queue()
+        queue.sync(uploaded_files)
+        if queue.jobs:
+            live = bool(queue.pending())
+            st.fragment(self.display_upload_progress, run_every=1.0 if live else None)(live)
+        return self.uploaded_corpus()
+
+    def display_upload_progress(self, live=False):
+        queue = self.upload_queue()
+        st.progress(queue.progress())
+        for job in queue.jobs:
+            if job.status == "done":
+                st.caption(f"✅ {job.name}: {job.chunks} chunks in {job.seconds}s")
+            elif job.status == "failed":
+                st.caption(f"❌ {job.name}: {job.error}")
+            else:
+                st.caption(f"⏳ {job.name}: {job.status}, {job.chunks} chunks so far")
+        if live and not queue.pending():
+            # The last file just finished: rerun the whole app so it sees the full corpus
+            st.rerun()
+
+    def uploaded_corpus(self, wait=False):
+        """Merged text of the queued uploads (None if none), with its index registered for fit_document."""
+        queue = self.upload_queue()
+        if wait:
+            queue.wait()
+        text, index = queue.corpus()
+        if text:
+            self.document_index(text, index)
+        return text
+
+    def document_index(self, document, index=None):
+        """BM25 index over a document's chunks, built once per upload and kept in the session."""
+        key = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        cached = st.session_state.get("document_index")
+        if cached is None or cached[0] != key:
+            cached = (key, index or DocumentIndex(chunk_by_tokens([document])))
+            st.session_state.document_index = cached
+        return cached[1]
+
+    def fit_document(self, prompt_template, chain_input, document, query=None):
+        """
+        Returns as much of a document as the primary model has room for once the rest of the prompt is counted.
+        Documents that do not fit are reduced to their chunks most relevant to `query`
+        (by default the other prompt inputs, e.g. topic and details). A CSV upload is sent
+        whole when it fits, otherwise as its profile plus the rows that best match the query.
+        """
+        model_name = self.model_manager.primary_config["model_name"]
+        if query is None:
+            query = " ".join(str(value) for value in chain_input.values() if value)
+
+        assembler = PromptAssembler(model_name)
+        assembler.add_template(prompt_template, chain_input)
+        table = table_for(document)
+        if table is not None:
+            return table.context(query, assembler.remaining(), model_name)
+        if assembler.add("document", document, priority=1) <= assembler.remaining():
+            return document
+        return self.document_index(document).select(query, assembler.remaining(), model_name)
+
     def run_model(self, model, prompt_template):
         self.chain = prompt_template | model | StrOutputParser()
         return self.chain  
@@ -101,12 +148,16 @@ class BaseApp:
                     st.markdown(message.content)
 
     def display_ai_response(self, ai_response):
+        """Renders a finished string as is, or a ModelManager.stream() chunk by chunk as it arrives."""
         with st.chat_message("AI", avatar="🤖"):
             response_placeholder = st.empty()
             full_response = ""
-        for chunk in ai_response.split(" "):
-            full_response += chunk + " "
-            response_placeholder.markdown(full_response + "▌")
-            time.sleep(0.05)
-        response_placeholder.markdown(full_response)
-        st.session_state.chat_history.append(AIMessage(full_response))
\ No newline at end of file
+            if isinstance(ai_response, str):
+                full_response = ai_response
+            else:
+                for chunk in ai_response:
+                    full_response += chunk
+                    response_placeholder.markdown(full_response + "▌")
+            response_placeholder.markdown(full_response)
+        st.session_state.chat_history.append(AIMessage(full_response))
+        return full_response
\ No newline at end of file
@@ -136,19 +136,18 @@ class BuildChatbot(BaseApp):
                 st.markdown(user_input)
 
             prompt_template = self.generate_prompt(user_input)
+            inputs = {
+                "category": st.session_state.user_requirements["category"],
+                "description": st.session_state.user_requirements["description"],
+                "instructions": st.session_state.user_requirements["instructions"],
+                "user_question": user_input
+            }
+            inputs["document"] = self.fit_document(prompt_template, inputs, doc, query=user_input) if doc else doc
 
-            response, st.session_state.COST = self.model_manager.generate(
-                prompt_template,
-                {
-                    "category": st.session_state.user_requirements["category"],
-                    "description": st.session_state.user_requirements["description"],
-                    "instructions": st.session_state.user_requirements["instructions"],
-                    "user_question": user_input,
-                    "document": doc
-                }
-            )
-            print(st.session_state.COST)
+            response = self.model_manager.stream(prompt_template, inputs)
             super().display_ai_response(response)
+            st.session_state.COST = response.cost
+            print(st.session_state.COST)
 
         return user_input, doc
 
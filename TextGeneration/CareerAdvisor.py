@@ -81,15 +81,13 @@ class CareerAdvisor(BaseApp):
                 st.markdown(user_input)
 
             prompt_template = self.generate_prompt()
-            response, st.session_state.COST = self.model_manager.generate(
-                prompt_template,
-                {
-                    "category": st.session_state.user_info["category"],
-                    "chat_history": st.session_state.chat_history,
-                    "documents": document_content,
-                    "user_question": user_input
-                }
-            )
+            inputs = {
+                "category": st.session_state.user_info["category"],
+                "chat_history": st.session_state.chat_history,
+                "user_question": user_input
+            }
+            inputs["documents"] = self.fit_document(prompt_template, inputs, document_content, query=user_input) if document_content else document_content
+            response, st.session_state.COST = self.model_manager.generate(prompt_template, inputs)
 
             # Web search enhancement
             if st.session_state.user_info.get("web_search", False):
@@ -1,6 +1,7 @@
 from langchain_core.messages import HumanMessage,AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
+from HistoryManager import HistoryManager
 import streamlit as st 
 from Model_Manager import ModelManager
 from Config import PRIMARY_MODEL, SECONDARY_MODEL
@@ -16,6 +17,7 @@ class Chatbot(BaseApp):
         super().__init__(app_name)
         self.app_slogan = app_slogan
         self.model_manager = model_manager 
+        self.history = HistoryManager(model_manager)
 
     
     def process_input(self, user_input):
@@ -52,15 +54,16 @@ class Chatbot(BaseApp):
             
             prompt_template = self.generate_prompt()
 
-            response, st.session_state.COST = self.model_manager.generate(
+            response = self.model_manager.stream(
                 prompt_template,
                 {
                     "user_question":  user_input,
-                    "chat_history": st.session_state.chat_history
+                    "chat_history": self.history.context(st.session_state.chat_history)
                 }
             )
-            print(f"{st.session_state.COST}$")
             super().display_ai_response(response)
+            st.session_state.COST = response.cost
+            print(f"{st.session_state.COST}$")
             return user_input
 
 
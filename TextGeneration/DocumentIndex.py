@@ -0,0 +1,100 @@
+import math
+import re
+from collections import Counter
+from Tokens import count_tokens
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Very common English words carry no signal for picking reference chunks
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+
+def tokenize(text):
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+class DocumentIndex:
+    """
+    BM25 index over the chunks of one document, built once (or as the chunks stream in) and queried many times.
+    Everything runs in-process; no embeddings or network calls are needed.
+    """
+
+    def __init__(self, chunks=(), k1=1.5, b=0.75):
+        self.chunks = []
+        self.k1 = k1
+        self.b = b
+        self._term_counts = []
+        self._lengths = []
+        self._document_frequency = Counter()
+        self._idf = None
+        self.extend(chunks)
+
+    def add(self, chunk):
+        counts = Counter(tokenize(chunk))
+        self.chunks.append(chunk)
+        self._term_counts.append(counts)
+        self._lengths.append(sum(counts.values()))
+        self._document_frequency.update(counts.keys())
+        self._idf = None
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.add(chunk)
+
+    def consume(self, chunks):
+        """Pipeline stage: indexes chunks as they stream past."""
+        for chunk in chunks:
+            self.add(chunk)
+            yield chunk
+
+    def _statistics(self):
+        if self._idf is None:
+            total = len(self.chunks)
+            self._idf = {
+                term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+                for term, frequency in self._document_frequency.items()
+            }
+            self._average_length = sum(self._lengths) / total if total else 0
+        return self._idf, self._average_length
+
+    def scores(self, query):
+        idf, average_length = self._statistics()
+        terms = [term for term in set(tokenize(query)) if term in idf]
+        scores = []
+        for counts, length in zip(self._term_counts, self._lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / (average_length or 1))
+            for term in terms:
+                frequency = counts.get(term, 0)
+                if frequency:
+                    score += idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query, k=None):
+        """Returns (chunk index, score) pairs, best first. Chunks sharing no term with the query are left out."""
+        ranked = sorted(
+            ((index, score) for index, score in enumerate(self.scores(query)) if score > 0),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return ranked[:k] if k else ranked
+
+    def select(self, query, max_tokens, model_name="gpt-4o-mini", separator="\n...\n"):
+        """
+        Picks the most relevant chunks that fit in `max_tokens` and returns them in document order.
+        Falls back to the opening chunks when nothing matches the query.
+        """
+        ranked = [index for index, _ in self.search(query)] or list(range(len(self.chunks)))
+        separator_tokens = count_tokens(separator, model_name)
+        chosen = []
+        used = 0
+        for index in ranked:
+            tokens = count_tokens(self.chunks[index], model_name) + (separator_tokens if chosen else 0)
+            if used + tokens > max_tokens:
+                continue
+            chosen.append(index)
+            used += tokens
+        return separator.join(self.chunks[index] for index in sorted(chosen))
@@ -0,0 +1,115 @@
+import asyncio
+import streamlit as st
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from Model_Manager import get_event_loop
+from Tokens import count_tokens, truncate_tokens
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_template("""
+    You maintain a running summary of a conversation between a user and an AI assistant.
+    Update the summary with the new messages below. Keep names, numbers, decisions, open questions
+    and anything the user asked to remember. Use at most {max_words} words and write only the summary.
+    Current summary: {summary}
+    New messages:
+    {messages}
+""")
+
+
+def format_message(message):
+    """One line of history for a prompt; handles both LangChain messages and {"role", "content"} dicts."""
+    if isinstance(message, dict):
+        return f"{message['role']}: {message['content']}"
+    if isinstance(message, HumanMessage):
+        return f"User: {message.content}"
+    if isinstance(message, AIMessage):
+        return f"AI: {message.content}"
+    return str(getattr(message, "content", message))
+
+
+class HistoryManager:
+    """
+    Turns a session's chat history into prompt context that never exceeds `budget` tokens.
+
+    The most recent messages are kept verbatim, newest first, for as long as they fit; the
+    newest message is always kept, truncated if it alone is over budget.
+    Messages that fall out of that window are folded into a running summary by a background
+    call on the shared ModelManager loop, so a turn never waits on summarization; until the
+    summary catches up, the evicted messages are simply left out.
+    """
+
+    def __init__(self, model_manager, budget=2000, summary_share=0.25, state_key="chat_history"):
+        self.model_manager = model_manager
+        self.budget = budget
+        self.summary_budget = int(budget * summary_share)
+        self.model_name = model_manager.primary_config["model_name"]
+        self.state_key = f"{state_key}_window"
+
+    def _state(self, history):
+        state = st.session_state.get(self.state_key)
+        # A cleared or replaced history starts a new summary
+        if state is None or len(history) < state["summarized_upto"]:
+            state = {"summary": "", "summarized_upto": 0, "pending": None, "pending_upto": 0}
+            st.session_state[self.state_key] = state
+        return state
+
+    def _collect_summary(self, state):
+        pending = state["pending"]
+        if pending is None or not pending.done():
+            return
+        state["pending"] = None
+        try:
+            summary, _ = pending.result()
+        except Exception as e:
+            print(f"History summary failed: {e}")
+            return
+        state["summary"] = truncate_tokens(summary.strip(), self.summary_budget, self.model_name)
+        state["summarized_upto"] = state["pending_upto"]
+
+    def _summarize(self, state, history, upto):
+        messages = "\n".join(format_message(message) for message in history[state["summarized_upto"]:upto])
+        chain_input = {
+            "summary": state["summary"] or "(none yet)",
+            "messages": messages,
+            "max_words": max(20, self.summary_budget * 3 // 4),
+        }
+        state["pending"] = asyncio.run_coroutine_threadsafe(
+            self.model_manager.agenerate(SUMMARY_PROMPT, chain_input),
+            get_event_loop()
+        )
+        state["pending_upto"] = upto
+
+    def context(self, history):
+        """Returns the summary plus as many recent messages as fit in the budget, as one string."""
+        state = self._state(history)
+        self._collect_summary(state)
+
+        header = f"Summary of earlier conversation: {state['summary']}" if state["summary"] else ""
+        used = count_tokens(header, self.model_name) + 1 if header else 0
+
+        lines = []
+        start = len(history)
+        while start > state["summarized_upto"]:
+            line = format_message(history[start - 1])
+            tokens = count_tokens(line, self.model_name) + 1
+            if used + tokens > self.budget:
+                if lines:
+                    break
+                # The current turn must reach the model even when it alone is over budget
+                line = truncate_tokens(line, self.budget - used - 1, self.model_name)
+                tokens = count_tokens(line, self.model_name) + 1
+            lines.append(line)
+            used += tokens
+            start -= 1
+        lines.reverse()
+
+        # Per-line counts are close but not exact once joined; trim until the whole block fits.
+        # Trimmed lines leave the window, so they are summarized along with the older ones
+        text = "\n".join(([header] if header else []) + lines)
+        while len(lines) > 1 and count_tokens(text, self.model_name) > self.budget:
+            lines.pop(0)
+            start += 1
+            text = "\n".join(([header] if header else []) + lines)
+
+        if start > state["summarized_upto"] and state["pending"] is None:
+            self._summarize(state, history, start)
+        return text
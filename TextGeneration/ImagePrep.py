@@ -0,0 +1,88 @@
+import base64
+import hashlib
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+from PIL import Image, ImageOps
+
+# Largest image either vision provider uses without shrinking it itself:
+# Claude downsizes past a 1568px long edge, OpenAI (high detail) past a 768px short edge
+MAX_LONG_SIDE = 1568
+MAX_SHORT_SIDE = 768
+
+JPEG_QUALITY = 85
+# Diagrams, screenshots and handwriting use few distinct colours; photos use thousands
+PNG_MAX_COLORS = 256
+MAX_CACHED_IMAGES = 32
+
+
+class PreparedImage:
+    """An image resized and encoded for a vision model, with the media type that matches its bytes."""
+
+    def __init__(self, data, media_type, width, height):
+        self.data = data
+        self.media_type = media_type
+        self.width = width
+        self.height = height
+        self.base64 = base64.b64encode(data).decode("utf-8")
+
+    @property
+    def data_url(self):
+        return f"data:{self.media_type};base64,{self.base64}"
+
+
+def target_size(width, height, max_long_side=MAX_LONG_SIDE, max_short_side=MAX_SHORT_SIDE):
+    """Scales (width, height) down to fit both limits, keeping the aspect ratio. Never scales up."""
+    scale = min(1.0, max_long_side / max(width, height), max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def is_graphic(image):
+    """True for images that compress better and stay legible as PNG: transparency or few colours."""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        return True
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((128, 128))
+    return thumbnail.getcolors(PNG_MAX_COLORS) is not None
+
+
+def _prepare(data, max_long_side, max_short_side):
+    # Phone photos are often stored sideways with an EXIF rotation flag
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    size = target_size(image.width, image.height, max_long_side, max_short_side)
+    graphic = is_graphic(image)
+    image = image.convert("RGBA" if graphic and "A" in image.getbands() else "RGB")
+    if size != image.size:
+        image = image.resize(size, Image.LANCZOS)
+
+    buffered = BytesIO()
+    if graphic:
+        image.save(buffered, format="PNG", optimize=True)
+        return PreparedImage(buffered.getvalue(), "image/png", *size)
+    image.save(buffered, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return PreparedImage(buffered.getvalue(), "image/jpeg", *size)
+
+
+_prepared = OrderedDict()
+_prepared_lock = Lock()
+
+
+def prepare_image(image_file, max_long_side=MAX_LONG_SIDE, max_short_side=MAX_SHORT_SIDE):
+    """
+    Returns the PreparedImage for an upload (or raw bytes). The result is cached by content
+    hash, so Streamlit reruns and repeated uploads of the same image are not re-encoded.
+    """
+    data = image_file if isinstance(image_file, bytes) else image_file.getvalue()
+    key = (hashlib.sha256(data).hexdigest(), max_long_side, max_short_side)
+    with _prepared_lock:
+        prepared = _prepared.get(key)
+        if prepared is not None:
+            _prepared.move_to_end(key)
+            return prepared
+
+    prepared = _prepare(data, max_long_side, max_short_side)
+    with _prepared_lock:
+        _prepared[key] = prepared
+        while len(_prepared) > MAX_CACHED_IMAGES:
+            _prepared.popitem(last=False)
+    return prepared
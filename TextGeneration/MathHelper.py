@@ -1,17 +1,11 @@
 import streamlit as st
-from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
-from Model_Manager import ModelManager, PRICING
+from Ingestion import ingest
+from Model_Manager import ModelManager
+from ImagePrep import prepare_image
+from VisionPipeline import VisionPipeline
 from Config import PRIMARY_MODEL, SECONDARY_MODEL, Images_MODEL
-import base64
-from PIL import Image
-import io
-import PyPDF2
-import docx
-import pandas as pd
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 
 # Ensure session state variables
 if "math_problem" not in st.session_state:
@@ -33,21 +27,16 @@ class MathHelper(BaseApp):
     def welcome_screen(self, bot_slogan=None):
         return super().welcome_screen(bot_slogan)
     def extract_text_from_pdf(self, pdf_file):
-        """Extracts text from a PDF file."""
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+        """Extracts text from a PDF file (cached by content, see Ingestion.py)."""
+        return ingest(pdf_file, "pdf").text
 
     def extract_text_from_docx(self, docx_file):
-        """Extracts text from a DOCX file."""
-        doc = docx.Document(docx_file)
-        return "\n".join(para.text for para in doc.paragraphs)
+        """Extracts text from a DOCX file (cached by content, see Ingestion.py)."""
+        return ingest(docx_file, "docx").text
 
     def encode_image(self, image_file):
-        """Encodes an image as a base64 string for passing to the model."""
-        img = Image.open(image_file).convert("RGB").resize((1024, 1024))
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG", quality=75)
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+        """Encodes an image as a data URL for passing to the model (resized and encoded once per image)."""
+        return prepare_image(image_file).data_url
 
     def generate_text_prompt(self):
         """Prompt for text-based math problems."""
@@ -98,8 +87,7 @@ class MathHelper(BaseApp):
                     elif file_type == "docx":
                         content = self.extract_text_from_docx(uploaded_file)
                     elif file_type == "csv":
-                        df = pd.read_csv(uploaded_file, encoding="latin1")
-                        content = df.to_string()
+                        content = ingest(uploaded_file, "csv").text
                     st.session_state.math_problem = content
             else:
                 # No file → take the pasted text
@@ -126,10 +114,8 @@ class MathHelper(BaseApp):
                 return
             else:
                 prompt_template = self.generate_text_prompt()
-                inputs = {
-                    "education_level": st.session_state.education_level,
-                    "math_problem": st.session_state.math_problem
-                }
+                inputs = {"education_level": st.session_state.education_level}
+                inputs["math_problem"] = self.fit_document(prompt_template, inputs, st.session_state.math_problem)
 
                 try:
                     response, cost = self.model_manager.generate(prompt_template, inputs)
@@ -141,97 +127,36 @@ class MathHelper(BaseApp):
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
 
-    def handle_image_query(self, user_input_str, base64_image_str):
+    def handle_image_query(self, user_input_str, image_url):
         """
-        Handles an image-based query:
-          - Tries GPT-4o-mini first
-          - Fallback to Claude 3.5 Sonnet
+        Handles an image-based query (see VisionPipeline.answer):
+          - Sends the image the first time; repeats are answered from its description, written once
+          - Tries GPT-4o-mini first, falls back to Claude 3.5 Sonnet
+          - Refines the answer in a second, text-only pass when refine_image_answers is set
           Accumulates cost from usage metadata.
         """
-        try:
-            model_name = PRIMARY_MODEL["model_name"]  # e.g. "gpt-4o-mini"
-            model = ChatOpenAI(model=model_name, temperature=PRIMARY_MODEL["temperature"])
-            used_model = "GPT-4o-mini"
-        except Exception as e:
-            st.warning(f"Primary Model Failed: {e}, switching to Claude 3.5 Sonnet.")
-            model_name = Images_MODEL["model_name"]
-            model = ChatAnthropic(model=model_name, temperature=Images_MODEL["temperature"])
-            used_model = "Claude 3.5 Sonnet"
-
-        try:
-            content = [
-                {
-                    "type": "text",
-                    "text": "You are a math tutor. Interpret any math problem in this image and solve it step by step."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image_str}"}
-                },
-                {
-                    "type": "text",
-                    "text": f"Level: {st.session_state.education_level}. If the image doesn't contain a math problem, tell the user."
-                }
-            ]
-            response = model.invoke([HumanMessage(content=content)])
-            summary_response = response.content
-
-            input_tokens = response.usage_metadata.get("input_tokens", 0)
-            output_tokens = response.usage_metadata.get("output_tokens", 0)
-            cost_summary = (input_tokens * PRICING[model_name]["input"]) + (output_tokens * PRICING[model_name]["output"])
-            st.session_state.COST += cost_summary
-
-            refine_prompt = ChatPromptTemplate.from_template(
-                """
+        pipeline = VisionPipeline([PRIMARY_MODEL, Images_MODEL], refine_prompt=ChatPromptTemplate.from_template(
+            """
                 {existing_answer}
                 Provide a final, refined answer to the math problem (if any).
-                """
-            )
-            chain = refine_prompt | model
-            final_response = chain.invoke({"existing_answer": summary_response})
-            input_tokens2 = final_response.usage_metadata.get("input_tokens", 0)
-            output_tokens2 = final_response.usage_metadata.get("output_tokens", 0)
-            cost_refine = (
-                input_tokens2 * PRICING[model_name]["input"]
-                + output_tokens2 * PRICING[model_name]["output"]
+            """
+        ))
+        try:
+            answer = pipeline.answer(
+                image_url,
+                "You are a math tutor. Interpret any math problem in this image and solve it step by step.",
+                f"Level: {st.session_state.education_level}. If the image doesn't contain a math problem, tell the user.",
+                refine=self.refine_image_answers
             )
-            st.session_state.COST += cost_refine
-
-            print(f"**Model used:** {used_model}")
-            print(f"**Cost so far:** ${st.session_state.COST}")
-            st.session_state.COST = 0
-            return final_response.content
-
         except Exception as e:
-            st.error(f"Primary model failed mid-query: {e}. Switching to fallback...")
-
-            # Fallback
-            fallback_model_name = Images_MODEL["model_name"]
-            fallback_model = ChatAnthropic(
-                model=fallback_model_name,
-                temperature=Images_MODEL["temperature"]
-            )
-            fallback_response = fallback_model.invoke([HumanMessage(content=[
-                {
-                    "type": "text",
-                    "text": "You are a math tutor. Interpret any math problem in this image and solve it step by step."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image_str}"}
-                }
-            ])])
-
-            input_tokens_f = fallback_response.usage_metadata.get("input_tokens", 0)
-            output_tokens_f = fallback_response.usage_metadata.get("output_tokens", 0)
-            cost_fallback = (
-                input_tokens_f * PRICING[fallback_model_name]["input"]
-                + output_tokens_f * PRICING[fallback_model_name]["output"]
-            )
-            st.session_state.COST += cost_fallback
+            st.error(f"Image query failed: {e}")
+            return ""
+        finally:
+            st.session_state.COST += pipeline.cost
+            print(f"**Model used:** {', '.join(pipeline.used_models)}")
             print(f"**Cost so far:** ${st.session_state.COST}")
             st.session_state.COST = 0
-            return fallback_response.content
+        return answer
 
 def main():
     model_manager = ModelManager(PRIMARY_MODEL, SECONDARY_MODEL)
@@ -94,20 +94,23 @@ class QuizGenerator(BaseApp):
         """)
 
     def handle_input(self):
-        content_info = []
-        if st.session_state.user_info["topic"]:
-            content_info.append(f"Quiz Topic: {st.session_state.user_info['topic']}")
-        if st.session_state.document_content:
-            content_info.append(f"Study Material Content:\n{st.session_state.document_content}")
-        
+        prompt_template = self.generate_prompt()
         inputs = {
             "education_level": st.session_state.user_info["category"],
             "question_types": ", ".join(st.session_state.user_info["question_type"]),
             "num_questions": st.session_state.user_info["num_questions"],
-            "content_info": "\n".join(content_info) if content_info else "General Knowledge",
             "use_case_note": "Include a case study question about the main topic." 
                 if st.session_state.user_info["open_question"] else ""
         }
+
+        content_info = []
+        if st.session_state.user_info["topic"]:
+            content_info.append(f"Quiz Topic: {st.session_state.user_info['topic']}")
+        if st.session_state.document_content:
+            document = self.fit_document(prompt_template, inputs, st.session_state.document_content,
+                                         query=st.session_state.user_info["topic"] or None)
+            content_info.append(f"Study Material Content:\n{document}")
+        inputs["content_info"] = "\n".join(content_info) if content_info else "General Knowledge"
         
         user_content = f"**Quiz Request:**\n"
         user_content += f"- Education Level: {inputs['education_level']}\n"
@@ -121,7 +124,6 @@ class QuizGenerator(BaseApp):
         
         st.session_state.messages.append({"role": "user", "content": user_content})
         
-        prompt_template = self.generate_prompt()
         response, st.session_state.COST = self.model_manager.generate(prompt_template, inputs)
         
         if not response:
@@ -135,16 +137,16 @@ class QuizGenerator(BaseApp):
 
             prompt_template = ChatPromptTemplate.from_template("{messages}")
 
-            response, _ = self.model_manager.generate(
+            response = self.model_manager.stream(
                 prompt_template,
                 {"messages": "\n".join([msg['content'] for msg in st.session_state.messages])}
             )
 
+            response = super().display_ai_response(response)
             if not response:
                 response = "No response from model. Please try again."
 
             st.session_state.messages.append({"role": "assistant", "content": response})
-            super().display_ai_response(response)
 
         
 
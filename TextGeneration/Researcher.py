@@ -1,19 +1,14 @@
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
+from Ingestion import ingest
 import streamlit as st
 from langchain_core.tools import Tool
 from langchain_google_community import GoogleSearchAPIWrapper
-import PyPDF2
-import docx
-import pandas as pd
 from Model_Manager import ModelManager
+from ImagePrep import prepare_image
+from VisionPipeline import VisionPipeline, cached_summary
 from Config import PRIMARY_MODEL, SECONDARY_MODEL, Images_MODEL
-from PIL import Image
-import base64
-import io
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 
 class Researcher(BaseApp):
     def __init__(self, model_manager, app_name="The Researcher 🔬📚", app_slogan="Your AI-Powered Research Assistant! 🤖✨"):
@@ -37,106 +32,37 @@ class Researcher(BaseApp):
             st.session_state.research_papers = False
 
     def extract_text_from_pdf(self, pdf_file):
-        """Extracts text from a PDF file."""
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+        """Extracts text from a PDF file (cached by content, see Ingestion.py)."""
+        return ingest(pdf_file, "pdf").text
 
     def extract_text_from_docx(self, docx_file):
-        """Extracts text from a DOCX file."""
-        doc = docx.Document(docx_file)
-        full_text = []
-        for para in doc.paragraphs:
-            full_text.append(para.text)
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    full_text.append(cell.text)
-        return "\n".join(full_text)
+        """Extracts text from a DOCX file (cached by content, see Ingestion.py)."""
+        return ingest(docx_file, "docx").text
 
     def encode_image(self, image_file):
-        """Encodes an image as a base64 string."""
-        img = Image.open(image_file).convert("RGB").resize((1024, 1024))
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG", quality=75)
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-    def handle_image_query(self, user_input, image_content):
-        """Handles image-based queries using GPT-4o-mini (fallback: Claude 3.5 Sonnet) and tracks cost."""
-        from Model_Manager import PRICING  # Import pricing dictionary
-
-        try:
-            model_name = PRIMARY_MODEL["model_name"]
-            model = ChatOpenAI(model=model_name, temperature=PRIMARY_MODEL["temperature"])
-            used_model = "GPT-4o-mini (Primary)"
-        except Exception as e:
-            print(f"Primary Model Failed: {e}... Switching to Claude 3.5 Sonnet")
-            model_name = Images_MODEL["model_name"]
-            model = ChatAnthropic(model=model_name, temperature=Images_MODEL["temperature"])
-            used_model = "Claude 3.5 Sonnet (Fallback)"
-
-        content = [
-            {"type": "text", "text": "Summarize this image before answering the query."},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_content}" }},
-            {"type": "text", "text": user_input}
-        ]
-
+        """Encodes an image as a data URL for passing to the model (resized and encoded once per image)."""
+        return prepare_image(image_file).data_url
+
+    def handle_image_query(self, user_input, image_url):
+        """
+        Answers a question about the uploaded image using GPT-4o-mini (fallback: Claude 3.5 Sonnet) and tracks cost.
+        The first question is answered with the image itself; follow-up questions are answered from a
+        description of it, written once on the first follow-up, without resending the image.
+        """
+        pipeline = VisionPipeline([PRIMARY_MODEL, Images_MODEL])
         try:
-            response = model.invoke([HumanMessage(content=content)])
-            summary_response = response.content
-            st.session_state.image_summary = summary_response
-
-            input_tokens = response.usage_metadata.get("input_tokens", 0)
-            output_tokens = response.usage_metadata.get("output_tokens", 0)
-
-            cost_summary = (input_tokens * PRICING[model_name]["input"]) + \
-                        (output_tokens * PRICING[model_name]["output"])
-            st.session_state.COST += cost_summary
-
-            query_prompt = ChatPromptTemplate.from_template("""
-                {summary}
-                Answer the following query in details if needed (don't state that you are summarizing but rather you know the info): {query}
-            """)
-
-            chain = query_prompt | model
-            final_response = chain.invoke({"summary": summary_response, "query": user_input})
-
-            input_tokens = final_response.usage_metadata.get("input_tokens", 0)
-            output_tokens = final_response.usage_metadata.get("output_tokens", 0)
-
-            cost_query = (input_tokens * PRICING[model_name]["input"]) + \
-                        (output_tokens * PRICING[model_name]["output"])
-            st.session_state.COST += cost_query
-
-            print(f"### 🔍 Model Used: `{used_model}`")
+            response = pipeline.ask(
+                image_url,
+                user_input,
+                "Answer the following query in details if needed, using the image."
+            )
+            st.session_state.image_summary = cached_summary(image_url)
+            return response
+        finally:
+            st.session_state.COST += pipeline.cost
+            print(f"### 🔍 Models Used: `{', '.join(pipeline.used_models)}`")
             print(f"💰 **Total Cost:** ${st.session_state.COST:.6f}")
-
-            print(model_name)
-            print(st.session_state.COST)
-            st.session_state.COST = 0 
-
-            return final_response.content
-
-        except Exception as e:
-            print(f"Primary model failed: {e}. Switching to Claude 3.5 Sonnet...")
-            secondary_model = ChatAnthropic(model=Images_MODEL["model_name"], temperature=Images_MODEL["temperature"])
-            used_model = "Claude 3.5 Sonnet (Fallback)"
-
-            fallback_response = secondary_model.invoke([HumanMessage(content=content)])
-
-            input_tokens = fallback_response.usage_metadata.get("input_tokens", 0)
-            output_tokens = fallback_response.usage_metadata.get("output_tokens", 0)
-
-            cost_fallback = (input_tokens * PRICING[Images_MODEL["model_name"]]["input"]) + \
-                            (output_tokens * PRICING[Images_MODEL["model_name"]]["output"])
-            st.session_state.COST += cost_fallback
-
-            
-            print(st.session_state.COST)
-            st.session_state.COST = 0  
-
-            return fallback_response.content
-
-
+            st.session_state.COST = 0
 
     def generate_prompt(self):
         """Creates a structured research prompt."""
@@ -172,8 +98,7 @@ class Researcher(BaseApp):
                 elif file_type == "docx":
                     content = self.extract_text_from_docx(uploaded_file)
                 elif file_type == "csv":
-                    df = pd.read_csv(uploaded_file, encoding="latin1")
-                    content = df.to_string()
+                    content = ingest(uploaded_file, "csv").text
 
                 st.session_state.uploaded_doc = {"type": file_type, "name": uploaded_file.name, "content": content}
 
@@ -198,20 +123,23 @@ class Researcher(BaseApp):
                     final_response = f"Error processing image: {str(e)}"
             else:
                 prompt_template = self.generate_prompt()
-                response, st.session_state.COST = self.model_manager.generate(
-                    prompt_template,
-                    {
-                        "web_results": "Web search disabled",
-                        "uploaded_doc": st.session_state.uploaded_doc["content"] if st.session_state.uploaded_doc else "None",
-                        "user_input": user_input,
-                        "research_papers": st.session_state.research_papers
-                    }
-                )
-                print(st.session_state.COST)
-                final_response = response
+                inputs = {
+                    "web_results": "Web search disabled",
+                    "user_input": user_input,
+                    "research_papers": st.session_state.research_papers
+                }
+                if st.session_state.uploaded_doc:
+                    inputs["uploaded_doc"] = self.fit_document(
+                        prompt_template, inputs, st.session_state.uploaded_doc["content"], query=user_input
+                    )
+                else:
+                    inputs["uploaded_doc"] = "None"
+                final_response = self.model_manager.stream(prompt_template, inputs)
 
             super().display_ai_response(final_response)
-            st.session_state.chat_history.append(AIMessage(content=final_response))
+            if not isinstance(final_response, str):
+                st.session_state.COST = final_response.cost
+                print(st.session_state.COST)
 
 def main():
     model_manager = ModelManager(PRIMARY_MODEL, SECONDARY_MODEL)
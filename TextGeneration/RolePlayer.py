@@ -73,18 +73,15 @@ class RolePlayer(BaseApp):
             with st.chat_message("Student", avatar="😀"):
                 st.markdown(user_input)
 
-            latest_document = document_content
             prompt_template = self.generate_prompt()
-            
-            response = self.model_manager.generate(
-                prompt_template,
-                {
+            inputs = {
                 "role": st.session_state.user_choice["role"],
-                "chat_history": st.session_state.chat_history, 
-                "documents": latest_document,
+                "chat_history": st.session_state.chat_history,
                 "user_question": user_input
-                }
-            )   
+            }
+            inputs["documents"] = self.fit_document(prompt_template, inputs, document_content, query=user_input) if document_content else document_content
+
+            response = self.model_manager.stream(prompt_template, inputs)
                      
             super().display_ai_response(response)
 
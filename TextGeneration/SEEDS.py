@@ -1,6 +1,7 @@
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
+from HistoryManager import HistoryManager
 import streamlit as st
 from Model_Manager import ModelManager
 from Config import PRIMARY_MODEL, SECONDARY_MODEL
@@ -23,6 +24,7 @@ class SEEDS(BaseApp):
         super().__init__(app_name)
         self.app_slogan = app_slogan
         self.model_manager = model_manager 
+        self.history = HistoryManager(model_manager)
 
     def process_input(self, user_input):
         chain_input = {
@@ -93,16 +95,14 @@ class SEEDS(BaseApp):
             
             prompt_template = self.generate_prompt()
 
-            response = self.model_manager.generate(
+            response = self.model_manager.stream(
                 prompt_template,
                 {
                     "user_question":  user_input,
-                    "chat_history": st.session_state.chat_history
+                    "chat_history": self.history.context(st.session_state.chat_history)
                 }
             )
 
-            st.session_state.chat_history.append(AIMessage(response))
-            
             super().display_ai_response(response)
             return user_input
 
@@ -0,0 +1,119 @@
+import asyncio
+
+
+class _Flight:
+    """One in-flight call and the callers waiting on it."""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """One in-flight stream whose chunks are replayed to every subscriber, late joiners included."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.changed = asyncio.Condition()
+
+    async def pump(self, source):
+        try:
+            async for text in source:
+                self.chunks.append(text)
+                async with self.changed:
+                    self.changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def subscribe(self):
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.chunks) > index or self.done)
+
+
+class SingleFlight:
+    """
+    Lets concurrent identical requests share one in-flight model call.
+
+    The first caller for a key (the leader) starts the call; callers arriving while
+    it runs are coalesced onto it and receive the same result. The call is only
+    cancelled once every caller waiting on it has gone away. Must only be used from
+    the shared event loop thread.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._streams = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key, make_call):
+        """Returns (result, is_leader). Only the leader should be charged for the call."""
+        flight = self._flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            self.leaders += 1
+            flight = _Flight(asyncio.ensure_future(make_call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), is_leader
+        except asyncio.CancelledError:
+            if flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def stream(self, key, make_stream):
+        """Yields the text chunks of a stream shared by every caller with the same key."""
+        flight = self._streams.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = _StreamFlight()
+            flight.task = asyncio.ensure_future(flight.pump(make_stream()))
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._streams, key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        try:
+            async for text in flight.subscribe():
+                yield text
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    @staticmethod
+    def _forget(flights, key, flight):
+        if flights.get(key) is flight:
+            del flights[key]
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights) + len(self._streams),
+        }
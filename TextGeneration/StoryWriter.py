@@ -74,7 +74,7 @@ class StoryWriter(BaseApp):
                 st.markdown(user_input)
                 st.session_state.chat_history.append(user_input)
 
-            response, st.session_state.COST = self.model_manager.generate(
+            response = self.model_manager.stream(
                 prompt_template, 
                 {
                     "main_character": main_character,
@@ -85,8 +85,9 @@ class StoryWriter(BaseApp):
                     "chat_history": st.session_state.chat_history
             }
         )
-            print(st.session_state.COST)
             super().display_ai_response(response)
+            st.session_state.COST = response.cost
+            print(st.session_state.COST)
         return user_input
 
 def main():
@@ -82,7 +82,7 @@ class StudyBuddy(BaseApp):
 
             prompt_template = self.generate_prompt()
             
-            response, st.session_state.COST = self.model_manager.generate(
+            response = self.model_manager.stream(
                 prompt_template,
                 {
                 "category": st.session_state.user_info["category"],
@@ -91,8 +91,9 @@ class StudyBuddy(BaseApp):
                 "user_question": user_input
                 }
             )   
-            print(st.session_state.COST)
             super().display_ai_response(response)
+            st.session_state.COST = response.cost
+            print(st.session_state.COST)
 
         return user_input
     
@@ -1,7 +1,7 @@
 import streamlit as st
 from BaseApp import BaseApp
-import PyPDF2
-import docx
+from Ingestion import ingest
+from HistoryManager import HistoryManager
 from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
@@ -16,25 +16,19 @@ class Summarizer(BaseApp):
         super().__init__(app_name)
         self.app_slogan = app_slogan
         self.model_manager = model_manager 
+        self.history = HistoryManager(model_manager)
 
     
     def welcome_screen(self, app_slogan):
         super().welcome_screen(app_slogan)
 
     def extract_text_from_pdf(self, file) -> str:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text_content = []
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text_content.append(page.extract_text())
-        return "\n".join(text_content)
+        """Extracts text from a PDF file (cached by content, see Ingestion.py)."""
+        return ingest(file, "pdf").text
 
     def extract_text_from_docx(self, file) -> str:
-        doc_obj = docx.Document(file)
-        full_text = []
-        for para in doc_obj.paragraphs:
-            full_text.append(para.text)
-        return "\n".join(full_text)
+        """Extracts text from a DOCX file (cached by content, see Ingestion.py)."""
+        return ingest(file, "docx").text
     
     def count_words(self, text: str) -> int:
         try:
@@ -96,11 +90,11 @@ class Summarizer(BaseApp):
 
             prompt_template = self.generate_prompt()
 
-            response = self.model_manager.generate(
+            response = self.model_manager.stream(
                 prompt_template,
                 {
                     "user_text": extracted_text,
-                    "chat_history": st.session_state.chat_history,
+                    "chat_history": self.history.context(st.session_state.chat_history),
                     "summary_size": st.session_state.summary_size
                 }
             )
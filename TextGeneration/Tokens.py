@@ -0,0 +1,73 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoders = {}
+_encoders_lock = Lock()
+
+# Recent counts keyed by a digest of the text, so the cache never keeps documents or prompts alive
+MAX_CACHED_COUNTS = 4096
+_counts = OrderedDict()
+_counts_lock = Lock()
+
+
+def get_encoder(model_name="gpt-4o-mini"):
+    """
+    Returns the tiktoken encoder for a model, loading it once per process.
+    Models tiktoken does not know (e.g. Claude) use o200k_base, which is close enough for budgeting.
+    Returns None if tiktoken is not installed.
+    """
+    if tiktoken is None:
+        return None
+    with _encoders_lock:
+        encoder = _encoders.get(model_name)
+        if encoder is None:
+            try:
+                encoder = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                encoder = tiktoken.get_encoding("o200k_base")
+            _encoders[model_name] = encoder
+        return encoder
+
+
+def count_tokens(text, model_name="gpt-4o-mini"):
+    """Exact token count of a string for a model (about 4 characters per token without tiktoken)."""
+    encoder = get_encoder(model_name)
+    if encoder is None:
+        return (len(text) + 3) // 4
+
+    key = (hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(), model_name)
+    with _counts_lock:
+        count = _counts.get(key)
+        if count is not None:
+            _counts.move_to_end(key)
+            return count
+    count = len(encoder.encode(text, disallowed_special=()))
+    with _counts_lock:
+        _counts[key] = count
+        while len(_counts) > MAX_CACHED_COUNTS:
+            _counts.popitem(last=False)
+    return count
+
+
+def clear_token_counts():
+    with _counts_lock:
+        _counts.clear()
+
+
+def truncate_tokens(text, max_tokens, model_name="gpt-4o-mini"):
+    """Cuts a string down to at most `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoder = get_encoder(model_name)
+    if encoder is None:
+        return text[:max_tokens * 4]
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens])
@@ -1,11 +1,9 @@
 import streamlit as st
 from openai import OpenAI
-import PyPDF2
-import docx
 import streamlit as st
 from BaseApp import BaseApp
-import PyPDF2
-import docx
+from Ingestion import ingest
+from HistoryManager import HistoryManager
 from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from BaseApp import BaseApp
@@ -24,6 +22,7 @@ class Translator(BaseApp):
         super().__init__(app_name)
         self.app_slogan = app_slogan 
         self.model_manager = model_manager 
+        self.history = HistoryManager(model_manager)
         self.tokens = {
             "input_tokens": 0,
             "response_tokens":0,
@@ -36,21 +35,12 @@ class Translator(BaseApp):
     
 
     def extract_text_from_pdf(self, file) -> str:
-        """Extracts all text from a PDF file object using PyPDF2."""
-        pdf_reader = PyPDF2.PdfReader(file)
-        text_content = []
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text_content.append(page.extract_text())
-        return "\n".join(text_content)
+        """Extracts text from a PDF file (cached by content, see Ingestion.py)."""
+        return ingest(file, "pdf").text
 
     def extract_text_from_docx(self,file) -> str:
-        """Extracts all text from a DOCX file object using python-docx."""
-        doc = docx.Document(file)
-        full_text = []
-        for para in doc.paragraphs:
-            full_text.append(para.text)
-        return "\n".join(full_text)
+        """Extracts text from a DOCX file (cached by content, see Ingestion.py)."""
+        return ingest(file, "docx").text
 
     def count_words(self, text: str) -> int:
         try:
@@ -111,16 +101,17 @@ class Translator(BaseApp):
             
             prompt_template = self.generate_prompt()
 
-            response, st.session_state.COST = self.model_manager.generate(
+            response = self.model_manager.stream(
                 prompt_template, 
                 {
                     "user_text": extracted_text,
-                    "chat_history": st.session_state.chat_history,
+                    "chat_history": self.history.context(st.session_state.chat_history),
                     "chosen_language": selected_language
                 }
             )
-            print(st.session_state.COST)
             super().display_ai_response(response)
+            st.session_state.COST = response.cost
+            print(st.session_state.COST)
             return extracted_text
 
 def main():
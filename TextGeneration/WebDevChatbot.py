@@ -1,6 +1,6 @@
 from BaseApp import BaseApp
 import streamlit as st
-from Model_Manager import ModelManager
+from Model_Manager import ModelManager, charge
 import asyncio
 import openai
 from anthropic import Anthropic
@@ -74,10 +74,12 @@ class WebDevChatbot(BaseApp):
             self.tokens["input_tokens"] = message.usage.input_tokens
             self.tokens["response_tokens"] = message.usage.output_tokens
             self.tokens["total_tokens_per_prompt"] = self.tokens["input_tokens"] + self.tokens["response_tokens"] 
-            input_cost = self.tokens["input_tokens"] * (0.25 / 1000000)
-            output_cost = self.tokens["response_tokens"] * (1.25 / 1000000)
-            st.session_state.COST = input_cost + output_cost
-            print(f"Claude Haiku 3\nInput: {self.tokens["input_tokens"]} | Output: {self.tokens["response_tokens"]} | Total: {self.tokens["total_tokens_per_prompt"]}")
+            st.session_state.COST = charge(
+                "claude-3-5-haiku-20241022",
+                {"input_tokens": self.tokens["input_tokens"], "output_tokens": self.tokens["response_tokens"]},
+                provider="Claude"
+            )
+            print(f"Claude 3.5 Haiku\nInput: {self.tokens["input_tokens"]} | Output: {self.tokens["response_tokens"]} | Total: {self.tokens["total_tokens_per_prompt"]}")
             print(st.session_state.COST)
             return message.content[0].text
 
@@ -143,9 +145,11 @@ class WebDevChatbot(BaseApp):
             self.tokens["input_tokens"] = run.usage.prompt_tokens
             self.tokens["response_tokens"] = run.usage.completion_tokens
             self.tokens["total_tokens_per_prompt"] = run.usage.total_tokens
-            input_cost = self.tokens["input_tokens"] * (0.150 / 1000000)
-            output_cost = self.tokens["response_tokens"] * (0.600 / 1000000)
-            st.session_state.COST = input_cost + output_cost
+            st.session_state.COST = charge(
+                "gpt-4o-mini",
+                {"input_tokens": self.tokens["input_tokens"], "output_tokens": self.tokens["response_tokens"]},
+                provider="OpenAI"
+            )
             print(f"GPT-4o-Mini\nInput Tokens {self.tokens["input_tokens"]} | Response Tokens {self.tokens["response_tokens"]} | Total Tokens {self.tokens["total_tokens_per_prompt"]}")
             print(st.session_state.COST)
         except Exception as e:
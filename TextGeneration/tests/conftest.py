@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The apps import their shared modules as siblings (`from Ingestion import ...`)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# Keep test calls out of the real usage ledger
+os.environ.setdefault("USAGE_LEDGER_PATH", os.path.join(tempfile.mkdtemp(), "usage.db"))
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    """Token counts use the ~4 characters per token fallback, so tests never download a tiktoken encoding."""
+    import Tokens
+    monkeypatch.setattr(Tokens, "tiktoken", None)
+    Tokens.clear_token_counts()
+    yield
+    Tokens.clear_token_counts()
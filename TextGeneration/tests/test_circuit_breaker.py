@@ -0,0 +1,61 @@
+import time
+from CircuitBreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, circuit_breaker_states, get_circuit_breaker
+
+
+def test_opens_once_error_rate_crosses_threshold():
+    breaker = CircuitBreaker("test", min_calls=4, failure_threshold=0.5)
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # below min_calls
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()  # only one probe at a time
+
+    breaker.record_success(0.2)
+    assert breaker.state == CLOSED
+    # Failures from before the recovery no longer count
+    assert breaker.snapshot()["failures"] == 0
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0)
+    breaker.record_failure()
+    breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_release_frees_the_probe_without_a_verdict():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0)
+    breaker.record_failure()
+    breaker.allow_request()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_latency_percentile_uses_successful_calls_only():
+    breaker = CircuitBreaker("test")
+    assert breaker.latency_percentile(95) is None
+    for latency in (1, 2, 3, 4):
+        breaker.record_success(latency)
+    breaker.record_failure(100)
+    assert breaker.latency_percentile(50) == 2
+    assert breaker.latency_percentile(95) == 4
+
+
+def test_breakers_are_shared_per_provider_and_model():
+    config = {"provider": "OpenAI", "model_name": f"test-{time.time()}"}
+    assert get_circuit_breaker(config) is get_circuit_breaker(dict(config))
+    assert f"OpenAI:{config['model_name']}" in circuit_breaker_states()
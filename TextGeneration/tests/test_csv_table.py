@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import CsvTable as CsvTable_module
+from CsvTable import CsvTable, load_table, register_table, table_for
+from Ingestion import ingest
+
+
+def grades_csv(rows):
+    lines = ["student,subject,score"]
+    lines += [f"student{n},{'math' if n % 2 else 'history'},{50 + n % 50}" for n in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def test_small_table_is_inlined_whole():
+    table = CsvTable(grades_csv(30))
+    text = table.context("math scores")
+    for n in range(30):
+        assert f"student{n} " in text
+    assert "Rows matching the request" not in text
+
+
+def test_large_table_falls_back_to_profile_and_matching_rows():
+    table = CsvTable(grades_csv(5000), chunk_rows=700)
+    assert table.inline(max_tokens=500) is None
+    text = table.context("student4321", max_tokens=500)
+    assert text.startswith(table.describe())
+    assert "Rows matching the request:" in text
+    assert "student4321" in text
+
+
+def test_search_returns_best_matches_across_chunks():
+    table = CsvTable(grades_csv(100), chunk_rows=7)
+    rows = table.search("student42 student97", k=2).splitlines()
+    assert len(rows) == 3  # header and the two rows
+    assert rows[1].split()[0] == "student42"
+    assert rows[2].split()[0] == "student97"
+    assert table.search("chemistry") == ""
+
+
+def test_ingested_csv_is_the_whole_table_and_stays_searchable():
+    data = grades_csv(30)
+    upload = SimpleNamespace(name="grades.csv", getvalue=lambda: data)
+    document = ingest(upload, "csv")
+    for n in range(30):
+        assert f"student{n} " in document.text
+    assert table_for(document.text).search("student7") != ""
+
+
+def test_registry_holds_max_tables_tables_not_keys(monkeypatch):
+    monkeypatch.setattr(CsvTable_module, "MAX_TABLES", 3)
+    CsvTable_module._tables.clear()
+    CsvTable_module._aliases.clear()
+    texts = []
+    for n in range(4):
+        table = load_table(grades_csv(n + 1))
+        texts.append(f"table {n}")
+        register_table(texts[-1], table)
+    # The oldest table and its text are gone together; the three newest are all still found
+    assert table_for(texts[0]) is None
+    assert all(table_for(text) is not None for text in texts[1:])
+    assert len(CsvTable_module._tables) == 3
+    assert len(CsvTable_module._aliases) == 3
@@ -0,0 +1,66 @@
+from io import BytesIO
+
+import docx
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+from DocxReader import iter_docx_blocks
+
+
+def docx_bytes(document):
+    buffer = BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def blocks(document):
+    return [(block.kind, block.text) for block in iter_docx_blocks(docx_bytes(document))]
+
+
+def test_headings_paragraphs_and_style_numbered_lists():
+    document = docx.Document()
+    document.add_heading("Fractions", level=1)
+    document.add_paragraph("Work through each step.")
+    for step in ("Find a common denominator", "Add the numerators", "Simplify"):
+        document.add_paragraph(step, style="List Number")
+    document.add_paragraph("Show your working", style="List Bullet")
+    assert blocks(document) == [
+        ("heading", "Fractions"),
+        ("paragraph", "Work through each step."),
+        ("list", "1. Find a common denominator"),
+        ("list", "2. Add the numerators"),
+        ("list", "3. Simplify"),
+        ("list", "- Show your working"),
+    ]
+
+
+def test_nested_table_is_emitted_once_inside_its_cell():
+    document = docx.Document()
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "Term"
+    table.cell(0, 1).text = "Meaning"
+    table.cell(1, 0).text = "Ratio"
+    inner = table.cell(1, 1).add_table(rows=1, cols=2)
+    inner.cell(0, 0).text = "3:4"
+    inner.cell(0, 1).text = "three to four"
+    assert blocks(document) == [("table", "Term | Meaning\nRatio | 3:4 three to four")]
+
+
+def test_content_controls_in_the_body_are_read():
+    document = docx.Document()
+    document.add_paragraph("Before")
+    sdt = parse_xml(
+        f"<w:sdt {nsdecls('w')}><w:sdtPr/><w:sdtContent>"
+        "<w:p><w:r><w:t>Student name: Ada</w:t></w:r></w:p>"
+        "<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Score</w:t></w:r></w:p></w:tc>"
+        "<w:tc><w:p><w:r><w:t>9</w:t></w:r></w:p></w:tc></w:tr></w:tbl>"
+        "</w:sdtContent></w:sdt>"
+    )
+    document.element.body.insert(1, sdt)
+    document.add_paragraph("After")
+    assert blocks(document) == [
+        ("paragraph", "Before"),
+        ("paragraph", "Student name: Ada"),
+        ("table", "Score | 9"),
+        ("paragraph", "After"),
+    ]
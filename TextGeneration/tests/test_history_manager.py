@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+import pytest
+import HistoryManager
+from Tokens import count_tokens
+
+
+class FakeModelManager:
+    primary_config = {"model_name": "gpt-4o-mini"}
+
+    def __init__(self):
+        self.summarized = []
+
+    async def agenerate(self, prompt_template, chain_input):
+        self.summarized.append(chain_input["messages"])
+        return "summary", 0
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(HistoryManager, "st", SimpleNamespace(session_state={}))
+    return FakeModelManager()
+
+
+def message(role, words):
+    return {"role": role, "content": " ".join(["word"] * words)}
+
+
+def wait_for_summary(history_manager):
+    state = HistoryManager.st.session_state[history_manager.state_key]
+    if state["pending"] is not None:
+        state["pending"].result(timeout=5)
+
+
+def test_recent_messages_are_kept_verbatim_within_budget(manager):
+    history_manager = HistoryManager.HistoryManager(manager, budget=100)
+    history = [message("user", 5), message("assistant", 5)]
+    assert history_manager.context(history) == "\n".join(HistoryManager.format_message(m) for m in history)
+    assert manager.summarized == []
+
+
+def test_older_messages_are_summarized_once_out_of_the_window(manager):
+    history_manager = HistoryManager.HistoryManager(manager, budget=100)
+    history = [message("user", 60), message("assistant", 60), message("user", 5)]
+    text = history_manager.context(history)
+    wait_for_summary(history_manager)
+
+    assert text.endswith(HistoryManager.format_message(history[-1]))
+    assert count_tokens(text) <= 100
+    assert manager.summarized == [HistoryManager.format_message(history[0])]
+
+    assert history_manager.context(history).startswith("Summary of earlier conversation: summary")
+
+
+def test_latest_message_is_kept_even_when_over_budget(manager):
+    history_manager = HistoryManager.HistoryManager(manager, budget=50)
+    history = [message("user", 10), message("assistant", 10), message("user", 400)]
+    text = history_manager.context(history)
+    wait_for_summary(history_manager)
+
+    assert text.startswith("user: word word")
+    assert count_tokens(text) <= 50
+    # Only the older messages go to summarization, never the current turn
+    assert manager.summarized == ["\n".join(HistoryManager.format_message(m) for m in history[:2])]
+
+
+def test_lines_trimmed_to_fit_are_summarized(manager, monkeypatch):
+    # Joined text costs more than its lines counted one by one, so the final trim has to drop some
+    monkeypatch.setattr(HistoryManager, "count_tokens",
+                        lambda text, model_name="gpt-4o-mini": len(text.split()) + 10 * text.count("\n"))
+    history_manager = HistoryManager.HistoryManager(manager, budget=30)
+    history = [message("user", 5), message("assistant", 5), message("user", 5), message("assistant", 5)]
+    text = history_manager.context(history)
+    wait_for_summary(history_manager)
+
+    assert text == "\n".join(HistoryManager.format_message(m) for m in history[2:])
+    assert manager.summarized == ["\n".join(HistoryManager.format_message(m) for m in history[:2])]
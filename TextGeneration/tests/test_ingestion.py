@@ -0,0 +1,133 @@
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+import Ingestion
+from Ingestion import (
+    IngestionPipeline, chunk_by_tokens, normalize_whitespace, strip_headers_footers, token_splitter
+)
+
+
+def worksheet_pages(count):
+    return [
+        f"Algebra Worksheet\nQuestion {n}\nSolve x + {n} = 10\nAnswer {n}: ____\nPage {n}"
+        for n in range(1, count + 1)
+    ]
+
+
+def test_normalize_whitespace():
+    page = "Some   text\twith  gaps\r\nhyphen-\nated word\n\n\n\nend  "
+    assert list(normalize_whitespace([page])) == ["Some text with gaps\nhyphenated word\n\nend"]
+
+
+def test_strip_headers_footers_drops_exact_repeats_only():
+    pages = list(strip_headers_footers(worksheet_pages(5)))
+    for n, page in enumerate(pages, start=1):
+        # The running title goes; numbered lines differ page to page and all stay
+        assert page == f"Question {n}\nSolve x + {n} = 10\nAnswer {n}: ____\nPage {n}"
+
+
+def test_strip_headers_footers_needs_a_few_pages_to_decide():
+    pages = worksheet_pages(2)
+    assert list(strip_headers_footers(pages)) == pages
+
+
+def test_header_stripping_is_opt_in():
+    assert strip_headers_footers not in IngestionPipeline().page_stages
+
+
+def test_pdf_only_stages_are_skipped_for_other_kinds():
+    seen = []
+
+    def pdf_stage(pages):
+        for page in pages:
+            seen.append(page)
+            yield page
+    pdf_stage.kinds = ("pdf",)
+
+    pipeline = IngestionPipeline(page_stages=(normalize_whitespace, pdf_stage))
+    pages, chunks, stage_seconds = pipeline.run(b"plain  text", "txt")
+    assert pages == ["plain text"]
+    assert chunks == ["plain text"]
+    assert seen == []
+    assert "pdf_stage" not in stage_seconds
+
+
+def test_streamed_chunks_match_splitting_the_whole_text():
+    pages = [f"Paragraph {n}. " + "Lorem ipsum dolor sit amet. " * 40 for n in range(30)]
+    expected = token_splitter().split_text("\n".join(pages))
+    assert list(chunk_by_tokens(iter(pages), window=2000)) == expected
+
+
+def test_chunk_stages_see_every_chunk():
+    seen = []
+
+    def observe(chunks):
+        for chunk in chunks:
+            seen.append(chunk)
+            yield chunk
+
+    _, chunks, _ = IngestionPipeline().with_chunk_stage(observe).run(b"some text", "txt")
+    assert seen == chunks == ["some text"]
+
+
+class SlowPage:
+    def __init__(self, seconds, text="page text"):
+        self.seconds = seconds
+        self.text = text
+
+    def extract_text(self):
+        time.sleep(self.seconds)
+        return self.text
+
+
+def test_a_page_over_the_timeout_comes_back_empty(monkeypatch):
+    monkeypatch.setattr(Ingestion, "PAGE_TIMEOUT", 0.2)
+    reader = SimpleNamespace(pages=[SlowPage(0), SlowPage(5)])
+    started = time.monotonic()
+    assert Ingestion._extract_page(reader, 0) == "page text"
+    assert Ingestion._extract_page(reader, 1) == ""
+    assert time.monotonic() - started < 2
+
+
+class FakeFuture:
+    def __init__(self, outcome, running=True):
+        self.outcome = outcome
+        self._running = running
+        self.timeouts = []
+
+    def result(self, timeout=None):
+        self.timeouts.append(timeout)
+        if isinstance(self.outcome, BaseException):
+            raise self.outcome
+        return self.outcome
+
+    def running(self):
+        return self._running
+
+
+def test_range_deadline_counts_from_submission():
+    future = FakeFuture(["a", "b"])
+    deadline = time.monotonic() - 1  # already spent waiting on earlier ranges
+    assert Ingestion._range_pages(None, future, "doc.pdf", 0, 2, deadline) == ["a", "b"]
+    assert future.timeouts == [0.0]
+
+
+def test_stuck_range_restarts_the_pool_but_a_queued_one_does_not(monkeypatch):
+    recycled = []
+    monkeypatch.setattr(Ingestion, "_recycle_pool", recycled.append)
+    stuck = FakeFuture(FutureTimeoutError(), running=True)
+    queued = FakeFuture(FutureTimeoutError(), running=False)
+    assert Ingestion._range_pages("pool", queued, "doc.pdf", 0, 2, time.monotonic()) == ["", ""]
+    assert recycled == []
+    assert Ingestion._range_pages("pool", stuck, "doc.pdf", 0, 2, time.monotonic()) == ["", ""]
+    assert recycled == ["pool"]
+
+
+def test_range_on_a_retired_pool_is_run_again_on_the_new_one(monkeypatch):
+    submitted = []
+    new_pool = SimpleNamespace(submit=lambda fn, *args: submitted.append(args) or FakeFuture(["x", "y"]))
+    monkeypatch.setattr(Ingestion, "_get_pool", lambda: new_pool)
+    broken = FakeFuture(BrokenProcessPool())
+    assert Ingestion._range_pages("old", broken, "doc.pdf", 16, 18, time.monotonic() + 5) == ["x", "y"]
+    assert submitted == [("doc.pdf", 16, 18)]
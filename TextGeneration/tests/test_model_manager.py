@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+import Model_Manager
+from ResponseCache import ResponseCache, request_key
+
+PRIMARY = {"provider": "OpenAI", "model_name": "gpt-4o-mini", "temperature": 0}
+SECONDARY = {"provider": "Claude", "model_name": "claude-3-haiku-20240307", "temperature": 0}
+PROMPT = ChatPromptTemplate.from_template("Say {word}")
+
+
+def fake_model(reply, delay):
+    async def respond(_):
+        await asyncio.sleep(delay)
+        return AIMessage(reply, usage_metadata={"input_tokens": 5, "output_tokens": 2, "total_tokens": 7})
+    return RunnableLambda(lambda _: None, afunc=respond)
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    entries = []
+    monkeypatch.setattr(Model_Manager, "record_usage", lambda model, cost, **usage: entries.append((model, usage)) or cost)
+    return entries
+
+
+def make_manager(monkeypatch, primary_delay, secondary_delay, **kwargs):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    models = {
+        "gpt-4o-mini": fake_model("from primary", primary_delay),
+        "claude-3-haiku-20240307": fake_model("from secondary", secondary_delay),
+    }
+    monkeypatch.setattr(Model_Manager, "get_chat_model", lambda config: models[config["model_name"]])
+    manager = Model_Manager.AsyncModelManager(PRIMARY, SECONDARY, **kwargs)
+    manager.hedge_default_delay = 0.05
+    return manager
+
+
+def test_hedging_is_off_by_default(monkeypatch):
+    assert make_manager(monkeypatch, 0, 0).hedge is False
+
+
+def test_hedge_loser_is_charged_for_its_prompt(monkeypatch, ledger):
+    manager = make_manager(monkeypatch, primary_delay=1.0, secondary_delay=0, hedge=True)
+    content, _ = asyncio.run(manager.agenerate(PROMPT, {"word": "hi"}, use_cache=False))
+
+    assert content == "from secondary"
+    charged = dict(ledger)
+    assert charged["claude-3-haiku-20240307"]["output_tokens"] == 2
+    assert charged["gpt-4o-mini"]["input_tokens"] > 0
+    assert charged["gpt-4o-mini"]["output_tokens"] == 0
+
+
+def test_timed_out_primary_is_charged_for_its_prompt(monkeypatch, ledger):
+    manager = make_manager(monkeypatch, primary_delay=1.0, secondary_delay=0)
+    manager.primary_timeout = 0.05
+    content, _ = asyncio.run(manager.agenerate(PROMPT, {"word": "hi"}, use_cache=False))
+
+    assert content == "from secondary"
+    charged = dict(ledger)
+    assert charged["gpt-4o-mini"]["input_tokens"] > 0
+    assert charged["gpt-4o-mini"]["output_tokens"] == 0
+
+
+def test_cached_answer_is_keyed_by_the_model_that_gave_it(monkeypatch, ledger):
+    cache = ResponseCache()
+    manager = make_manager(monkeypatch, primary_delay=1.0, secondary_delay=0, hedge=True, cache=cache)
+    asyncio.run(manager.agenerate(PROMPT, {"word": "hi"}))
+
+    assert cache.get(request_key(PROMPT, {"word": "hi"}, PRIMARY)) is None
+    assert cache.get(request_key(PROMPT, {"word": "hi"}, SECONDARY)) == "from secondary"
+
+    # A repeat is still served from the cache
+    content, cost = asyncio.run(manager.agenerate(PROMPT, {"word": "hi"}))
+    assert (content, cost) == ("from secondary", 0)
+
+
+def test_charge_prices_from_the_shared_table(ledger):
+    usage = {"input_tokens": 1000000, "output_tokens": 1000000}
+    assert Model_Manager.charge("claude-3-5-haiku-20241022", usage, provider="Claude") == pytest.approx(4.80)
+    assert ledger[-1] == ("claude-3-5-haiku-20241022", {
+        "provider": "Claude", "input_tokens": 1000000, "output_tokens": 1000000, "latency": None
+    })
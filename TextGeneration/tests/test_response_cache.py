@@ -0,0 +1,43 @@
+from langchain_core.prompts import ChatPromptTemplate
+from ResponseCache import ResponseCache, request_key
+
+CONFIG = {"model_name": "gpt-4o-mini", "temperature": 0}
+
+
+def test_request_key_depends_on_prompt_model_and_temperature():
+    prompt = ChatPromptTemplate.from_template("Explain {topic}")
+    key = request_key(prompt, {"topic": "tides"}, CONFIG)
+    assert key == request_key(prompt, {"topic": "tides"}, dict(CONFIG))
+    assert key != request_key(prompt, {"topic": "waves"}, CONFIG)
+    assert key != request_key(prompt, {"topic": "tides"}, {**CONFIG, "model_name": "other"})
+    assert key != request_key(prompt, {"topic": "tides"}, {**CONFIG, "temperature": 0.5})
+
+
+def test_request_key_is_none_when_prompt_cannot_render():
+    prompt = ChatPromptTemplate.from_template("Explain {topic}")
+    assert request_key(prompt, {}, CONFIG) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "b" is now the least recently used
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=-1)
+    cache.set("a", "1")
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "responses.db")
+    ResponseCache(db_path=path).set("a", "persisted")
+    cache = ResponseCache(db_path=path)
+    assert cache.get("a") == "persisted"
+    assert cache.stats()["disk_hits"] == 1
@@ -0,0 +1,59 @@
+import asyncio
+from SingleFlight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flights.run("key", call) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert [result for result, _ in results] == ["answer"] * 3
+    assert [is_leader for _, is_leader in results].count(True) == 1
+    assert flights.stats() == {"leaders": 1, "coalesced": 2, "in_flight": 0}
+
+
+def test_call_survives_while_another_caller_waits():
+    flights = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        first = asyncio.ensure_future(flights.run("key", call))
+        second = asyncio.ensure_future(flights.run("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == ("answer", False)
+
+
+def test_streams_replay_chunks_to_late_joiners():
+    flights = SingleFlight()
+
+    async def make_stream():
+        for text in ("a", "b", "c"):
+            await asyncio.sleep(0.005)
+            yield text
+
+    async def read():
+        return "".join([text async for text in flights.stream("key", make_stream)])
+
+    async def main():
+        first = asyncio.ensure_future(read())
+        await asyncio.sleep(0.007)  # join after the first chunk
+        second = asyncio.ensure_future(read())
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(main()) == ["abc", "abc"]
+    assert flights.stats()["coalesced"] == 1
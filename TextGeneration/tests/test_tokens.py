@@ -0,0 +1,29 @@
+import Tokens
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.calls += 1
+        return text.split()
+
+
+def test_counts_are_cached_by_digest_not_by_text(monkeypatch):
+    encoder = FakeEncoder()
+    monkeypatch.setattr(Tokens, "get_encoder", lambda model_name="gpt-4o-mini": encoder)
+    document = "word " * 1000
+    assert Tokens.count_tokens(document) == 1000
+    assert Tokens.count_tokens(document) == 1000
+    assert encoder.calls == 1
+    # Only fixed-size digests are held, never the counted strings
+    assert all(isinstance(key[0], bytes) and len(key[0]) == 16 for key in Tokens._counts)
+
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(Tokens, "get_encoder", lambda model_name="gpt-4o-mini": FakeEncoder())
+    monkeypatch.setattr(Tokens, "MAX_CACHED_COUNTS", 3)
+    for n in range(5):
+        Tokens.count_tokens(f"text {n}")
+    assert len(Tokens._counts) == 3
@@ -0,0 +1,58 @@
+import pytest
+from langchain_core.messages import AIMessage
+import VisionPipeline
+from VisionPipeline import SUMMARY_INSTRUCTIONS, cached_summary
+
+IMAGE = "data:image/png;base64,AAAA"
+CONFIGS = [{"provider": "OpenAI", "model_name": "vision"}]
+
+
+class FakeVisionModel:
+    """Records whether each request was a summary, a call with the image, or text only."""
+
+    def __init__(self):
+        self.requests = []
+
+    def invoke(self, messages):
+        content = messages[0].content
+        has_image = isinstance(content, list) and any(part["type"] == "image_url" for part in content)
+        if has_image and content[0]["text"] == SUMMARY_INSTRUCTIONS:
+            self.requests.append("summary")
+            return AIMessage("A bar chart of rainfall by month.")
+        self.requests.append("image" if has_image else "text")
+        return AIMessage("Answer.")
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeVisionModel()
+    monkeypatch.setattr(VisionPipeline, "get_chat_model", lambda config: model)
+    monkeypatch.setattr(VisionPipeline, "charge", lambda model_name, usage, provider, latency: 0.0)
+    VisionPipeline._summaries.clear()
+    VisionPipeline._answered.clear()
+    return model
+
+
+def test_first_question_is_one_call_with_the_image(model):
+    pipeline = VisionPipeline.VisionPipeline(CONFIGS)
+    assert pipeline.ask(IMAGE, "Which month is wettest?") == "Answer."
+    assert model.requests == ["image"]
+    assert cached_summary(IMAGE) is None
+
+
+def test_follow_ups_describe_the_image_once_then_use_text(model):
+    pipeline = VisionPipeline.VisionPipeline(CONFIGS)
+    pipeline.ask(IMAGE, "Which month is wettest?")
+    pipeline.ask(IMAGE, "And the driest?")
+    pipeline.ask(IMAGE, "How much in June?")
+    assert model.requests == ["image", "summary", "text", "text"]
+    assert cached_summary(IMAGE) == "A bar chart of rainfall by month."
+
+
+def test_answer_shares_the_description_with_ask(model):
+    # Apps that call answer() directly (MathHelper, the EducatorTools apps) take the same path
+    pipeline = VisionPipeline.VisionPipeline(CONFIGS)
+    pipeline.answer(IMAGE, "Solve the problem in this image.")
+    pipeline.answer(IMAGE, "Write a quiz about this image.", "Level: Grade 5.")
+    VisionPipeline.VisionPipeline(CONFIGS).ask(IMAGE, "What is shown?")
+    assert model.requests == ["image", "summary", "text", "text"]